@@ -0,0 +1,161 @@
+"""Benchmarks of the construction, build and simulation of networks."""
+
+import os.path as op
+
+import hnn_core
+from hnn_core import read_params, simulate_dipole, Network
+
+param_fnames = ['default.json', 'gamma_L5weak_L2weak.json', 'N20.json']
+
+
+def _read_params(param_fname):
+    hnn_core_root = op.join(op.dirname(hnn_core.__file__), '..')
+    return read_params(op.join(hnn_core_root, 'param', param_fname))
+
+
+class TimeBuild(object):
+    """Time the construction and build of the networks."""
+
+    params = param_fnames
+    param_names = ['param_fname']
+    number = 1
+    repeat = 5
+    timeout = 600
+
+    def setup(self, param_fname):
+        self.net_params = _read_params(param_fname)
+
+    def time_network(self, param_fname):
+        Network(self.net_params)
+
+    def time_build(self, param_fname):
+        with Network(self.net_params) as net:
+            net.build()
+
+
+class TimeSimulate(object):
+    """Time the simulation of one trial of the networks."""
+
+    params = param_fnames
+    param_names = ['param_fname']
+    number = 1
+    repeat = 3
+    timeout = 1800
+
+    def setup(self, param_fname):
+        self.net_params = _read_params(param_fname)
+
+    def time_simulate_dipole(self, param_fname):
+        net = Network(self.net_params)
+        simulate_dipole(net, n_trials=1)
+
+
+class TimeTrials(object):
+    """Time the simulation of several trials in parallel."""
+
+    params = [1, 2, 4]
+    param_names = ['n_jobs']
+    number = 1
+    repeat = 3
+    timeout = 3600
+
+    def setup(self, n_jobs):
+        self.net_params = _read_params('default.json')
+
+    def time_simulate_dipole(self, n_jobs):
+        net = Network(self.net_params)
+        simulate_dipole(net, n_trials=4, n_jobs=n_jobs)
+
+
+class TimeScaling(object):
+    """Time the simulation with the size of the network and its duration."""
+
+    params = ([5, 10, 15], [50., 100., 200.])
+    param_names = ['n_pyr', 'tstop']
+    number = 1
+    repeat = 3
+    timeout = 1800
+
+    def setup(self, n_pyr, tstop):
+        self.net_params = _read_params('default.json')
+        self.net_params.update({'N_pyr_x': n_pyr, 'N_pyr_y': n_pyr,
+                                'tstop': tstop})
+
+    def time_build(self, n_pyr, tstop):
+        with Network(self.net_params) as net:
+            net.build()
+
+    def time_simulate_dipole(self, n_pyr, tstop):
+        net = Network(self.net_params)
+        simulate_dipole(net, n_trials=1)
+
+
+class PeakMemScaling(object):
+    """Peak memory of the simulation with the size of the network."""
+
+    params = [5, 10, 15, 20]
+    param_names = ['n_pyr']
+    timeout = 1800
+
+    def setup(self, n_pyr):
+        self.net_params = _read_params('default.json')
+        self.net_params.update({'N_pyr_x': n_pyr, 'N_pyr_y': n_pyr,
+                                'tstop': 50.})
+
+    def peakmem_build(self, n_pyr):
+        with Network(self.net_params) as net:
+            net.build()
+
+    def peakmem_simulate_dipole(self, n_pyr):
+        net = Network(self.net_params)
+        simulate_dipole(net, n_trials=1)
+
+
+class TrackScaling(object):
+    """Track the memory and NEURON objects with the size of the network."""
+
+    params = [5, 10, 15, 20]
+    param_names = ['n_pyr']
+    timeout = 1800
+
+    def setup_cache(self):
+        results = dict()
+        for n_pyr in self.params:
+            net_params = _read_params('default.json')
+            net_params.update({'N_pyr_x': n_pyr, 'N_pyr_y': n_pyr,
+                               'tstop': 50.})
+            net = Network(net_params)
+            simulate_dipole(net, n_trials=1, trace_memory=True)
+            peak_rss, alloc_peak = net.timings.get_memory()
+            results[n_pyr] = dict(net.timings.n_objects[0],
+                                  peak_rss=max(peak_rss.values()),
+                                  alloc_peak=max(alloc_peak.values()))
+        return results
+
+    def track_peak_rss(self, results, n_pyr):
+        return results[n_pyr]['peak_rss']
+    track_peak_rss.unit = 'bytes'
+
+    def track_alloc_peak(self, results, n_pyr):
+        return results[n_pyr]['alloc_peak']
+    track_alloc_peak.unit = 'bytes'
+
+    def track_n_segments(self, results, n_pyr):
+        return results[n_pyr]['segments']
+    track_n_segments.unit = 'segments'
+
+    def track_n_synapses(self, results, n_pyr):
+        return results[n_pyr]['Exp2Syn']
+    track_n_synapses.unit = 'Exp2Syn'
+
+    def track_n_netcons(self, results, n_pyr):
+        return results[n_pyr]['NetCon']
+    track_n_netcons.unit = 'NetCon'
+
+    def track_n_vecstims(self, results, n_pyr):
+        return results[n_pyr]['VecStim']
+    track_n_vecstims.unit = 'VecStim'
+
+    def track_n_vectors(self, results, n_pyr):
+        return results[n_pyr]['Vector']
+    track_n_vectors.unit = 'Vector'
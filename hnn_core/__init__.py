@@ -1,8 +1,13 @@
+__version__ = '0.1.dev0'
+
 from .utils import load_custom_mechanisms
 
 load_custom_mechanisms()
 
-from .dipole import simulate_dipole
+from .dipole import (simulate_dipole, simulate_dipole_iter, Dipoles,
+                     read_dipoles)
+from .sweep import simulate_forks, simulate_sweep
+from .spikes import Spikes, read_spikes
 from .feed import ExtFeed
 from .params import Params, read_params
 from .network import Network
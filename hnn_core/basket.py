@@ -56,13 +56,15 @@ class L2Basket(BasketSingle):
         self._synapse_create()
         self._biophysics()
 
-    # par connect between all presynaptic cells
+    # connections FROM other cells TO this cell
     # no connections from L5Pyr or L5Basket to L2Baskets
-    def parconnect(self, gid, gid_dict, pos_dict, p):
-        self._connect(gid, gid_dict, pos_dict, p, 'L2_pyramidal', 'L2Pyr',
-                      postsyns=[self.soma_ampa])
-        self._connect(gid, gid_dict, pos_dict, p, 'L2_basket', 'L2Basket',
-                      lamtha=20., postsyns=[self.soma_gabaa])
+    def _get_connections(self):
+        return [
+            dict(type_src='L2_pyramidal', name_src='L2Pyr', lamtha=3.,
+                 postsyns=[self.soma_ampa]),
+            dict(type_src='L2_basket', name_src='L2Basket', lamtha=20.,
+                 postsyns=[self.soma_gabaa]),
+        ]
 
     # this function might make more sense as a method of net?
     # par: receive from external inputs
@@ -83,8 +85,8 @@ class L2Basket(BasketSingle):
                 }
 
                 # AMPA synapse
-                self.ncfrom_extinput.append(self.parconnect_from_src(
-                    gid_src, nc_dict_ampa, self.soma_ampa))
+                self._connect_feed(self.ncfrom_extinput, gid_src, nc_dict_ampa,
+                                   self.soma_ampa)
 
             # Check if NMDA params are defined in p_src
             if 'L2Basket_nmda' in p_src.keys():
@@ -98,8 +100,8 @@ class L2Basket(BasketSingle):
                 }
 
                 # NMDA synapse
-                self.ncfrom_extinput.append(self.parconnect_from_src(
-                    gid_src, nc_dict_nmda, self.soma_nmda))
+                self._connect_feed(self.ncfrom_extinput, gid_src, nc_dict_nmda,
+                                   self.soma_nmda)
 
     # one parreceive function to handle all types of external parreceives
     # types must be defined explicitly here
@@ -132,18 +134,18 @@ class L2Basket(BasketSingle):
                 # connections depend on location of input - why only
                 # for L2 basket and not L5 basket?
                 if p_ext['loc'] == 'proximal':
-                    self.ncfrom_ev.append(self.parconnect_from_src(
-                        gid_ev, nc_dict_ampa, self.soma_ampa))
+                    self._connect_feed(self.ncfrom_ev, gid_ev, nc_dict_ampa,
+                                       self.soma_ampa)
                     # NEW: note that default/original is 0 nmda weight for
                     # the soma (for prox evoked)
-                    self.ncfrom_ev.append(self.parconnect_from_src(
-                        gid_ev, nc_dict_nmda, self.soma_nmda))
+                    self._connect_feed(self.ncfrom_ev, gid_ev, nc_dict_nmda,
+                                       self.soma_nmda)
 
                 elif p_ext['loc'] == 'distal':
-                    self.ncfrom_ev.append(self.parconnect_from_src(
-                        gid_ev, nc_dict_ampa, self.soma_ampa))
-                    self.ncfrom_ev.append(self.parconnect_from_src(
-                        gid_ev, nc_dict_nmda, self.soma_nmda))
+                    self._connect_feed(self.ncfrom_ev, gid_ev, nc_dict_ampa,
+                                       self.soma_ampa)
+                    self._connect_feed(self.ncfrom_ev, gid_ev, nc_dict_nmda,
+                                       self.soma_nmda)
 
         elif type == 'extgauss':
             # gid is this cell's gid
@@ -172,8 +174,8 @@ class L2Basket(BasketSingle):
                     'type_src': type
                 }
 
-                self.ncfrom_extgauss.append(self.parconnect_from_src(
-                    gid_extgauss, nc_dict, self.soma_ampa))
+                self._connect_feed(self.ncfrom_extgauss, gid_extgauss, nc_dict,
+                                   self.soma_ampa)
 
         elif type == 'extpois':
             if self.celltype in p_ext.keys():
@@ -189,14 +191,14 @@ class L2Basket(BasketSingle):
                     'type_src': type
                 }
 
-                self.ncfrom_extpois.append(self.parconnect_from_src(
-                    gid_extpois, nc_dict, self.soma_ampa))
+                self._connect_feed(self.ncfrom_extpois, gid_extpois, nc_dict,
+                                   self.soma_ampa)
 
                 if p_ext[self.celltype][1] > 0.0:
                     # index 1 for nmda weight
                     nc_dict['A_weight'] = p_ext[self.celltype][1]
-                    self.ncfrom_extpois.append(self.parconnect_from_src(
-                        gid_extpois, nc_dict, self.soma_nmda))
+                    self._connect_feed(self.ncfrom_extpois, gid_extpois,
+                                       nc_dict, self.soma_nmda)
 
         else:
             print("Warning, type def not specified in L2Basket")
@@ -213,14 +215,15 @@ class L5Basket(BasketSingle):
 
     # connections FROM other cells TO this cell
     # there are no connections from the L2Basket cells. congrats!
-    def parconnect(self, gid, gid_dict, pos_dict, p):
-        self._connect(gid, gid_dict, pos_dict, p, 'L5_basket', 'L5Basket',
-                      lamtha=20., autapses=False,
-                      postsyns=[self.soma_gabaa])
-        self._connect(gid, gid_dict, pos_dict, p, 'L5_pyramidal', 'L5Pyr',
-                      postsyns=[self.soma_ampa])
-        self._connect(gid, gid_dict, pos_dict, p, 'L2_pyramidal', 'L2Pyr',
-                      postsyns=[self.soma_ampa])
+    def _get_connections(self):
+        return [
+            dict(type_src='L5_basket', name_src='L5Basket', lamtha=20.,
+                 autapses=False, postsyns=[self.soma_gabaa]),
+            dict(type_src='L5_pyramidal', name_src='L5Pyr', lamtha=3.,
+                 postsyns=[self.soma_ampa]),
+            dict(type_src='L2_pyramidal', name_src='L2Pyr', lamtha=3.,
+                 postsyns=[self.soma_ampa]),
+        ]
 
     # parallel receive function parreceive()
     def parreceive(self, gid, gid_dict, pos_dict, p_ext):
@@ -239,8 +242,8 @@ class L5Basket(BasketSingle):
                 }
 
                 # AMPA synapse
-                self.ncfrom_extinput.append(self.parconnect_from_src(
-                    gid_src, nc_dict_ampa, self.soma_ampa))
+                self._connect_feed(self.ncfrom_extinput, gid_src, nc_dict_ampa,
+                                   self.soma_ampa)
 
             # Check if nmda params are define in p_src
             if 'L5Basket_nmda' in p_src.keys():
@@ -254,8 +257,8 @@ class L5Basket(BasketSingle):
                 }
 
                 # NMDA synapse
-                self.ncfrom_extinput.append(self.parconnect_from_src(
-                    gid_src, nc_dict_nmda, self.soma_nmda))
+                self._connect_feed(self.ncfrom_extinput, gid_src, nc_dict_nmda,
+                                   self.soma_nmda)
 
     # one parreceive function to handle all types of external parreceives
     # types must be defined explicitly here
@@ -286,13 +289,13 @@ class L5Basket(BasketSingle):
                     'type_src': type
                 }
 
-                self.ncfrom_ev.append(self.parconnect_from_src(
-                    gid_ev, nc_dict_ampa, self.soma_ampa))
+                self._connect_feed(self.ncfrom_ev, gid_ev, nc_dict_ampa,
+                                   self.soma_ampa)
 
                 # NEW: note that default/original is 0 nmda weight
                 # for the soma (both prox and distal evoked)
-                self.ncfrom_ev.append(self.parconnect_from_src(
-                    gid_ev, nc_dict_nmda, self.soma_nmda))
+                self._connect_feed(self.ncfrom_ev, gid_ev, nc_dict_nmda,
+                                   self.soma_nmda)
 
         elif type == 'extgauss':
             # gid is this cell's gid
@@ -313,8 +316,8 @@ class L5Basket(BasketSingle):
                     'type_src': type
                 }
 
-                self.ncfrom_extgauss.append(self.parconnect_from_src(
-                    gid_extgauss, nc_dict, self.soma_ampa))
+                self._connect_feed(self.ncfrom_extgauss, gid_extgauss, nc_dict,
+                                   self.soma_ampa)
 
         elif type == 'extpois':
             if self.celltype in p_ext.keys():
@@ -330,14 +333,14 @@ class L5Basket(BasketSingle):
                     'type_src': type
                 }
 
-                self.ncfrom_extpois.append(self.parconnect_from_src(
-                    gid_extpois, nc_dict, self.soma_ampa))
+                self._connect_feed(self.ncfrom_extpois, gid_extpois, nc_dict,
+                                   self.soma_ampa)
 
                 if p_ext[self.celltype][1] > 0.0:
                     # index 1 for nmda weight
                     nc_dict['A_weight'] = p_ext[self.celltype][1]
-                    self.ncfrom_extpois.append(self.parconnect_from_src(
-                        gid_extpois, nc_dict, self.soma_nmda))
+                    self._connect_feed(self.ncfrom_extpois, gid_extpois,
+                                       nc_dict, self.soma_nmda)
 
         else:
             print("Warning, type def not specified in L2Basket")
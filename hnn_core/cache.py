@@ -0,0 +1,128 @@
+"""On-disk cache of simulated trials."""
+
+import os
+import os.path as op
+import glob
+import json
+import hashlib
+
+import numpy as np
+
+_mechanism_hash = None
+
+
+def _get_mechanism_hash():
+    """Hash the mod files so that the cache is invalidated when they change."""
+    global _mechanism_hash
+
+    if _mechanism_hash is None:
+        mod_dir = op.join(op.dirname(__file__), '..', 'mod')
+        sha = hashlib.sha1()
+        for fname in sorted(glob.glob(op.join(mod_dir, '*.mod'))):
+            with open(fname, 'rb') as fid:
+                sha.update(fid.read())
+        _mechanism_hash = sha.hexdigest()
+    return _mechanism_hash
+
+
+def _get_cache_key(params, trial_idx, n_trials, net_kwargs=None):
+    """Get the key of a trial from everything its result depends on.
+
+    Parameters
+    ----------
+    params : dict
+        The parameters of the network.
+    trial_idx : int
+        The index of the trial.
+    n_trials : int
+        The number of trials of the simulation.
+    net_kwargs : dict | None
+        The options of the network.
+
+    Returns
+    -------
+    key : str
+        The hexadecimal digest identifying the trial.
+    """
+    from . import __version__
+
+    desc = dict(params=params, trial_idx=int(trial_idx),
+                n_trials=int(n_trials), net_kwargs=net_kwargs,
+                version=__version__, mechanisms=_get_mechanism_hash())
+    desc = json.dumps(desc, sort_keys=True, default=str)
+    return hashlib.sha1(desc.encode('utf-8')).hexdigest()
+
+
+def _read_cache(cache_dir, key):
+    """Read a trial from the cache.
+
+    Returns
+    -------
+    out : tuple | None
+        The dipole, spike times, spike gids, recordings of the probes and
+        somatic currents of the trial or None if the trial is not in the
+        cache.
+    """
+    from .dipole import Dipole
+
+    fname = op.join(cache_dir, key + '.npz')
+    try:
+        with np.load(fname) as data:
+            dpl = Dipole(data['times'], data['data'])
+            dpl.units = str(data['units'])
+            spiketimes = data['spiketimes']
+            spikegids = data['spikegids']
+            probe_data = dict((name[len('probe_'):], data[name])
+                              for name in data.files
+                              if name.startswith('probe_'))
+            current = dict((key, data['current_' + key])
+                           for key in ('L2Pyr_soma', 'L5Pyr_soma'))
+    except (IOError, ValueError, KeyError):
+        # missing or partially written entry
+        return None
+    # the mtime is used to know which entries were least recently used
+    os.utime(fname, None)
+    return dpl, spiketimes, spikegids, probe_data, current
+
+
+def _write_cache(cache_dir, key, dpl, spiketimes, spikegids, probe_data,
+                 current):
+    """Write a trial to the cache."""
+    if not op.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    fname = op.join(cache_dir, key + '.npz')
+    data = np.c_[dpl.dpl['agg'], dpl.dpl['L2'], dpl.dpl['L5']]
+    # write to a temporary file first so that concurrent readers never
+    # see a partially written entry
+    tmp_fname = op.join(cache_dir, '%s.%d.tmp.npz' % (key, os.getpid()))
+    np.savez(tmp_fname, times=dpl.t, data=data, units=dpl.units,
+             spiketimes=np.array(spiketimes, dtype=float),
+             spikegids=np.array(spikegids, dtype=int),
+             **dict([('probe_%s' % name, data)
+                     for name, data in probe_data.items()] +
+                    [('current_%s' % key, data)
+                     for key, data in current.items()]))
+    os.replace(tmp_fname, fname)
+
+
+def _evict_cache(cache_dir, cache_size):
+    """Remove the least recently used entries above cache_size bytes."""
+    fnames = glob.glob(op.join(cache_dir, '*.npz'))
+    fnames = [fname for fname in fnames if not fname.endswith('.tmp.npz')]
+    stats = list()
+    for fname in fnames:
+        try:
+            stat = os.stat(fname)
+        except OSError:  # removed by another process
+            continue
+        stats.append((stat.st_mtime, stat.st_size, fname))
+    stats.sort()
+    total_size = sum(size for _, size, _ in stats)
+    for _, size, fname in stats:
+        if total_size <= cache_size:
+            break
+        try:
+            os.remove(fname)
+        except OSError:
+            pass
+        total_size -= size
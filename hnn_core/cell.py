@@ -126,31 +126,6 @@ class _Cell(object):
         """Move cell to position."""
         self.translate_to(self.pos[0] * 100, self.pos[2], self.pos[1] * 100)
 
-    def _connect(self, gid, gid_dict, pos_dict, p, type_src, name_src,
-                 lamtha=3., receptor=None, postsyns=None, autapses=True):
-        for gid_src, pos in zip(gid_dict[type_src],
-                                pos_dict[type_src]):
-            if not autapses and gid_src == gid:
-                continue
-            if receptor is not None:
-                A_weight = p['gbar_%s_%s_%s' %
-                             (name_src, self.name, receptor)]
-            else:
-                A_weight = p['gbar_%s_%s' % (name_src, self.name)]
-            nc_dict = {
-                'pos_src': pos,
-                'A_weight': A_weight,
-                'A_delay': 1.,
-                'lamtha': lamtha,
-                'threshold': p['threshold'],
-                'type_src': type_src
-            }
-
-            for postsyn in postsyns:
-                getattr(self, 'ncfrom_%s' % name_src).append(
-                    self.parconnect_from_src(
-                        gid_src, nc_dict, postsyn))
-
     # two things need to happen here for h:
     # 1. dipole needs to be inserted into each section
     # 2. a list needs to be created with a Dipole (Point Process) in each
@@ -217,6 +192,13 @@ class _Cell(object):
             # set the pp dipole's ztan value to the last value from y_diff
             dpp.ztan = y_diff[-1]
 
+    def _set_dipole_total(self, ref):
+        """Sum the dipole of all the sections into the variable at ref."""
+        for sect, dpp in zip(self.list_all, self.dipole_pp):
+            h.setpointer(ref, 'Qtotal', dpp)
+            for seg in sect:
+                h.setpointer(ref, 'Qtotal', seg.dipole)
+
     def record_current_soma(self):
         """Record current at soma."""
         # a soma exists at self.soma
@@ -230,7 +212,9 @@ class _Cell(object):
             # iterate through keys and record currents appropriately
             for key in self.dict_currents:
                 self.dict_currents[key] = h.Vector()
-                self.dict_currents[key].record(self.synapses[key]._ref_i)
+                # the synapse tells in which thread to record
+                self.dict_currents[key].record(self.synapses[key],
+                                               self.synapses[key]._ref_i)
         except:
             print(
                 "Warning in Cell(): record_current_soma() was called,"
@@ -375,6 +359,16 @@ class _Cell(object):
 
         return nc
 
+    def _connect_feed(self, ncs, gid_presyn, nc_dict, postsyn):
+        """Connect a feed to this cell unless its weight is zero.
+
+        The NetCon is appended to ncs. A NetCon with a zero weight has no
+        effect on the synapse, so it is not created.
+        """
+        if nc_dict['A_weight'] == 0.:
+            return
+        ncs.append(self.parconnect_from_src(gid_presyn, nc_dict, postsyn))
+
     # pardistance function requires pre position, since it is
     # calculated on POST cell
     def _pardistance(self, pos_pre):
@@ -0,0 +1,116 @@
+"""Checkpoints of a running simulation."""
+
+import os
+import os.path as op
+import tempfile
+
+import numpy as np
+from neuron import h
+
+
+def _get_checkpoint_fname(fname):
+    """Get the checkpoint file of this process.
+
+    The number of processes is part of the name since a checkpoint can
+    only be resumed by the same distribution of the cells.
+    """
+    from .parallel import rank, nhosts
+
+    return '%s.%d-%d.npz' % (fname, rank, nhosts)
+
+
+def _save_checkpoint(fname, recordings, prefix, skip):
+    """Save the state of the network and what was recorded so far.
+
+    Parameters
+    ----------
+    fname : str
+        The name of the checkpoint without the extension.
+    recordings : dict of h.Vector
+        The vectors recording since the simulation started or resumed.
+    prefix : dict of array
+        What was recorded before the simulation resumed.
+    skip : dict of int
+        The number of samples at the start of each recording that were
+        already recorded before the simulation resumed.
+    """
+    # SaveState includes the states of all the mechanisms, the positions
+    # of the VecStims in their event vectors and the queued events
+    ss = h.SaveState()
+    ss.save()
+    fd, tmp_fname = tempfile.mkstemp(suffix='.dat')
+    os.close(fd)
+    try:
+        fid = h.File()
+        fid.wopen(tmp_fname)
+        ss.fwrite(fid)
+        fid.close()
+        with open(tmp_fname, 'rb') as fid:
+            savestate = np.frombuffer(fid.read(), dtype=np.uint8)
+    finally:
+        os.remove(tmp_fname)
+
+    data = _merge_recordings(recordings, prefix, skip)
+    data = dict(('rec_%s' % key, value) for key, value in data.items())
+    ckpt_fname = _get_checkpoint_fname(fname)
+    tmp_fname = '%s.tmp.npz' % ckpt_fname[:-len('.npz')]
+    np.savez(tmp_fname, savestate=savestate, t=h.t, **data)
+    # a checkpoint is never partially written
+    os.replace(tmp_fname, ckpt_fname)
+
+
+def _load_checkpoint(fname):
+    """Restore the state of the network from its last checkpoint.
+
+    Must be called after h.finitialize().
+
+    Returns
+    -------
+    prefix : dict of array | None
+        What was recorded before the checkpoint, or None if there is
+        no checkpoint.
+    """
+    from .parallel import rank
+
+    ckpt_fname = _get_checkpoint_fname(fname)
+    if not op.exists(ckpt_fname):
+        return None
+
+    with np.load(ckpt_fname) as data:
+        savestate = data['savestate']
+        prefix = dict((key[len('rec_'):], data[key]) for key in data.files
+                      if key.startswith('rec_'))
+    fd, tmp_fname = tempfile.mkstemp(suffix='.dat')
+    os.close(fd)
+    try:
+        with open(tmp_fname, 'wb') as fid:
+            fid.write(savestate.tobytes())
+        fid = h.File()
+        fid.ropen(tmp_fname)
+        ss = h.SaveState()
+        ss.fread(fid)
+        fid.close()
+        ss.restore(0)
+    finally:
+        os.remove(tmp_fname)
+    if rank == 0:
+        print('Resuming the simulation from %s at %0.2f ms'
+              % (ckpt_fname, h.t))
+    return prefix
+
+
+def _merge_recordings(recordings, prefix, skip):
+    """Append what was recorded since resuming to what was recorded before."""
+    data = dict()
+    for key, vec in recordings.items():
+        data[key] = vec.as_numpy()[skip.get(key, 0):].copy()
+        if key in prefix:
+            data[key] = np.r_[prefix[key], data[key]]
+    return data
+
+
+def _remove_checkpoint(fname):
+    """Remove the checkpoint of this process once the trial is done."""
+    ckpt_fname = _get_checkpoint_fname(fname)
+    if op.exists(ckpt_fname):
+        os.remove(ckpt_fname)
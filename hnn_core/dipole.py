@@ -3,34 +3,204 @@
 # Authors: Mainak Jas <mainak.jas@telecom-paristech.fr>
 #          Sam Neymotin <samnemo@gmail.com>
 
+import os
+import os.path as op
+import json
+import struct
+import itertools as it
+import tracemalloc
+from copy import deepcopy
+
 import numpy as np
 from numpy import convolve, hamming
 
 from .parallel import _parallel_func
+from .probe import (_record_probes, _get_probe_recordings, _collect_probes,
+                    _flush_probes, _get_probe_data)
+
+
+# the windows longer than this are convolved through the FFT
+_FFT_MIN_WINSZ = 64
+
+# normalized Hamming windows already computed in this process
+_hamming_windows = dict()
+
+# the binary files of dipoles start with the magic string, the version
+# of the format and the length of a JSON header
+_DIPOLE_MAGIC = b'HNNDPL'
+_DIPOLE_VERSION = 1
+_DIPOLE_PREAMBLE = struct.Struct('<6sHI')
+# the arrays start at a multiple of this number of bytes
+_DIPOLE_ALIGN = 64
+
+
+def _get_hamming_window(winsz):
+    """Get a Hamming window of winsz samples normalized to a sum of 1."""
+    if winsz not in _hamming_windows:
+        win = hamming(winsz)
+        win /= sum(win)
+        win.flags.writeable = False
+        _hamming_windows[winsz] = win
+    return _hamming_windows[winsz]
+
+
+def _next_fast_len(n):
+    """Get the smallest product of 2, 3 and 5 larger or equal to n."""
+    fast_len = 2 ** int(np.ceil(np.log2(n)))
+    power_5 = 1
+    while power_5 < fast_len:
+        power_35 = power_5
+        while power_35 < fast_len:
+            # the smallest power of 2 that brings power_35 above n
+            power_2 = 2 ** max(int(np.ceil(np.log2(n / power_35))), 0)
+            fast_len = min(fast_len, power_35 * power_2)
+            power_35 *= 3
+        power_5 *= 5
+    return fast_len
 
 
 def _hammfilt(x, winsz):
-    """Convolve with a hamming window."""
-    win = hamming(winsz)
-    win /= sum(win)
-    return convolve(x, win, 'same')
+    """Convolve with a hamming window along the last axis.
+
+    The output is that of np.convolve with mode 'same'. Long windows
+    are convolved through the FFT, all the rows of x at once.
+    """
+    win = _get_hamming_window(winsz)
+    if len(win) <= _FFT_MIN_WINSZ:
+        if x.ndim == 1:
+            return convolve(x, win, 'same')
+        return np.apply_along_axis(convolve, -1, x, win, 'same')
+
+    n_times, n_win = x.shape[-1], len(win)
+    n_fft = _next_fast_len(n_times + n_win - 1)
+    x_full = np.fft.irfft(np.fft.rfft(x, n_fft, axis=-1) *
+                          np.fft.rfft(win, n_fft), n_fft, axis=-1)
+    # the center of the full convolution as in np.convolve
+    start = (min(n_times, n_win) - 1) // 2
+    return x_full[..., start:start + max(n_times, n_win)]
 
 
-def _clone_and_simulate(params, trial_idx):
+def _get_baseline_offsets(times, params):
+    """Get the offsets of the L2 and L5 dipoles of a network without input.
+
+    Returns
+    -------
+    offset_L2 : float
+        The offset of the L2 dipole in fAm.
+    offset_L5 : array (n_times,)
+        The offset of the L5 dipole at each time in fAm.
+    """
+    N_pyr_x = params['N_pyr_x']
+    N_pyr_y = params['N_pyr_y']
+    # N_pyr cells in grid. This is PER LAYER
+    N_pyr = N_pyr_x * N_pyr_y
+    # dipole offset calculation: increasing number of pyr
+    # cells (L2 and L5, simultaneously)
+    # with no inputs resulted in an aggregate dipole over the
+    # interval [50., 1000.] ms that
+    # eventually plateaus at -48 fAm. The range over this interval
+    # is something like 3 fAm
+    # so the resultant correction is here, per dipole
+    # dpl_offset = N_pyr * 50.207
+    dpl_offset = {
+        # these values will be subtracted
+        'L2': N_pyr * 0.0443,
+        'L5': N_pyr * -49.0502
+        # 'L5': N_pyr * -48.3642,
+        # will be calculated next, this is a placeholder
+        # 'agg': None,
+    }
+    # L2 dipole offset can be roughly baseline shifted over
+    # the entire range of t
+    # L5 dipole offset should be different for interval [50., 500.]
+    # and then it can be offset
+    # slope (m) and intercept (b) params for L5 dipole offset
+    # uncorrected for N_cells
+    # these values were fit over the range [37., 750.)
+    m = 3.4770508e-3
+    b = -51.231085
+    # these values were fit over the range [750., 5000]
+    t1 = 750.
+    m1 = 1.01e-4
+    b1 = -48.412078
+    # piecewise normalization
+    offset_L5 = np.empty(len(times))
+    offset_L5[times <= 37.] = dpl_offset['L5']
+    mask = (times > 37.) & (times < t1)
+    offset_L5[mask] = N_pyr * (m * times[mask] + b)
+    offset_L5[times >= t1] = N_pyr * (m1 * times[times >= t1] + b1)
+    return dpl_offset['L2'], offset_L5
+
+
+def _clone_and_simulate(params, trial_idxs, net_kwargs=None,
+                        checkpoint=None, trace_memory=False, record=None,
+                        progress_interval=10., stop=None):
+    """Build the network once and simulate several trials with it.
+
+    Returns
+    -------
+    out : list of tuple
+        The dipole, spike times, spike gids, recordings of the probes and
+        somatic currents of each trial.
+    timings : instance of Timings
+        The durations and memory of the phases of all the processes.
+    """
     from .network import Network
+    from .parallel import pc, nhosts
+    from .timing import Timings
 
-    if trial_idx != 0:
-        params['prng_*'] = trial_idx
+    net_kwargs = dict() if net_kwargs is None else net_kwargs.copy()
+    probes = net_kwargs.pop('probes', dict())
+    variant_idx = net_kwargs.pop('variant_idx', None)
+    if checkpoint is None:
+        checkpoint = dict(fnames=dict(), interval=None)
+    if record is None:
+        record = dict(dir=None, interval=None)
+    start_tracing = trace_memory and not tracemalloc.is_tracing()
+    if start_tracing:
+        tracemalloc.start()
+    try:
+        net = Network(params.copy(), n_jobs=1, **net_kwargs)
+        net.probes.update(probes)
+        net._variant_idx = variant_idx
+        net.build()
 
-    net = Network(params, n_jobs=1)
-    net.build()
+        out = list()
+        for trial_idx in trial_idxs:
+            net._reset_trial(trial_idx)
+            out.append(_simulate_single_trial(
+                net, checkpoint['fnames'].get(trial_idx),
+                checkpoint['interval'], record['dir'], record['interval'],
+                progress_interval, stop))
+    finally:
+        if start_tracing:
+            tracemalloc.stop()
 
-    return _simulate_single_trial(net)
+    events, n_objects = net.timings.events, net.timings.n_objects
+    if nhosts > 1:
+        events = pc.py_gather(events, 0)
+        events = list(it.chain(*events)) if events is not None else list()
+        n_objects = pc.py_gather(n_objects, 0)
+        n_objects = (list(it.chain(*n_objects)) if n_objects is not None
+                     else list())
 
+    pc.gid_clear()
+    pc.nthread(1)
+    pc.done()
+    return out, Timings(events, n_objects)
+
+
+def _init_trial(net):
+    """Set up the recordings of a trial and initialize the network.
 
-def _simulate_single_trial(net):
-    """Simulate one trial."""
-    from .parallel import rank, nhosts, pc, cvode
+    Returns
+    -------
+    t_vec : h.Vector
+        The recording of the time.
+    dp_rec : dict of list of h.Vector
+        The recordings of the dipoles of each thread.
+    """
+    from .parallel import rank, nhosts, pc
     from neuron import h
     h.load_file("stdrun.hoc")
 
@@ -50,65 +220,339 @@ def _simulate_single_trial(net):
     # We define the arrays (Vector in numpy) for recording the signals
     t_vec = h.Vector()
     t_vec.record(h._ref_t)  # time recording
-    dp_rec_L2 = h.Vector()
-    dp_rec_L2.record(h._ref_dp_total_L2)  # L2 dipole recording
-    dp_rec_L5 = h.Vector()
-    dp_rec_L5.record(h._ref_dp_total_L5)  # L5 dipole recording
+    dp_rec = net._record_dipole()  # L2 and L5 dipole recordings
+    net._probe_recs = _record_probes(net)
 
     # sets the default max solver step in ms (purposefully large)
     pc.set_maxstep(10)
 
     # initialize cells to -65 mV, after all the NetCon
     # delays have been specified
-    h.finitialize()
+    with net.timings.phase('finitialize', net._trial_idx):
+        h.finitialize()
+    return t_vec, dp_rec
 
-    def simulation_time():
-        print('Simulation time: {0} ms...'.format(round(h.t, 2)))
 
-    if rank == 0:
-        for tt in range(0, int(h.tstop), 10):
-            cvode.event(tt, simulation_time)
+def _get_recordings(net, t_vec, dp_rec):
+    """Get all the vectors recording a trial by name."""
+    recordings = dict(t=t_vec, spiketimes=net.spiketimes,
+                      spikegids=net.spikegids)
+    for layer in ('L2', 'L5'):
+        for idx, rec in enumerate(dp_rec[layer]):
+            recordings['%s_%d' % (layer, idx)] = rec
+    for cell in net.cells:
+        for key, I_soma in getattr(cell, 'dict_currents', dict()).items():
+            recordings['I_%d_%s' % (cell.gid, key)] = I_soma
+    recordings.update(_get_probe_recordings(net._probe_recs))
+    return recordings
 
-    h.fcurrent()
-    # set state variables if they have been changed since h.finitialize
-    h.frecord_init()
-    # actual simulation - run the solver
-    pc.psolve(h.tstop)
 
-    pc.barrier()
+def _postprocess_dipole(net, dpl, smooth=True):
+    """Renormalize, convert, scale and smooth a raw dipole in place."""
+    if net.steady_state:
+        dpl.baseline_renormalize(net.params, net._get_rest_dipole())
+    else:
+        dpl.baseline_renormalize(net.params)
+    dpl.convert_fAm_to_nAm()
+    dpl.scale(net.params['dipole_scalefctr'])
+    if smooth:
+        dpl.smooth(net.params['dipole_smooth_win'] / net.params['dt'])
+
+
+def _psolve_chunks(net, interval):
+    """Integrate until tstop in chunks of interval ms.
+
+    It is a generator that yields after each chunk.
+    """
+    from .parallel import pc
+    from neuron import h
+
+    while h.t < h.tstop - h.dt / 2.:
+        with net.timings.phase('psolve', net._trial_idx):
+            pc.psolve(min(h.t + interval, h.tstop))
+        yield
+
+
+def _flush_trial(net, t_vec, dp_rec, store):
+    """Append what was recorded since the last flush to a store.
+
+    The dipoles of the threads and the somatic currents of the cells are
+    summed before being appended, and the vectors are emptied so that
+    the memory does not grow with the duration of the simulation.
+    """
+    offset = len(store.read('t'))
+    n_times = int(t_vec.size())
+    store.append('t', t_vec.as_numpy())
+    for layer in ('L2', 'L5'):
+        store.append(layer, np.sum([np.zeros(n_times)] +
+                                   [rec.as_numpy() for rec in dp_rec[layer]],
+                                   axis=0))
+    currents = dict((key, np.zeros(n_times)) for key in net.current)
+    for cell in net.cells:
+        for I_soma in getattr(cell, 'dict_currents', dict()).values():
+            currents['%s_soma' % cell.name] += I_soma.as_numpy()
+    for key, current in currents.items():
+        store.append(key, current)
+    store.append('spiketimes', net.spiketimes.as_numpy())
+    store.append('spikegids', net.spikegids.as_numpy().astype(int))
+    _flush_probes(net, net._probe_recs, store, offset)
+
+    for vec in _get_recordings(net, t_vec, dp_rec).values():
+        vec.resize(0)
+
+
+def _collect_trial(net, t_vec, dp_rec, store=None):
+    """Gather the dipole, the spikes and the currents of a trial.
+
+    Parameters
+    ----------
+    net : Network object
+        The network.
+    t_vec : h.Vector
+        The recording of the time.
+    dp_rec : dict of list of h.Vector
+        The recordings of the dipoles of each thread.
+    store : instance of _RecordStore | None
+        If not None, the recordings were flushed to the store and are
+        read from it.
+
+    Returns
+    -------
+    dpl : instance of Dipole
+        The dipole of the trial.
+    spiketimes : array of float
+        The spike times.
+    spikegids : array of int
+        The gids of the cells that spiked.
+    probe_data : dict of array (n_channels, n_times)
+        The recordings of each probe.
+    current : dict of array
+        The somatic currents of the L2 and L5 pyramidal cells summed
+        over all the processes.
+    """
+    from .parallel import rank, nhosts, pc
+    from neuron import h
+
+    trial_idx = net._trial_idx
+    with net.timings.phase('barrier', trial_idx):
+        pc.barrier()
+
+    if store is not None:
+        # the dipoles of the threads were summed when flushed
+        t_vec = h.Vector(store.read('t'))
+        dp_rec = dict((layer, [h.Vector(store.read(layer))])
+                      for layer in ('L2', 'L5'))
+        dp_rec_L2, dp_rec_L5 = dp_rec['L2'][0], dp_rec['L5'][0]
+    else:
+        # sum the dipoles of the threads. The recordings are copied if
+        # they are summed in place over the processes.
+        dp_rec_L2, dp_rec_L5 = [
+            (dp_rec[layer][0] if nhosts == 1 else dp_rec[layer][0].c())
+            if len(dp_rec[layer]) == 1 else
+            h.Vector(np.sum([rec.as_numpy() for rec in dp_rec[layer]],
+                            axis=0))
+            for layer in ('L2', 'L5')]
 
     # these calls aggregate data across procs/nodes
-    pc.allreduce(dp_rec_L2, 1)
-    # combine dp_rec on every node, 1=add contributions together
-    pc.allreduce(dp_rec_L5, 1)
+    with net.timings.phase('allreduce_dipole', trial_idx):
+        pc.allreduce(dp_rec_L2, 1)
+        # combine dp_rec on every node, 1=add contributions together
+        pc.allreduce(dp_rec_L5, 1)
     # aggregate the currents independently on each proc
-    net.aggregate_currents()
+    with net.timings.phase('aggregate_currents', trial_idx):
+        if store is not None:
+            # the currents of the cells were summed when flushed
+            for key, current in net.current.items():
+                current.from_python(store.read(key))
+        else:
+            # a trial stopped early recorded fewer samples
+            for current in net.current.values():
+                current.resize(int(t_vec.size()))
+                current.fill(0.)
+            net.aggregate_currents()
     # combine net.current{} variables on each proc
-    pc.allreduce(net.current['L5Pyr_soma'], 1)
-    pc.allreduce(net.current['L2Pyr_soma'], 1)
+    with net.timings.phase('allreduce_currents', trial_idx):
+        pc.allreduce(net.current['L5Pyr_soma'], 1)
+        pc.allreduce(net.current['L2Pyr_soma'], 1)
+    current = dict((key, vec.as_numpy().copy())
+                   for key, vec in net.current.items())
 
-    pc.barrier()  # get all nodes to this place before continuing
+    with net.timings.phase('barrier', trial_idx):
+        pc.barrier()  # get all nodes to this place before continuing
 
-    dpl_data = np.c_[np.array(dp_rec_L2.to_python()) +
-                     np.array(dp_rec_L5.to_python()),
-                     np.array(dp_rec_L2.to_python()),
-                     np.array(dp_rec_L5.to_python())]
+    # as_numpy gives views of the vectors which are copied once into
+    # the arrays of the dipole
+    dpl_data = np.empty((int(t_vec.size()), 3))
+    dpl_data[:, 1] = dp_rec_L2.as_numpy()
+    dpl_data[:, 2] = dp_rec_L5.as_numpy()
+    np.add(dpl_data[:, 1], dpl_data[:, 2], out=dpl_data[:, 0])
 
-    pc.gid_clear()
-    pc.done()
-    dpl = Dipole(np.array(t_vec.to_python()), dpl_data)
+    dpl = Dipole(t_vec.as_numpy().copy(), dpl_data)
     if rank == 0:
         if net.params['save_dpl']:
-            dpl.write('rawdpl.txt')
+            fname = 'rawdpl_%d.dpl' % trial_idx
+            if net._variant_idx is not None:
+                fname = 'rawdpl_%d_variant_%d.dpl' % (trial_idx,
+                                                      net._variant_idx)
+            Dipoles.from_dipoles([dpl]).save(fname)
 
-        dpl.baseline_renormalize(net.params)
-        dpl.convert_fAm_to_nAm()
-        dpl.scale(net.params['dipole_scalefctr'])
-        dpl.smooth(net.params['dipole_smooth_win'] / h.dt)
-    return dpl, net.spiketimes.to_python(), net.spikegids.to_python()
+        with net.timings.phase('dipole_postprocessing', trial_idx):
+            _postprocess_dipole(net, dpl)
+
+    with net.timings.phase('collect_probes', trial_idx):
+        probe_data = _collect_probes(net, net._probe_recs, store)
+
+    if store is not None:
+        spiketimes = np.array(store.read('spiketimes'))
+        spikegids = np.array(store.read('spikegids', int))
+    else:
+        spiketimes = net.spiketimes.as_numpy().copy()
+        spikegids = net.spikegids.as_numpy().astype(int)
+    if nhosts > 1:
+        # each process only recorded the spikes of its own cells
+        with net.timings.phase('gather_spikes', trial_idx):
+            spiketimes = pc.py_gather(spiketimes, 0)
+            spikegids = pc.py_gather(spikegids, 0)
+        if rank == 0:
+            spiketimes = np.concatenate(spiketimes)
+            spikegids = np.concatenate(spikegids)
+            order = np.lexsort((spikegids, spiketimes))
+            spiketimes = spiketimes[order]
+            spikegids = spikegids[order]
+    return dpl, spiketimes, spikegids, probe_data, current
 
 
-def simulate_dipole(net, n_trials=1, n_jobs=1):
+def _set_current(net, current):
+    """Set the somatic currents of a trial into the network."""
+    from neuron import h
+
+    net.current = dict((key, h.Vector(data)) for key, data in current.items())
+
+
+def _simulate_single_trial(net, checkpoint_fname=None,
+                           checkpoint_interval=None, record_dir=None,
+                           record_interval=None, progress_interval=10.,
+                           stop=None):
+    """Simulate one trial.
+
+    Parameters
+    ----------
+    net : Network object
+        The built network.
+    checkpoint_fname : str | None
+        The name of the checkpoint of the trial without the extension.
+        If a checkpoint exists, the simulation is resumed from it. If
+        None, no checkpoint is saved.
+    checkpoint_interval : float | None
+        The simulated time in ms between two checkpoints. If None, the
+        checkpoint is only read.
+    record_dir : str | None
+        The directory where the recordings are appended every
+        record_interval ms. If None, they are kept in memory.
+    record_interval : float | None
+        The simulated time in ms between two flushes of the recordings
+        to record_dir.
+    progress_interval : float | None
+        The simulated time in ms between two prints of the simulation
+        time. If None, nothing is printed.
+    stop : dict | None
+        The stop conditions and the simulated time in ms between two
+        checks of the conditions. If None, the trial runs until tstop.
+        Cannot be combined with record_dir or checkpoint_fname.
+    """
+    from .checkpoint import (_save_checkpoint, _load_checkpoint,
+                             _merge_recordings, _remove_checkpoint)
+    from .parallel import rank, pc, cvode
+    from .recording import _RecordStore
+    from .stopping import _StopMonitor
+    from neuron import h
+
+    if stop is not None and (record_dir is not None or
+                             checkpoint_fname is not None):
+        raise ValueError('stop conditions cannot be combined with '
+                         'record_dir or checkpoint_dir')
+    if record_dir is not None and checkpoint_fname is not None:
+        raise ValueError('record_dir cannot be combined with '
+                         'checkpoint_dir')
+
+    t_vec, dp_rec = _init_trial(net)
+    store = None
+    if record_dir is not None:
+        store = _RecordStore(record_dir, net._trial_idx)
+
+    prefix = dict()
+    if checkpoint_fname is not None:
+        prefix = _load_checkpoint(checkpoint_fname)
+        if prefix is None:
+            prefix = dict()
+        else:
+            # the VecStims are played again to point to the event times
+            # of this process
+            for feed in it.chain(net.extinput_list, *net.ext_list.values()):
+                feed.vs.play(feed.eventvec)
+
+    def simulation_time():
+        print('Simulation time: {0} ms...'.format(round(h.t, 2)))
+
+    if rank == 0 and progress_interval is not None:
+        for tt in np.arange(0., h.tstop, progress_interval):
+            if tt > h.t or len(prefix) == 0:
+                cvode.event(tt, simulation_time)
+
+    if len(prefix) == 0:
+        h.fcurrent()
+    # set state variables if they have been changed since h.finitialize
+    h.frecord_init()
+
+    # the vectors to save in the checkpoints
+    recordings = _get_recordings(net, t_vec, dp_rec)
+    # when resuming, the first sample was already recorded before the
+    # checkpoint
+    skip = dict((key, 1) for key in recordings
+                if len(prefix) > 0 and key not in ('spiketimes', 'spikegids'))
+
+    # actual simulation - run the solver
+    if store is not None:
+        for _ in _psolve_chunks(net, record_interval):
+            with net.timings.phase('flush_recordings', net._trial_idx):
+                _flush_trial(net, t_vec, dp_rec, store)
+    elif stop is not None:
+        monitor = _StopMonitor(net, t_vec, dp_rec, stop['conditions'])
+        stop_reason = None
+        for _ in _psolve_chunks(net, stop['interval']):
+            with net.timings.phase('check_stop', net._trial_idx):
+                stop_reason = monitor.check()
+            if stop_reason is not None:
+                break
+    elif checkpoint_fname is None or checkpoint_interval is None:
+        with net.timings.phase('psolve', net._trial_idx):
+            pc.psolve(h.tstop)
+    else:
+        for _ in _psolve_chunks(net, checkpoint_interval):
+            if h.t < h.tstop - h.dt / 2.:
+                with net.timings.phase('save_checkpoint', net._trial_idx):
+                    _save_checkpoint(checkpoint_fname, recordings, prefix,
+                                     skip)
+
+    if len(prefix) > 0:
+        # put back what was recorded before the checkpoint
+        data = _merge_recordings(recordings, prefix, skip)
+        for key, vec in recordings.items():
+            vec.from_python(data[key])
+    if checkpoint_fname is not None:
+        _remove_checkpoint(checkpoint_fname)
+
+    out = _collect_trial(net, t_vec, dp_rec, store)
+    if stop is not None:
+        out[0].stop_reason = stop_reason
+    return out
+
+
+def simulate_dipole(net, n_trials=1, n_jobs=1, backend='joblib', n_procs=1,
+                    cache_dir=None, cache_size=1e9, checkpoint_dir=None,
+                    checkpoint_interval=None, trace_memory=False,
+                    record_dir=None, record_interval=1000.,
+                    progress_interval=10., return_timings=False):
     """Simulate a dipole given the experiment parameters.
 
     Parameters
@@ -119,21 +563,302 @@ def simulate_dipole(net, n_trials=1, n_jobs=1):
     n_trials : int
         The number of trials to simulate.
     n_jobs : int
-        The number of jobs to run in parallel.
+        The number of jobs to run in parallel with the joblib backend.
+    backend : 'joblib' | 'mpi'
+        With 'joblib', the trials are simulated in parallel in n_jobs
+        jobs. With 'mpi', mpiexec is launched and the network of each
+        trial is distributed over n_procs processes. This speeds up the
+        simulation of large networks.
+    n_procs : int
+        The number of MPI processes with the mpi backend.
+    cache_dir : str | None
+        The directory where the simulated trials are cached. A trial
+        found in the cache is not simulated again. If None, no cache
+        is used.
+    cache_size : float
+        The maximum size of the cache in bytes. The least recently
+        used trials are removed from the cache beyond this size.
+    checkpoint_dir : str | None
+        The directory where the state of the trials being simulated is
+        saved every checkpoint_interval ms. If the simulation is
+        interrupted, calling simulate_dipole again with the same
+        checkpoint_dir resumes each trial from its last checkpoint. If
+        None, no checkpoint is saved.
+    checkpoint_interval : float | None
+        The simulated time in ms between two checkpoints. If None, a
+        checkpoint is saved every 10 % of tstop.
+    trace_memory : bool
+        If True, the memory allocated by Python during each phase is
+        traced with tracemalloc. This slows down the build.
+    record_dir : str | None
+        The directory where the recordings of the trials are appended
+        every record_interval ms of simulated time, after which the
+        recordings in memory are emptied. This bounds the memory used by
+        the recordings of long simulations. If None, the recordings are
+        kept in memory for the whole trial. It cannot be combined with
+        checkpoint_dir.
+    record_interval : float
+        The simulated time in ms between two flushes of the recordings
+        to record_dir.
+    progress_interval : float | None
+        The simulated time in ms between two prints of the simulation
+        time. If None, nothing is printed and no event is added to the
+        simulation.
+    return_timings : bool
+        If True, the timings of this call are returned as well.
 
     Returns
     -------
     dpl: list | instance of Dipole
         The dipole object or list of dipole objects if n_trials > 1
+    timings : instance of Timings
+        The durations and memory of the phases of the simulation of the
+        trials that were not in the cache. Only returned if
+        return_timings is True.
+
+    Notes
+    -----
+    The trials are split into one contiguous chunk per job. Each job builds
+    the network once and reuses it for all the trials of its chunk since
+    only the seeds of the feeds change between trials.
+
+    With the mpi backend, the cells are assigned to the processes in a
+    round robin fashion. The dipoles and the somatic currents are summed
+    over the processes and the spikes are gathered on the first process
+    before being returned.
+
+    The somatic currents of the last trial are stored in net.current.
+
+    If none of the feeds depend on the seed (e.g., all the stdevs are
+    zero), all the trials are identical and only the first one is
+    simulated.
+
+    The durations of the phases of the build and simulation of every
+    process and trial are added to net.timings, which accumulates the
+    phases of all the calls on the network. They can be exported
+    with net.timings.write_trace to be inspected in chrome://tracing.
+    The peak resident memory of the process at the end of each phase is
+    stored as well, and net.timings.get_memory gives the largest one of
+    each phase. With the numbers of sections, segments, synapses,
+    NetCons, VecStims and Vectors of each process in
+    net.timings.n_objects, they tell how many jobs fit in the memory of
+    a node.
+
+    A checkpoint contains the state of all the mechanisms, the queued
+    events, the position of the feeds in their event times and what was
+    recorded so far. It can only be resumed by a network with the same
+    parameters and options. The checkpoint of a trial is removed once
+    the trial is done.
+
+    With record_dir, the recordings of each process are appended to raw
+    files in the directory ``trial_<trial_idx>`` of record_dir, with the
+    dipoles of the threads and the somatic currents of the cells already
+    summed. The files are read back through memory maps once the trial
+    is done and are kept afterwards.
     """
-    parallel, myfunc = _parallel_func(_clone_and_simulate, n_jobs=n_jobs)
-    out = parallel(myfunc(net.params, idx) for idx in range(n_trials))
-    dpl, spiketimes, spikegids = zip(*out)
+    from .cache import (_get_cache_key, _read_cache, _write_cache,
+                        _evict_cache)
+    from .feed import _is_random
+    from .parallel import _mpi_simulate
+    from .spikes import Spikes
+    from .timing import Timings
+
+    if backend not in ('joblib', 'mpi'):
+        raise ValueError("backend must be 'joblib' or 'mpi', got %s"
+                         % backend)
+
+    # the options of the network that must be the same in all the jobs
+    net_kwargs = dict(weight_cutoff=net.weight_cutoff,
+                      n_threads=net.n_threads,
+                      steady_state=net.steady_state,
+                      load_balance=net.load_balance)
+    if len(net.probes) > 0:
+        net_kwargs['probes'] = net.probes
+
+    is_random = (any(_is_random('extinput', p_ext) for p_ext in net.p_ext) or
+                 any(_is_random(ty, p_ext)
+                     for ty, p_ext in net.p_unique.items()))
+    # the trials that give the result of each trial
+    if is_random:
+        src_idxs = list(range(n_trials))
+    else:
+        print('The feeds are deterministic, simulating only one trial')
+        src_idxs = [0] * n_trials
+
+    results = dict()
+    if cache_dir is not None:
+        keys = dict((trial_idx, _get_cache_key(net.params, trial_idx,
+                                               n_trials, net_kwargs))
+                    for trial_idx in set(src_idxs))
+        for trial_idx, key in keys.items():
+            result = _read_cache(cache_dir, key)
+            if result is not None:
+                results[trial_idx] = result
+        if len(results) > 0:
+            print('Loaded %d trials from %s' % (len(results), cache_dir))
+
+    record = None
+    if record_dir is not None:
+        if checkpoint_dir is not None:
+            raise ValueError('record_dir cannot be combined with '
+                             'checkpoint_dir')
+        if record_interval <= 0:
+            raise ValueError('record_interval must be positive, got %s'
+                             % record_interval)
+        record = dict(dir=record_dir, interval=record_interval)
+
+    missing_idxs = sorted(set(src_idxs) - set(results))
+    checkpoint = None
+    if checkpoint_dir is not None:
+        if not op.isdir(checkpoint_dir):
+            os.makedirs(checkpoint_dir)
+        if checkpoint_interval is None:
+            checkpoint_interval = net.params['tstop'] / 10.
+        if checkpoint_interval <= 0:
+            raise ValueError('checkpoint_interval must be positive, got %s'
+                             % checkpoint_interval)
+        fnames = dict((trial_idx, op.join(checkpoint_dir, _get_cache_key(
+                       net.params, trial_idx, n_trials, net_kwargs)))
+                      for trial_idx in missing_idxs)
+        checkpoint = dict(fnames=fnames, interval=checkpoint_interval)
+
+    timings = Timings()
+    if len(missing_idxs) > 0:
+        if backend == 'mpi':
+            out, timings = _mpi_simulate(net.params, missing_idxs,
+                                         net_kwargs, n_procs, checkpoint,
+                                         trace_memory, record,
+                                         progress_interval)
+        else:
+            n_chunks = (min(n_jobs, len(missing_idxs)) if n_jobs > 0 else
+                        len(missing_idxs))
+            trial_chunks = np.array_split(np.array(missing_idxs), n_chunks)
+            parallel, myfunc = _parallel_func(_clone_and_simulate,
+                                              n_jobs=n_jobs)
+            out = parallel(myfunc(net.params, trial_idxs.tolist(),
+                                  net_kwargs, checkpoint, trace_memory,
+                                  record, progress_interval)
+                           for trial_idxs in trial_chunks)
+            out, job_timings = zip(*out)
+            out = it.chain(*out)
+            for job_timing in job_timings:
+                timings.extend(job_timing)
+        results.update(zip(missing_idxs, out))
+
+        if cache_dir is not None:
+            for trial_idx in missing_idxs:
+                _write_cache(cache_dir, keys[trial_idx], *results[trial_idx])
+            _evict_cache(cache_dir, cache_size)
+
+    # copy the trials that are shared so that they can be modified
+    # independently
+    out = [results[src_idx] if src_idx == trial_idx else
+           deepcopy(results[src_idx])
+           for trial_idx, src_idx in enumerate(src_idxs)]
+    dpl, spiketimes, spikegids, probe_data, current = zip(*out)
     net.spiketimes = spiketimes
     net.spikegids = spikegids
+    net.spikes = Spikes.from_trials(spiketimes, spikegids, net.gid_dict)
+    net.probe_data = _get_probe_data(net.probes, probe_data,
+                                     net.params['dt'])
+    _set_current(net, current[-1])
+    net.timings.extend(timings)
+    if return_timings:
+        return dpl, timings
     return dpl
 
 
+def _iter_trials(net, n_trials, interval, net_kwargs):
+    """Simulate the trials in this process and yield them in chunks."""
+    from .network import Network
+    from .parallel import pc
+    from .spikes import Spikes
+    from neuron import h
+
+    sim_net = Network(net.params.copy(), n_jobs=1, **net_kwargs)
+    sim_net.probes.update(net.probes)
+    out = list()
+    try:
+        sim_net.build()
+        for trial_idx in range(n_trials):
+            sim_net._reset_trial(trial_idx)
+            t_vec, dp_rec = _init_trial(sim_net)
+            h.fcurrent()
+            h.frecord_init()
+            n_times, n_spikes = 0, 0
+            for _ in _psolve_chunks(sim_net, interval):
+                times = t_vec.as_numpy()[n_times:].copy()
+                data = np.empty((len(times), 3))
+                for idx, layer in ((1, 'L2'), (2, 'L5')):
+                    data[:, idx] = np.sum(
+                        [np.zeros(len(times))] +
+                        [rec.as_numpy()[n_times:] for rec in dp_rec[layer]],
+                        axis=0)
+                np.add(data[:, 1], data[:, 2], out=data[:, 0])
+                dpl = Dipole(times, data)
+                _postprocess_dipole(sim_net, dpl, smooth=False)
+                spiketimes = sim_net.spiketimes.as_numpy()[n_spikes:].copy()
+                spikegids = sim_net.spikegids.as_numpy()[n_spikes:].astype(
+                    int)
+                n_times += len(times)
+                n_spikes += len(spiketimes)
+                yield trial_idx, dpl, spiketimes, spikegids
+            out.append(_collect_trial(sim_net, t_vec, dp_rec))
+    finally:
+        pc.gid_clear()
+        pc.nthread(1)
+        pc.done()
+
+    _, spiketimes, spikegids, probe_data, current = zip(*out)
+    net.spiketimes = spiketimes
+    net.spikegids = spikegids
+    net.spikes = Spikes.from_trials(spiketimes, spikegids, net.gid_dict)
+    net.probe_data = _get_probe_data(net.probes, probe_data,
+                                     net.params['dt'])
+    _set_current(net, current[-1])
+    net.timings.extend(sim_net.timings)
+
+
+def simulate_dipole_iter(net, n_trials=1, interval=10.):
+    """Simulate trials and yield the dipole and the spikes as they come.
+
+    Parameters
+    ----------
+    net : Network object
+        The Network object specifying how cells are
+        connected.
+    n_trials : int
+        The number of trials to simulate.
+    interval : float
+        The simulated time in ms between two chunks.
+
+    Returns
+    -------
+    chunks : generator of tuple
+        For each interval of each trial, the index of the trial, the
+        dipole of the interval, and the times and gids of the spikes of
+        the interval.
+
+    Notes
+    -----
+    The trials are simulated one after another in this process with a
+    network built once. The dipole of each interval is renormalized to
+    the baseline, converted to nAm and scaled, but not smoothed since the
+    smoothing of a sample depends on the next ones.
+
+    Once all the chunks have been consumed, the spikes and the
+    recordings of the probes of all the trials are stored in net as with
+    simulate_dipole.
+    """
+    if interval <= 0:
+        raise ValueError('interval must be positive, got %s' % interval)
+    net_kwargs = dict(weight_cutoff=net.weight_cutoff,
+                      n_threads=net.n_threads,
+                      steady_state=net.steady_state,
+                      load_balance=net.load_balance)
+    return _iter_trials(net, n_trials, interval, net_kwargs)
+
+
 class Dipole(object):
     """Dipole class.
 
@@ -151,10 +876,14 @@ class Dipole(object):
         The time vector
     dpl : dict of array
         The dipole with keys 'agg', 'L2' and 'L5'
+    stop_reason : str | None
+        Why the simulation of the trial was stopped before tstop by a
+        stop condition, or None if it was not.
     """
 
     def __init__(self, times, data):  # noqa: D102
         self.units = 'fAm'
+        self.stop_reason = None
         self.N = data.shape[0]
         self.t = times
         self.dpl = {'agg': data[:, 0], 'L2': data[:, 1], 'L5': data[:, 2]}
@@ -176,8 +905,14 @@ class Dipole(object):
         # not smaller than winsz
         if winsz <= 1:
             return
-        for key in self.dpl.keys():
-            self.dpl[key] = _hammfilt(self.dpl[key], winsz)
+        # all the layers are smoothed in one call
+        keys = list(self.dpl.keys())
+        data = _hammfilt(np.array([self.dpl[key] for key in keys]), winsz)
+        for key, this_data in zip(keys, data):
+            if this_data.shape == self.dpl[key].shape:
+                self.dpl[key][:] = this_data
+            else:  # a window longer than the dipole lengthens it
+                self.dpl[key] = this_data
 
     def plot(self, ax=None, layer='agg', show=True):
         """Simple layer-specific plot function.
@@ -209,62 +944,36 @@ class Dipole(object):
             plt.show()
         return ax.get_figure()
 
-    def baseline_renormalize(self, params):
+    def baseline_renormalize(self, params, rest_dipole=None):
         """Only baseline renormalize if the units are fAm.
 
         Parameters
         ----------
         params : dict
             The parameters
+        rest_dipole : dict | None
+            The dipole of the network at rest with keys 'L2' and 'L5'
+            if the network started from its equilibrium. If None, the
+            offsets fitted to the initial transient of the network are
+            subtracted.
         """
         if self.units != 'fAm':
             print("Warning, no dipole renormalization done because units"
                   " were in %s" % (self.units))
             return
 
-        N_pyr_x = params['N_pyr_x']
-        N_pyr_y = params['N_pyr_y']
-        # N_pyr cells in grid. This is PER LAYER
-        N_pyr = N_pyr_x * N_pyr_y
-        # dipole offset calculation: increasing number of pyr
-        # cells (L2 and L5, simultaneously)
-        # with no inputs resulted in an aggregate dipole over the
-        # interval [50., 1000.] ms that
-        # eventually plateaus at -48 fAm. The range over this interval
-        # is something like 3 fAm
-        # so the resultant correction is here, per dipole
-        # dpl_offset = N_pyr * 50.207
-        dpl_offset = {
-            # these values will be subtracted
-            'L2': N_pyr * 0.0443,
-            'L5': N_pyr * -49.0502
-            # 'L5': N_pyr * -48.3642,
-            # will be calculated next, this is a placeholder
-            # 'agg': None,
-        }
-        # L2 dipole offset can be roughly baseline shifted over
-        # the entire range of t
-        self.dpl['L2'] -= dpl_offset['L2']
-        # L5 dipole offset should be different for interval [50., 500.]
-        # and then it can be offset
-        # slope (m) and intercept (b) params for L5 dipole offset
-        # uncorrected for N_cells
-        # these values were fit over the range [37., 750.)
-        m = 3.4770508e-3
-        b = -51.231085
-        # these values were fit over the range [750., 5000]
-        t1 = 750.
-        m1 = 1.01e-4
-        b1 = -48.412078
-        # piecewise normalization
-        self.dpl['L5'][self.t <= 37.] -= dpl_offset['L5']
-        self.dpl['L5'][(self.t > 37.) & (self.t < t1)] -= N_pyr * \
-            (m * self.t[(self.t > 37.) & (self.t < t1)] + b)
-        self.dpl['L5'][self.t >= t1] -= N_pyr * \
-            (m1 * self.t[self.t >= t1] + b1)
+        if rest_dipole is not None:
+            for key in ('L2', 'L5'):
+                self.dpl[key] -= rest_dipole[key]
+            np.add(self.dpl['L2'], self.dpl['L5'], out=self.dpl['agg'])
+            return
+
+        offset_L2, offset_L5 = _get_baseline_offsets(self.t, params)
+        self.dpl['L2'] -= offset_L2
+        self.dpl['L5'] -= offset_L5
         # recalculate the aggregate dipole based on the baseline
-        # normalized ones
-        self.dpl['agg'] = self.dpl['L2'] + self.dpl['L5']
+        # normalized ones, in place to keep the views of the data
+        np.add(self.dpl['L2'], self.dpl['L5'], out=self.dpl['agg'])
 
     def write(self, fname):
         """Write dipole values to a file.
@@ -275,5 +984,268 @@ class Dipole(object):
             Full path to the output file (.txt)
         """
         X = np.r_[[self.t, self.dpl['agg'], self.dpl['L2'], self.dpl['L5']]].T
-        np.savetxt('dpl2.txt', X, fmt=['%3.3f', '%5.4f', '%5.4f', '%5.4f'],
+        np.savetxt(fname, X, fmt=['%3.3f', '%5.4f', '%5.4f', '%5.4f'],
                    delimiter='\t')
+
+
+class Dipoles(object):
+    """The dipoles of several trials in one array.
+
+    The post-processing is applied to all the trials and layers at once.
+
+    Parameters
+    ----------
+    times : array (n_times,)
+        The time vector
+    data : array (n_trials, 3, n_times)
+        The data. The layers are 'agg', 'L2' and 'L5'.
+    units : str
+        The units of the data, 'fAm' or 'nAm'.
+
+    Attributes
+    ----------
+    t : array
+        The time vector
+    data : array (n_trials, 3, n_times)
+        The dipoles of each trial and layer.
+    layers : list of str
+        The layers of the second axis of data.
+    units : str
+        The units of the data.
+    """
+
+    layers = ['agg', 'L2', 'L5']
+
+    def __init__(self, times, data, units='fAm'):  # noqa: D102
+        data = np.asarray(data, dtype=float)
+        if data.ndim != 3 or data.shape[1:] != (3, len(times)):
+            raise ValueError('data must be of shape (n_trials, 3, %d), got '
+                             '%s' % (len(times), data.shape))
+        self.t = times
+        self.data = data
+        self.units = units
+
+    @classmethod
+    def from_dipoles(cls, dpls):
+        """Stack the dipoles of several trials.
+
+        Parameters
+        ----------
+        dpls : list of instance of Dipole
+            The dipoles, e.g. returned by simulate_dipole. They must have
+            the same times and units.
+
+        Returns
+        -------
+        dipoles : instance of Dipoles
+            The stacked dipoles.
+        """
+        if len(dpls) == 0:
+            raise ValueError('dpls must contain at least one dipole')
+        for dpl in dpls[1:]:
+            if not np.array_equal(dpl.t, dpls[0].t):
+                raise ValueError('The dipoles must have the same times')
+            if dpl.units != dpls[0].units:
+                raise ValueError('The dipoles must have the same units, '
+                                 'got %s and %s' % (dpls[0].units, dpl.units))
+        data = np.array([[dpl.dpl[layer] for layer in cls.layers]
+                         for dpl in dpls])
+        return cls(dpls[0].t, data, units=dpls[0].units)
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __getitem__(self, idx):
+        """Get the dipole of a trial.
+
+        Its data is a view of the array, which the post-processing of the
+        dipole modifies in place, except smooth with a window longer than
+        the dipole which gives new arrays.
+        """
+        dpl = Dipole(self.t, self.data[idx].T)
+        dpl.units = self.units
+        return dpl
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __repr__(self):
+        class_name = self.__class__.__name__
+        return '<%s | %d trials, %d times, %s>' % (
+            class_name, len(self), len(self.t), self.units)
+
+    def convert_fAm_to_nAm(self):
+        """Convert the units from fAm to nAm."""
+        self.data *= 1e-6
+        self.units = 'nAm'
+
+    def scale(self, fctr):
+        """Scale the dipoles of all the trials."""
+        self.data *= fctr
+        return fctr
+
+    def smooth(self, winsz):
+        """Smooth the dipoles with a Hamming window of winsz samples."""
+        if winsz <= 1:
+            return
+        data = _hammfilt(self.data, winsz)
+        if data.shape == self.data.shape:
+            self.data[...] = data
+        else:  # a window longer than the dipoles lengthens them
+            self.data = data
+
+    def baseline_renormalize(self, params, rest_dipole=None):
+        """Only baseline renormalize if the units are fAm.
+
+        Parameters
+        ----------
+        params : dict
+            The parameters
+        rest_dipole : dict | None
+            The dipole of the network at rest with keys 'L2' and 'L5'
+            if the network started from its equilibrium. If None, the
+            offsets fitted to the initial transient of the network are
+            subtracted.
+        """
+        if self.units != 'fAm':
+            print("Warning, no dipole renormalization done because units"
+                  " were in %s" % (self.units))
+            return
+
+        if rest_dipole is not None:
+            self.data[:, 1] -= rest_dipole['L2']
+            self.data[:, 2] -= rest_dipole['L5']
+        else:
+            offset_L2, offset_L5 = _get_baseline_offsets(self.t, params)
+            self.data[:, 1] -= offset_L2
+            self.data[:, 2] -= offset_L5
+        np.add(self.data[:, 1], self.data[:, 2], out=self.data[:, 0])
+
+    def mean(self):
+        """Average the dipoles over the trials.
+
+        Returns
+        -------
+        dpl : instance of Dipole
+            The average dipole.
+        """
+        return self._reduce(self.data.mean(axis=0))
+
+    def std(self):
+        """Compute the standard deviation of the dipoles over the trials.
+
+        Returns
+        -------
+        dpl : instance of Dipole
+            The standard deviation of the dipoles.
+        """
+        return self._reduce(self.data.std(axis=0))
+
+    def percentile(self, q):
+        """Compute percentiles of the dipoles over the trials.
+
+        Parameters
+        ----------
+        q : float | list of float
+            The percentiles between 0 and 100.
+
+        Returns
+        -------
+        dpl : instance of Dipole | list of instance of Dipole
+            The percentiles of the dipoles.
+        """
+        data = np.percentile(self.data, q, axis=0)
+        if np.ndim(q) == 0:
+            return self._reduce(data)
+        return [self._reduce(this_data) for this_data in data]
+
+    def save(self, fname):
+        """Save the dipoles to a binary file.
+
+        The file contains a header with the units and the numbers of
+        trials and times, the times and the dipoles of all the trials as
+        little-endian float64. It is read with read_dipoles.
+
+        Parameters
+        ----------
+        fname : str
+            The name of the file, e.g. 'dpl.dpl'.
+        """
+        n_trials, n_layers, n_times = self.data.shape
+        header = json.dumps(dict(n_trials=n_trials, n_times=n_times,
+                                 layers=self.layers, units=self.units,
+                                 dtype='<f8')).encode('utf-8')
+        n_bytes = _DIPOLE_PREAMBLE.size + len(header)
+        header += b' ' * (-n_bytes % _DIPOLE_ALIGN)
+        with open(fname, 'wb') as fid:
+            fid.write(_DIPOLE_PREAMBLE.pack(_DIPOLE_MAGIC, _DIPOLE_VERSION,
+                                            len(header)))
+            fid.write(header)
+            np.ascontiguousarray(self.t, dtype='<f8').tofile(fid)
+            np.ascontiguousarray(self.data, dtype='<f8').tofile(fid)
+
+    def _reduce(self, data):
+        """Make a dipole of data of shape (3, n_times)."""
+        dpl = Dipole(self.t, data.T)
+        dpl.units = self.units
+        return dpl
+
+
+def read_dipoles(fname, trials=None, tmin=None, tmax=None):
+    """Read the dipoles saved with Dipoles.save.
+
+    The file is memory-mapped so that only the selected trials and times
+    are read.
+
+    Parameters
+    ----------
+    fname : str
+        The name of the file.
+    trials : list of int | None
+        The indices of the trials to read. If None, all the trials are
+        read.
+    tmin : float | None
+        The first time to read in ms. If None, the dipoles are read from
+        the start.
+    tmax : float | None
+        The last time to read in ms (included). If None, the dipoles are
+        read until the end.
+
+    Returns
+    -------
+    dipoles : instance of Dipoles
+        The dipoles of the selected trials and times.
+    """
+    with open(fname, 'rb') as fid:
+        preamble = fid.read(_DIPOLE_PREAMBLE.size)
+        if len(preamble) < _DIPOLE_PREAMBLE.size:
+            raise ValueError('%s is not a file of dipoles' % fname)
+        magic, version, header_len = _DIPOLE_PREAMBLE.unpack(preamble)
+        if magic != _DIPOLE_MAGIC:
+            raise ValueError('%s is not a file of dipoles' % fname)
+        if version > _DIPOLE_VERSION:
+            raise ValueError('%s was written by a newer version of hnn_core '
+                             '(format %d)' % (fname, version))
+        header = json.loads(fid.read(header_len).decode('utf-8'))
+
+    n_trials, n_times = header['n_trials'], header['n_times']
+    offset = _DIPOLE_PREAMBLE.size + header_len
+    times = np.memmap(fname, dtype=header['dtype'], mode='r', offset=offset,
+                      shape=(n_times,))
+    data = np.memmap(fname, dtype=header['dtype'], mode='r',
+                     offset=offset + times.nbytes,
+                     shape=(n_trials, len(header['layers']), n_times))
+
+    if trials is None:
+        trials = slice(None)
+    else:
+        trials = np.asarray(trials, dtype=int)
+        if np.any((trials < 0) | (trials >= n_trials)):
+            raise ValueError('trials must be between 0 and %d, got %s'
+                             % (n_trials - 1, trials))
+    start = 0 if tmin is None else np.searchsorted(times, tmin, 'left')
+    stop = n_times if tmax is None else np.searchsorted(times, tmax, 'right')
+    times = np.array(times[start:stop])
+    data = np.array(data[trials, :, start:stop])
+    return Dipoles(times, data, units=header['units'])
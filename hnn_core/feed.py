@@ -7,6 +7,18 @@ import numpy as np
 from neuron import h
 
 
+# the parameters of each type of feed that its event times depend on, as
+# the keys of its p_ext and the indices in the tuples of the cell types
+_EVENT_TIME_PARAMS = {
+    'extinput': (('f_input', 't0', 'tstop', 'stdev', 'events_per_cycle',
+                  'prng_seedcore', 'distribution', 'repeats', 't0_stdev'),
+                 ()),
+    'evoked': (('t0', 'numspikes', 'prng_seedcore', 'sync_evinput'), (3,)),
+    'extgauss': (('prng_seedcore',), (3, 4)),
+    'extpois': (('prng_seedcore', 't_interval'), (3,))
+}
+
+
 class ExtFeed(object):
     """"The ExtFeed class.
 
@@ -23,6 +35,9 @@ class ExtFeed(object):
         usually, p_ext is a dict of cell types
     gid : int
         The cell ID.
+    event_times : array | None
+        The event times of the feed. If None, they are generated from
+        its seed.
 
     Attributes
     ----------
@@ -32,7 +47,7 @@ class ExtFeed(object):
         The cell ID
     """
 
-    def __init__(self, ty, celltype, p_ext, gid):
+    def __init__(self, ty, celltype, p_ext, gid, event_times=None):
         # VecStim setup
         self.eventvec = h.Vector()
         self.vs = h.VecStim()
@@ -43,7 +58,7 @@ class ExtFeed(object):
         self.gid = gid
         self.set_prng()  # sets seeds for random num generator
         # sets event times into self.eventvec and plays into self.vs (VecStim)
-        self.set_event_times()
+        self.set_event_times(event_times=event_times)
 
     def __repr__(self):
         class_name = self.__class__.__name__
@@ -52,21 +67,10 @@ class ExtFeed(object):
 
     def set_prng(self, seed=None):
         if seed is None:  # no seed specified then use p_ext to determine seed
-            # random generator for this instance
-            # qnd hack to make the seeds the same across all gids
-            # for just evoked
-            if self.ty.startswith(('evprox', 'evdist')):
-                if self.p_ext['sync_evinput']:
-                    self.seed = self.p_ext['prng_seedcore']
-                else:
-                    self.seed = self.p_ext['prng_seedcore'] + self.gid
-            elif self.ty.startswith('extinput'):
-                # seed for events assuming a given start time
-                self.seed = self.p_ext['prng_seedcore'] + self.gid
+            self.seed = _get_seed(self.ty, self.p_ext, self.gid)
+            if self.ty.startswith('extinput'):
                 # separate seed for start times
                 self.seed2 = self.p_ext['prng_seedcore']
-            else:
-                self.seed = self.p_ext['prng_seedcore'] + self.gid
         else:  # if seed explicitly specified use it
             self.seed = seed
             if hasattr(self, 'seed2'):
@@ -76,106 +80,30 @@ class ExtFeed(object):
             self.prng2 = np.random.RandomState(self.seed2)
         # print('ty,seed:',self.ty,self.seed)
 
-    def set_event_times(self, inc_evinput=0.0):
-        # print('self.p_ext:',self.p_ext)
-        # each of these methods creates self.eventvec for playback
-        if self.ty == 'extpois':
-            self.__create_extpois()
-        elif self.ty.startswith(('evprox', 'evdist')):
-            self.__create_evoked(inc_evinput)
-        elif self.ty == 'extgauss':
-            self.__create_extgauss()
+    def set_event_times(self, inc_evinput=0.0, event_times=None):
+        """Set the event times of the feed and play them into its VecStim.
+
+        Parameters
+        ----------
+        inc_evinput : float
+            The time in ms added to the mean time of an evoked feed.
+        event_times : array | None
+            The event times, e.g., generated for all the feeds of a type
+            at once by _create_event_times. If None, they are generated
+            from the seed of the feed.
+        """
+        if event_times is not None:
+            self.eventvec.from_python(event_times)
         elif self.ty == 'extinput':
             self.__create_extinput()
+        else:
+            event_times = _create_event_times(
+                self.ty, self.p_ext, [self.celltype], [self.seed],
+                inc_evinput)[0]
+            self.eventvec.from_python(event_times)
         # load eventvec into VecStim object
         self.vs.play(self.eventvec)
 
-    # based on cdf for exp wait time distribution from unif [0, 1)
-    # returns in ms based on lamtha in Hz
-    def __t_wait(self, lamtha):
-        return -1000. * np.log(1. - self.prng.rand()) / lamtha
-
-    # new external pois designation
-    def __create_extpois(self):
-        # print("__create_extpois")
-        if self.p_ext[self.celltype][0] <= 0.0 and \
-                self.p_ext[self.celltype][1] <= 0.0:
-            return False  # 0 ampa and 0 nmda weight
-        # check the t interval
-        t0 = self.p_ext['t_interval'][0]
-        T = self.p_ext['t_interval'][1]
-        lamtha = self.p_ext[self.celltype][3]  # index 3 is frequency (lamtha)
-        # values MUST be sorted for VecStim()!
-        # start the initial value
-        if lamtha > 0.:
-            t_gen = t0 + self.__t_wait(lamtha)
-            val_pois = np.array([])
-            if t_gen < T:
-                np.append(val_pois, t_gen)
-            # vals are guaranteed to be monotonically increasing, no need to
-            # sort
-            while t_gen < T:
-                # so as to not clobber confusingly base off of t_gen ...
-                t_gen += self.__t_wait(lamtha)
-                if t_gen < T:
-                    val_pois = np.append(val_pois, t_gen)
-        else:
-            val_pois = np.array([])
-        # checks the distribution stats
-        # if len(val_pois):
-        #     xdiff = np.diff(val_pois/1000)
-        #     print(lamtha, np.mean(xdiff), np.var(xdiff), 1/lamtha**2)
-        # Convert array into nrn vector
-        # if len(val_pois)>0: print('val_pois:',val_pois)
-        self.eventvec.from_python(val_pois)
-        return self.eventvec.size() > 0
-
-    # mu and sigma vals come from p
-    def __create_evoked(self, inc=0.0):
-        if self.celltype in self.p_ext.keys():
-            # assign the params
-            mu = self.p_ext['t0'] + inc
-            sigma = self.p_ext[self.celltype][3]  # index 3 is sigma_t_ (stdev)
-            numspikes = int(self.p_ext['numspikes'])
-            # print('mu:',mu,'sigma:',sigma,'inc:',inc)
-            # if a non-zero sigma is specified
-            if sigma:
-                val_evoked = self.prng.normal(mu, sigma, numspikes)
-            else:
-                # if sigma is specified at 0
-                val_evoked = np.array([mu] * numspikes)
-            val_evoked = val_evoked[val_evoked > 0]
-            # vals must be sorted
-            val_evoked.sort()
-            # print('__create_evoked val_evoked:',val_evoked)
-            self.eventvec.from_python(val_evoked)
-        else:
-            # return an empty eventvec list
-            self.eventvec.from_python([])
-        return self.eventvec.size() > 0
-
-    def __create_extgauss(self):
-        # assign the params
-        if self.p_ext[self.celltype][0] <= 0.0 and \
-                self.p_ext[self.celltype][1] <= 0.0:
-            return False  # 0 ampa and 0 nmda weight
-        # print('gauss params:',self.p_ext[self.celltype])
-        mu = self.p_ext[self.celltype][3]
-        sigma = self.p_ext[self.celltype][4]
-        # mu and sigma values come from p
-        # one single value from Gaussian dist.
-        # values MUST be sorted for VecStim()!
-        val_gauss = self.prng.normal(mu, sigma, 50)
-        # val_gauss = np.random.normal(mu, sigma, 50)
-        # remove non-zero values brute force-ly
-        val_gauss = val_gauss[val_gauss > 0]
-        # sort values - critical for nrn
-        val_gauss.sort()
-        # if len(val_gauss)>0: print('val_gauss:',val_gauss)
-        # Convert array into nrn vector
-        self.eventvec.from_python(val_gauss)
-        return self.eventvec.size() > 0
-
     def __create_extinput(self):
         """Creates the ongoing external inputs (rhythmic)."""
         # print("__create_extinput")
@@ -254,3 +182,299 @@ class ExtFeed(object):
         nc = h.NetCon(self.vs, None)  # why is target always nil??
         nc.threshold = threshold
         return nc
+
+
+def _get_seed(ty, p_ext, gid):
+    """Get the seed of the events of a feed.
+
+    The evoked feeds with sync_evinput share the same seed so that all
+    the cells get the same events.
+    """
+    if ty.startswith(('evprox', 'evdist')) and p_ext['sync_evinput']:
+        return p_ext['prng_seedcore']
+    return p_ext['prng_seedcore'] + gid
+
+
+def _draw(seeds, func):
+    """Draw from a random generator seeded with each seed.
+
+    The draws are the same for the same seed and are done once. One
+    generator per feed keeps the events of a feed independent of the
+    other feeds, at the cost of a loop over the seeds.
+    """
+    seeds, inverse = np.unique(seeds, return_inverse=True)
+    draws = np.array([func(np.random.RandomState(seed)) for seed in seeds])
+    return draws[inverse]
+
+
+def _split_events(times):
+    """Keep the positive event times of each feed and sort them.
+
+    Parameters
+    ----------
+    times : array (n_feeds, n_events)
+        The event times of each feed.
+
+    Returns
+    -------
+    event_times : list of array
+        The event times of each feed, as views of one contiguous array.
+    """
+    times = np.sort(times, axis=1)
+    mask = times > 0
+    return np.split(times[mask], np.cumsum(mask.sum(axis=1))[:-1])
+
+
+def _create_event_times(ty, p_ext, celltypes, seeds, inc_evinput=0.0):
+    """Generate the event times of several feeds of the same type at once.
+
+    Parameters
+    ----------
+    ty : str
+        The feed type. Can be 'extpois', 'evprox', 'evdist' or
+        'extgauss'.
+    p_ext : dict
+        The parameters of the feeds.
+    celltypes : list of str
+        The cell type driven by each feed.
+    seeds : list of int
+        The seed of each feed.
+    inc_evinput : float
+        The time in ms added to the mean time of the evoked feeds.
+
+    Returns
+    -------
+    event_times : list of array
+        The sorted event times of each feed, as views of one contiguous
+        array.
+
+    Notes
+    -----
+    The draws of each feed come from its own random generator, so that
+    the event times are the same as if the feed were generated alone.
+    The computations on the draws are done for all the feeds at once.
+    """
+    if len(seeds) == 0:
+        return list()
+    celltypes, seeds = np.asarray(celltypes), np.asarray(seeds, dtype=int)
+    # the feeds of each cell type share their parameters
+    idxs = dict((celltype, np.where(celltypes == celltype)[0])
+                for celltype in np.unique(celltypes))
+    times = dict()
+    for celltype, idx in idxs.items():
+        if celltype not in p_ext:
+            continue
+        weights = p_ext[celltype]
+        if ty.startswith(('evprox', 'evdist')):
+            mu, sigma = p_ext['t0'] + inc_evinput, weights[3]
+            numspikes = int(p_ext['numspikes'])
+            if sigma:
+                times[celltype] = _draw(seeds[idx], lambda prng: prng.normal(
+                    mu, sigma, numspikes))
+            else:
+                times[celltype] = np.full((len(idx), numspikes), float(mu))
+        elif not _has_weight(ty, weights[:2]):
+            continue  # no positive ampa or nmda weight
+        elif ty == 'extgauss':
+            mu, sigma = weights[3], weights[4]
+            times[celltype] = _draw(seeds[idx], lambda prng: prng.normal(
+                mu, sigma, 50))
+        elif ty == 'extpois':
+            t0, T = p_ext['t_interval']
+            times[celltype] = _create_pois_times(seeds[idx], t0, T,
+                                                 weights[3])
+
+    events = [np.zeros(0)] * len(seeds)
+    for celltype, type_times in times.items():
+        for idx, feed_times in zip(idxs[celltype],
+                                   _split_events(type_times)):
+            events[idx] = feed_times
+    # one contiguous array for all the feeds
+    counts = [len(feed_times) for feed_times in events]
+    return np.split(np.concatenate(events), np.cumsum(counts)[:-1])
+
+
+def _create_pois_times(seeds, t0, T, lamtha):
+    """Generate the event times of poisson feeds with the same rate.
+
+    Parameters
+    ----------
+    seeds : array of int
+        The seed of each feed.
+    t0 : float
+        The start time in ms of the events.
+    T : float
+        The stop time in ms of the events.
+    lamtha : float
+        The rate of the events in Hz.
+
+    Returns
+    -------
+    times : array (n_feeds, n_events)
+        The event times of each feed, padded with -1.
+    """
+    if lamtha <= 0. or T <= t0:
+        return np.zeros((len(seeds), 0))
+    # the waiting times are drawn in blocks that contain all the events
+    # of a feed with a high probability. The draws are the same as one
+    # draw per event since the generators are sequential.
+    n_events = lamtha * (T - t0) / 1000.
+    n_draws = int(n_events + 5 * np.sqrt(n_events)) + 10
+    prngs = [np.random.RandomState(seed) for seed in seeds]
+    times = np.full((len(seeds), 1), float(t0))
+    while np.any(times[:, -1] < T):
+        waits = np.array([-1000. * np.log(1. - prng.rand(n_draws)) / lamtha
+                          for prng in prngs])
+        times = np.concatenate(
+            (times, np.cumsum(np.c_[times[:, -1], waits], axis=1)[:, 1:]),
+            axis=1)
+    # the first event is not kept, as in HNN
+    times = times[:, 2:]
+    times[times >= T] = -1.
+    return times
+
+
+def _drop_event_time_params(ty, p_ext):
+    """Copy the parameters of a feed without those of its event times.
+
+    Parameters
+    ----------
+    ty : str
+        The feed type as in ExtFeed.
+    p_ext : dict
+        The parameters of the feed as passed to ExtFeed.
+
+    Returns
+    -------
+    p_ext : dict
+        The parameters that change the feed in other ways than its event
+        times, e.g., its weights and delays.
+    """
+    if ty.startswith(('evprox', 'evdist')):
+        ty = 'evoked'
+    keys, idxs = _EVENT_TIME_PARAMS[ty]
+    p_ext = dict((key, value) for key, value in p_ext.items()
+                 if key not in keys)
+    for celltype in ('L2_pyramidal', 'L2_basket', 'L5_pyramidal',
+                     'L5_basket'):
+        if celltype in p_ext:
+            p_ext[celltype] = tuple(value for idx, value
+                                    in enumerate(p_ext[celltype])
+                                    if idx not in idxs)
+    return p_ext
+
+
+def _has_weight(ty, weights):
+    """Whether the weights of a feed let it drive the cells.
+
+    The gaussian and poisson feeds emit no event unless one of their
+    weights is positive. The other feeds emit their events whatever the
+    weights, which drive the cells unless they are all zero.
+
+    Parameters
+    ----------
+    ty : str
+        The feed type as in ExtFeed.
+    weights : list of float
+        The ampa and nmda weights of the feed.
+
+    Returns
+    -------
+    has_weight : bool
+        Whether the feed drives the cells.
+    """
+    if ty in ('extgauss', 'extpois'):
+        return any(weight > 0. for weight in weights)
+    return any(weight != 0. for weight in weights)
+
+
+def _is_random(ty, p_ext):
+    """Whether the event times of a feed depend on its seed.
+
+    Parameters
+    ----------
+    ty : str
+        The feed type as in ExtFeed.
+    p_ext : dict
+        The parameters of the feed as passed to ExtFeed.
+
+    Returns
+    -------
+    is_random : bool
+        False if the feed drives the cells with the same events
+        whatever the seed, e.g., if all its stdevs or weights are zero.
+    """
+    celltypes = ('L2_pyramidal', 'L2_basket', 'L5_pyramidal', 'L5_basket')
+    if ty == 'extinput':
+        weights = [p_ext[key][0] for key in p_ext
+                   if key.endswith(('_ampa', '_nmda'))]
+        if not p_ext['f_input'] or not _has_weight(ty, weights):
+            return False
+        return (p_ext['t0'] == -1 or p_ext['t0_stdev'] > 0. or
+                p_ext['distribution'] == 'uniform' or
+                (p_ext['distribution'] == 'normal' and
+                 bool(p_ext['stdev'])))
+    for celltype in celltypes:
+        if celltype not in p_ext:
+            continue
+        weights = p_ext[celltype]
+        if not _has_weight(ty, weights[:2]):
+            continue
+        if ty.startswith(('evprox', 'evdist')):
+            if weights[3] and p_ext['numspikes'] > 0:
+                return True
+        elif ty == 'extgauss':
+            if weights[4]:
+                return True
+        elif ty == 'extpois':
+            t0, T = p_ext['t_interval']
+            if weights[3] > 0. and T > t0:
+                return True
+    return False
+
+
+def _get_active_feeds(p_ext, p_unique):
+    """Get the feeds that can drive the cells.
+
+    A feed is inactive if its weights do not drive the cells (see
+    _has_weight) or if it emits no event whatever the seed. The inactive
+    feeds are not created, nor are their connections.
+
+    Parameters
+    ----------
+    p_ext : list of dict
+        The parameters of the rhythmic feeds (extinput).
+    p_unique : dict of dict
+        The parameters of the feeds that are unique to each cell.
+
+    Returns
+    -------
+    active_ext : list of bool
+        Whether each rhythmic feed is active.
+    active_unique : dict of set
+        The cell types driven by each unique feed.
+    """
+    celltypes = ('L2_pyramidal', 'L2_basket', 'L5_pyramidal', 'L5_basket')
+    active_ext = list()
+    for p_src in p_ext:
+        weights = [p_src[key][0] for key in p_src
+                   if key.endswith(('_ampa', '_nmda'))]
+        active_ext.append(_has_weight('extinput', weights))
+    active_unique = dict()
+    for ty, p_type in p_unique.items():
+        active_unique[ty] = set()
+        for celltype in celltypes:
+            if celltype not in p_type:
+                continue
+            weights = p_type[celltype]
+            if not _has_weight(ty, weights[:2]):
+                continue
+            if ty.startswith(('evprox', 'evdist')):
+                if p_type['numspikes'] <= 0:
+                    continue
+            elif ty == 'extpois':
+                t0, T = p_type['t_interval']
+                if weights[3] <= 0. or T <= t0:
+                    continue
+            active_unique[ty].add(celltype)
+    return active_ext, active_unique
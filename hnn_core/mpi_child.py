@@ -0,0 +1,31 @@
+"""Script run by each MPI process of a simulation."""
+
+import sys
+import pickle
+
+
+def _run():
+    """Simulate the trials pickled in sys.argv[1] into sys.argv[2].
+
+    All the processes build their part of the network and simulate
+    the trials together. The results are gathered on rank 0 which
+    writes them.
+    """
+    from neuron import h
+
+    from .dipole import _clone_and_simulate
+    from .parallel import rank
+
+    in_fname, out_fname = sys.argv[-2:]
+    with open(in_fname, 'rb') as fid:
+        (params, trial_idxs, net_kwargs, checkpoint, trace_memory,
+         record, progress_interval) = pickle.load(fid)
+
+    out = _clone_and_simulate(params, trial_idxs, net_kwargs, checkpoint,
+                              trace_memory, record, progress_interval)
+
+    if rank == 0:
+        with open(out_fname, 'wb') as fid:
+            pickle.dump(out, fid)
+    # finalizes MPI
+    h.quit()
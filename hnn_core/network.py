@@ -3,15 +3,20 @@
 # Authors: Mainak Jas <mainak.jas@telecom-paristech.fr>
 #          Sam Neymotin <samnemo@gmail.com>
 
+import os
+import os.path as op
 import itertools as it
+import fnmatch
+
 import numpy as np
 
 from neuron import h
 
-from .feed import ExtFeed
+from .feed import ExtFeed, _get_active_feeds, _get_seed, _create_event_times
 from .pyramidal import L2Pyr, L5Pyr
 from .basket import L2Basket, L5Basket
 from .params import create_pext
+from .timing import Timings
 
 
 class Network(object):
@@ -23,6 +28,37 @@ class Network(object):
         The parameters
     n_jobs : int
         The number of jobs to run in parallel
+    weight_cutoff : float | dict
+        Connections between cells whose weight relative to the weight
+        between two cells at the same position, exp(-d**2 / lamtha**2),
+        is below weight_cutoff are not created. This is equivalent to a
+        maximum radius of lamtha * sqrt(-log(weight_cutoff)) for each
+        projection. If dict, the keys are the projections, e.g.
+        'L2Pyr_L5Pyr' for connections from L2Pyr to L5Pyr cells, and
+        projections which are not in the dict are not pruned.
+        Defaults to 0. which creates all the connections.
+    n_threads : int
+        The number of threads used by NEURON to simulate the cells of
+        this node. The cells are distributed over the threads to balance
+        their number of segments. The delays of all the connections must
+        then be at least dt, otherwise build raises a ValueError.
+    steady_state : bool | str
+        If True, the cells start from the equilibrium of each cell type
+        instead of the hard-coded resting voltages of state_init. The
+        equilibrium is computed once per set of biophysical parameters
+        by simulating an isolated cell, in a new process if the cells of
+        other networks exist in this one. If str, the
+        equilibrium is also cached in this directory. Since the network
+        is then at rest from the start, the feeds can start earlier and
+        tstop be shortened by the duration of the initial transient.
+    load_balance : bool | str
+        If True, the cells are distributed over the MPI processes to
+        balance their computational cost estimated by NEURON's
+        LoadBalance instead of round robin. A pyramidal cell costs far
+        more than a basket cell. If str, the partition is read from this
+        file if it was computed for the same numbers of cells and
+        processes, and saved to it otherwise. This only matters with
+        more than one process.
 
     Attributes
     ----------
@@ -36,22 +72,76 @@ class Network(object):
             'evprox1', 'evprox2', etc.
             'evdist1', etc.
             'extgauss', 'extpois'
-    spiketimes : tuple (n_trials, ) of list of float
+    spiketimes : tuple (n_trials, ) of array of float
         Each element of the tuple is a trial.
-        The list contains the time stamps of spikes.
-    spikegids : tuple (n_trials, ) of list of float
+        The array contains the time stamps of spikes.
+    spikegids : tuple (n_trials, ) of array of int
         Each element of the tuple is a trial.
-        The list contains the cell IDs of neurons that spiked.
+        The array contains the cell IDs of neurons that spiked.
+    spikes : instance of Spikes | None
+        The spikes of all the trials indexed by trial, gid and cell type.
+        None until the network is simulated.
+    current : dict of h.Vector
+        The somatic currents summed over the L2 and L5 pyramidal cells,
+        with keys 'L2Pyr_soma' and 'L5Pyr_soma'. After simulate_dipole,
+        those of the last trial.
+    n_pruned : dict
+        The number of connections between cells on this node that were
+        not created because of weight_cutoff, by projection. Available
+        after the network is built.
+    timings : instance of Timings
+        The durations and memory of the phases of the construction and
+        build of the network, and the numbers of NEURON objects once it
+        is built. simulate_dipole adds those of all the processes and
+        trials of the simulation.
+    probes : dict of dict
+        The probes added with add_probe.
+    probe_data : dict of ProbeData
+        The recordings of each probe in all the trials. Empty until the
+        network is simulated.
     """
 
-    def __init__(self, params, n_jobs=1):
+    def __init__(self, params, n_jobs=1, weight_cutoff=0., n_threads=1,
+                 steady_state=False, load_balance=False):
         from .parallel import create_parallel_context
         # setup simulation (ParallelContext)
         create_parallel_context(n_jobs=n_jobs)
 
+        cutoffs = weight_cutoff
+        if not isinstance(weight_cutoff, dict):
+            cutoffs = {'all': weight_cutoff}
+        for proj, cutoff in cutoffs.items():
+            if proj != 'all' and not fnmatch.filter(params.keys(),
+                                                    'gbar_%s*' % proj):
+                raise ValueError('Unknown projection %s in weight_cutoff'
+                                 % proj)
+            if not 0. <= cutoff < 1.:
+                raise ValueError('weight_cutoff must be in [0, 1). Got %s'
+                                 % cutoff)
+        self.weight_cutoff = weight_cutoff
+        if not isinstance(n_threads, int) or n_threads < 1:
+            raise ValueError('n_threads must be a positive integer. Got %s'
+                             % n_threads)
+        self.n_threads = n_threads
+        self.steady_state = steady_state
+        self.load_balance = load_balance
+        self.timings = Timings()
+        self.spikes = None
+        self.probes = dict()
+        self.probe_data = dict()
+        # the vectors recording the probes in the trial being simulated
+        self._probe_recs = dict()
+        # the trial being simulated, None until the first one
+        self._trial_idx = None
+        # the variant of simulate_forks being simulated, if any
+        self._variant_idx = None
+
         # set the params internally for this net
         # better than passing it around like ...
         self.params = params
+        # seeds of the first trial, later trials overwrite them
+        self._prng_seedcores = dict((key, params[key]) for key in params
+                                    if fnmatch.fnmatch(key, 'prng_*'))
         # Number of time points
         # Originally used to create the empty vec for synaptic currents,
         # ensuring that they exist on this node irrespective of whether
@@ -80,8 +170,14 @@ class Network(object):
         # Global number of external inputs ... automatic counting
         # makes more sense
         # p_unique represent ext inputs that are going to go to each cell
-        self.p_ext, self.p_unique = create_pext(self.params,
-                                                self.params['tstop'])
+        with self.timings.phase('create_pext'):
+            self.p_ext, self.p_unique = create_pext(self.params,
+                                                    self.params['tstop'])
+        # the feeds that cannot drive any cell keep their gids so that
+        # the seeds of the other feeds do not change, but they are not
+        # created
+        self._active_ext, self._active_unique = _get_active_feeds(
+            self.p_ext, self.p_unique)
         self.N_extinput = len(self.p_ext)
         # Source list of names
         # in particular order (cells, extinput, alpha names of unique inputs)
@@ -106,7 +202,8 @@ class Network(object):
         # assign gid to hosts, creates list of gids for this node in _gid_list
         # _gid_list length is number of cells assigned to this id()
         self._gid_list = []
-        self._gid_assign()
+        with self.timings.phase('gid_assign'):
+            self._gid_assign()
         # create cells (and create self.origin in create_cells_pyr())
         self.cells = []
         self.extinput_list = []
@@ -124,20 +221,80 @@ class Network(object):
               % (self.N['L2_basket'], self.N['L5_basket']))
         return '<%s | %s>' % (class_name, s)
 
+    def add_probe(self, name, var, cell_type=None, gids=None,
+                  section='soma', loc=0.5, synapse=None, dt=None):
+        """Record a variable of some cells during the simulation.
+
+        Parameters
+        ----------
+        name : str
+            The name of the probe in net.probe_data.
+        var : str
+            The variable to record. Either a range variable of the
+            section, e.g. 'v' for the voltage in mV or 'ina', 'ik' and
+            'ica' for the ion currents in mA/cm2, a variable of the
+            synapse, e.g. 'g' for the conductance in uS or 'i' for the
+            current in nA, or 'dipole' for the dipole of each pyramidal
+            cell in fAm.
+        cell_type : str | list of str | None
+            The cell types to record, e.g. 'L5_pyramidal'. If None, the
+            cells are given by gids.
+        gids : list of int | None
+            The gids of the cells to record. If None, all the cells of
+            cell_type are recorded.
+        section : str
+            The section to record, e.g. 'soma' or 'apical_tuft'.
+        loc : float
+            The location in the section between 0 and 1.
+        synapse : str | None
+            The synapse to record, e.g. 'soma_gabaa' or
+            'apicaltuft_nmda'. If None, var is a variable of the section.
+        dt : float | None
+            The sampling interval in ms. It must be a multiple of the time
+            step. If None, the variable is sampled at every time step.
+
+        Notes
+        -----
+        The probes must be added before the network is simulated. The
+        recording of each trial is copied into one array per probe
+        when the trial is done. With n_threads > 1, the probes are
+        recorded at every time step and decimated afterwards.
+        """
+        from .probe import _check_probe
+
+        self.probes[name] = _check_probe(self, name, var, cell_type, gids,
+                                         section, loc, synapse, dt)
+
     def build(self):
         """Building the network in NEURON."""
 
         print('Building the NEURON model')
         from neuron import h
-        self._create_all_src()
-        self.state_init()
-        self._parnet_connect()
+        if self.steady_state:
+            # before creating the cells of this network, since the isolated
+            # cells are simulated in the same process
+            with self.timings.phase('steady_state'):
+                self._load_steady_states()
+        with self.timings.phase('create_cells'):
+            self._create_all_src()
+        with self.timings.phase('partition_threads'):
+            self._partition_threads()
+        with self.timings.phase('state_init'):
+            self.state_init()
+        with self.timings.phase('parnet_connect'):
+            self._parnet_connect()
+        if self.n_threads > 1:
+            self._check_delays()
+        if any(self.n_pruned.values()):
+            print('Pruned %d connections with negligible weight'
+                  % sum(self.n_pruned.values()))
 
         # set to record spikes
         self.spiketimes = h.Vector()
         self.spikegids = h.Vector()
         self._record_spikes()
         self.move_cells_to_pos()  # position cells in 2D grid
+        self.timings.count_objects()
         print('[Done]')
 
     def __enter__(self):
@@ -272,21 +429,30 @@ class Network(object):
     def _gid_assign(self):
         from .parallel import nhosts, rank, pc
 
-        # round robin assignment of gids
-        for gid in range(rank, self.N_cells, nhosts):
+        if self.load_balance and nhosts > 1:
+            cell_ranks = self._get_cell_ranks()
+            cell_gids = np.nonzero(cell_ranks == rank)[0].tolist()
+        else:
+            # round robin assignment of gids
+            cell_gids = range(rank, self.N_cells, nhosts)
+        for gid in cell_gids:
             # set the cell gid
             pc.set_gid2node(gid, rank)
             self._gid_list.append(gid)
             # now to do the cell-specific external input gids on the same proc
-            # these are guaranteed to exist because all of
-            # these inputs were created for each cell
+            # if they drive this type of cell
+            cell_type = self.gid_to_type(gid)
             for key in self.p_unique.keys():
+                if cell_type not in self._active_unique[key]:
+                    continue
                 gid_input = gid + self.gid_dict[key][0]
                 pc.set_gid2node(gid_input, rank)
                 self._gid_list.append(gid_input)
         # legacy handling of the external inputs
         # NOT perfectly balanced for now
         for gid_base in range(rank, self.N_extinput, nhosts):
+            if not self._active_ext[gid_base]:
+                continue
             # shift the gid_base to the extinput gid
             gid = gid_base + self.gid_dict['extinput'][0]
             # set as usual
@@ -295,12 +461,189 @@ class Network(object):
         # extremely important to get the gids in the right order
         self._gid_list.sort()
 
+    def _get_cell_ranks(self):
+        """Distribute the cells over the processes to balance their cost.
+
+        Returns
+        -------
+        cell_ranks : array of int
+            The rank of the process of each cell gid.
+        """
+        from .parallel import nhosts, rank, _get_cell_complexity, _partition
+
+        fname = None
+        if isinstance(self.load_balance, str):
+            fname = self.load_balance
+        if fname is not None and op.exists(fname):
+            with np.load(fname) as data:
+                cell_ranks = data['cell_ranks']
+                n_procs = int(data['n_procs'])
+            if len(cell_ranks) == self.N_cells and n_procs == nhosts:
+                return cell_ranks
+            if rank == 0:
+                print('Ignoring the partition of %d cells over %d processes '
+                      'in %s' % (len(cell_ranks), n_procs, fname))
+
+        costs = np.array([_get_cell_complexity(self.gid_to_type(gid),
+                                               self.params)
+                          for gid in range(self.N_cells)])
+        cell_ranks = _partition(costs, nhosts)
+        if rank == 0:
+            loads = np.bincount(cell_ranks, weights=costs, minlength=nhosts)
+            print('Cost of the cells of each process: %s (max/mean = %0.2f)'
+                  % (', '.join('%d' % load for load in loads),
+                     loads.max() / loads.mean()))
+            if fname is not None:
+                # written atomically since all the processes may read it
+                tmp_fname = '%s.%d.tmp.npz' % (fname, os.getpid())
+                np.savez(tmp_fname, cell_ranks=cell_ranks, n_procs=nhosts)
+                os.replace(tmp_fname, fname)
+        return cell_ranks
+
+    def _reset_trial(self, trial_idx):
+        """Prepare the built network for a new trial.
+
+        Only the seeds of the feeds differ between trials. Instead of
+        building the network again, the feeds are reseeded and regenerate
+        their event times, the recordings are cleared and the membrane
+        voltages are set back to their initial values.
+
+        Parameters
+        ----------
+        trial_idx : int
+            The trial index. The seeds of all the feeds are set to
+            trial_idx, except for the first trial which uses the seeds
+            in the parameters.
+        """
+        self._trial_idx = trial_idx
+        if trial_idx != 0:
+            self.params['prng_*'] = trial_idx
+        else:
+            self.params.update(self._prng_seedcores)
+        with self.timings.phase('create_pext', trial_idx):
+            self.p_ext, self.p_unique = create_pext(self.params,
+                                                    self.params['tstop'])
+
+        for feed in self.extinput_list:
+            p_ind = feed.gid - self.gid_dict['extinput'][0]
+            feed.p_ext = self.p_ext[p_ind]
+        for type, feeds in self.ext_list.items():
+            for feed in feeds:
+                feed.p_ext = self.p_unique[type]
+        with self.timings.phase('set_event_times', trial_idx):
+            for feed in self.extinput_list:
+                feed.set_prng()
+                feed.set_event_times()
+            event_times = self._create_unique_event_times(
+                [feed.gid for feed in it.chain(*self.ext_list.values())])
+            for feed in it.chain(*self.ext_list.values()):
+                feed.set_prng()
+                feed.set_event_times(event_times=event_times[feed.gid])
+
+        # the zero-area nodes at the ends of the sections are not set by
+        # state_init() and keep their voltage across calls to finitialize().
+        # Set them back to the voltage of a newly created section.
+        for cell in self.cells:
+            seclist = h.SectionList()
+            seclist.wholetree(sec=cell.soma)
+            for sect in seclist:
+                for seg in sect.allseg():
+                    seg.v = -65.
+        self.state_init()
+        self.spiketimes.resize(0)
+        self.spikegids.resize(0)
+        for current in self.current.values():
+            current.fill(0.)
+
+    def _partition_threads(self):
+        """Distribute the cells of this node over the threads.
+
+        The cells with the most segments are assigned first, each to
+        the thread with the fewest segments so far. Each thread sums
+        the dipoles of its cells into its own element of
+        self._dp_total.
+        """
+        from .parallel import pc, _partition
+
+        pc.nthread(self.n_threads)
+        if self.n_threads == 1:
+            return
+
+        self._dp_total = {'L2': h.Vector(self.n_threads),
+                          'L5': h.Vector(self.n_threads)}
+        # one point process per thread to tell NEURON where to record
+        self._thread_pps = [None] * self.n_threads
+        seclists = [h.SectionList() for _ in range(self.n_threads)]
+        n_segs = [sum(sect.nseg for sect in cell.soma.wholetree())
+                  for cell in self.cells]
+        threads = _partition(n_segs, self.n_threads)
+        for cell_idx in np.argsort(n_segs, kind='stable')[::-1]:
+            cell = self.cells[cell_idx]
+            thread = threads[cell_idx]
+            seclists[thread].append(sec=cell.soma)
+            if cell.celltype.endswith('pyramidal'):
+                layer = cell.celltype[:2]
+                cell._set_dipole_total(self._dp_total[layer]._ref_x[thread])
+                if self._thread_pps[thread] is None:
+                    self._thread_pps[thread] = cell.dipole_pp[0]
+        for thread, seclist in enumerate(seclists):
+            pc.partition(thread, seclist)
+
+    def _record_dipole(self):
+        """Record the dipoles summed over the cells of each thread.
+
+        Returns
+        -------
+        dp_rec : dict of list of h.Vector
+            The recordings of each thread with keys 'L2' and 'L5'.
+        """
+        dp_rec = {'L2': list(), 'L5': list()}
+        if self.n_threads == 1:
+            dp_rec['L2'].append(h.Vector())
+            dp_rec['L2'][0].record(h._ref_dp_total_L2)
+            dp_rec['L5'].append(h.Vector())
+            dp_rec['L5'][0].record(h._ref_dp_total_L5)
+            return dp_rec
+        for layer in ('L2', 'L5'):
+            for thread, pp in enumerate(self._thread_pps):
+                if pp is None:  # no pyramidal cell in this thread
+                    continue
+                rec = h.Vector()
+                rec.record(pp, self._dp_total[layer]._ref_x[thread])
+                dp_rec[layer].append(rec)
+        return dp_rec
+
     def gid_to_type(self, gid):
         """Reverse lookup of gid to type."""
         for gidtype, gids in self.gid_dict.items():
             if gid in gids:
                 return gidtype
 
+    def _create_unique_event_times(self, gids):
+        """Generate the event times of the unique feeds with some gids.
+
+        The event times of all the feeds of a type are generated at once.
+
+        Parameters
+        ----------
+        gids : list of int
+            The gids of the feeds. The gids of cells are ignored.
+
+        Returns
+        -------
+        event_times : dict of array
+            The event times of each unique feed.
+        """
+        event_times = dict()
+        for type, p_type in self.p_unique.items():
+            type_gids = [gid for gid in gids if gid in self.gid_dict[type]]
+            cell_types = [self.gid_to_type(gid - self.gid_dict[type][0])
+                          for gid in type_gids]
+            seeds = [_get_seed(type, p_type, gid) for gid in type_gids]
+            event_times.update(zip(type_gids, _create_event_times(
+                type, p_type, cell_types, seeds)))
+        return event_times
+
     def _create_all_src(self):
         """Parallel create cells AND external inputs (feeds)
            these are spike SOURCES but cells are also targets
@@ -309,6 +652,8 @@ class Network(object):
 
         from .parallel import pc
 
+        event_times = self._create_unique_event_times(
+            [gid for gid in self._gid_list if pc.gid_exists(gid)])
         # loop through gids on this node
         for gid in self._gid_list:
             # check existence of gid with Neuron
@@ -350,7 +695,8 @@ class Network(object):
                     cell_type = self.gid_to_type(gid_post)
                     # create dictionary entry, append to list
                     self.ext_list[type].append(ExtFeed(
-                        type, cell_type, self.p_unique[type], gid))
+                        type, cell_type, self.p_unique[type], gid,
+                        event_times[gid]))
                     pc.cell(
                         gid, self.ext_list[type][-1].connect_to_target(
                             self.params['threshold']))
@@ -361,6 +707,117 @@ class Network(object):
                 print("None of these types in Net()")
                 exit()
 
+    def _plan_connections(self):
+        """Plan the connections between the cells on this node.
+
+        The weights and delays of all the connections FROM other cells TO
+        the cells on this node are computed at once with arrays, for each
+        type of connection defined in _get_connections() of the cell
+        classes.
+
+        Returns
+        -------
+        edges : dict of array
+            The connections in the order in which they must be created.
+            The keys are 'src_gid', 'target_gid', 'conn_idx' (index in the
+            list returned by _get_connections() of the target cell),
+            'syn_idx' (index of the postsynaptic synapse of that
+            connection), 'weight' and 'delay'.
+        n_pruned : dict
+            The number of connections that were pruned by projection.
+        """
+        n_pruned = dict()
+        edges = dict((key, list()) for key in
+                     ('cell_idx', 'src_gid', 'target_gid', 'conn_idx',
+                      'syn_idx', 'weight', 'delay'))
+
+        cell_idxs = dict()
+        for cell_idx, cell in enumerate(self.cells):
+            cell_idxs.setdefault(cell.celltype, list()).append(cell_idx)
+
+        for celltype, type_cell_idxs in cell_idxs.items():
+            type_cells = [self.cells[idx] for idx in type_cell_idxs]
+            target_gids = np.array([cell.gid for cell in type_cells])
+            target_pos = np.array([cell.pos[:2] for cell in type_cells])
+            name = type_cells[0].name
+            for conn_idx, conn in enumerate(type_cells[0]._get_connections()):
+                type_src, name_src = conn['type_src'], conn['name_src']
+                proj = '%s_%s' % (name_src, name)
+                if 'receptor' in conn:
+                    A_weight = self.params['gbar_%s_%s_%s' %
+                                           (name_src, name, conn['receptor'])]
+                else:
+                    A_weight = self.params['gbar_%s_%s' % (name_src, name)]
+                if A_weight == 0.:
+                    # the connections would have no effect
+                    n_pruned.setdefault(proj, 0)
+                    continue
+                weight_cutoff = self.weight_cutoff
+                if isinstance(weight_cutoff, dict):
+                    weight_cutoff = weight_cutoff.get(proj, 0.)
+
+                src_gids = np.array(self.gid_dict[type_src])
+                src_pos = np.array(self.pos_dict[type_src])[:, :2]
+                dx = target_pos[:, 0:1] - src_pos[None, :, 0]
+                dy = target_pos[:, 1:2] - src_pos[None, :, 1]
+                d = np.sqrt(dx**2 + dy**2)
+                fctr = np.exp(-(d**2) / (conn['lamtha']**2))
+
+                mask = np.ones(d.shape, dtype=bool)
+                if not conn.get('autapses', True):
+                    mask &= target_gids[:, None] != src_gids[None, :]
+                prune = mask & (fctr < weight_cutoff)
+                mask &= ~prune
+                n_post = len(conn['postsyns'])
+                n_pruned[proj] = n_pruned.get(proj, 0) + \
+                    int(prune.sum()) * n_post
+
+                # one connection per presynaptic cell and postsynaptic
+                # synapse, ordered by target cell, source cell and synapse
+                target_idx, src_idx = np.nonzero(mask)
+                target_idx = np.repeat(target_idx, n_post)
+                src_idx = np.repeat(src_idx, n_post)
+                edges['cell_idx'].append(
+                    np.array(type_cell_idxs)[target_idx])
+                edges['src_gid'].append(src_gids[src_idx])
+                edges['target_gid'].append(target_gids[target_idx])
+                edges['conn_idx'].append(np.full(len(src_idx), conn_idx))
+                edges['syn_idx'].append(
+                    np.tile(np.arange(n_post), len(src_idx) // n_post))
+                edges['weight'].append(
+                    A_weight * fctr[target_idx, src_idx])
+                edges['delay'].append(1. / fctr[target_idx, src_idx])
+
+        for key in edges:
+            edges[key] = np.concatenate(edges[key]) if edges[key] else \
+                np.array([], dtype=int)
+        # create the connections of each cell in the order of
+        # _get_connections()
+        order = np.lexsort((edges['conn_idx'], edges['cell_idx']))
+        edges = dict((key, val[order]) for key, val in edges.items()
+                     if key != 'cell_idx')
+        return edges, n_pruned
+
+    def _check_delays(self):
+        """Check that the delays of the connections are at least dt.
+
+        The threads exchange the spikes at intervals of the minimum delay
+        of the connections, which NEURON requires to be at least dt.
+        """
+        dt = self.params['dt']
+        for cell in self.cells:
+            for key, ncs in vars(cell).items():
+                if not key.startswith('ncfrom_'):
+                    continue
+                for nc in ncs:
+                    if nc.delay < dt:
+                        raise ValueError(
+                            'With n_threads > 1, the delays of the '
+                            'connections must be at least dt=%s ms. The '
+                            'connection %s of %s %d has a delay of %s ms'
+                            % (dt, key[len('ncfrom_'):], cell.celltype,
+                               cell.gid, nc.delay))
+
     # connections:
     # this NODE is aware of its cells as targets
     # for each syn, return list of source GIDs.
@@ -370,23 +827,38 @@ class Network(object):
     def _parnet_connect(self):
         from .parallel import pc
 
+        # connections between cells
+        edges, self.n_pruned = self._plan_connections()
+        cells = dict((cell.gid, cell) for cell in self.cells)
+        conns = dict((cell.gid, cell._get_connections())
+                     for cell in self.cells)
+        threshold = self.params['threshold']
+        for src_gid, target_gid, conn_idx, syn_idx, weight, delay in zip(
+                edges['src_gid'].tolist(), edges['target_gid'].tolist(),
+                edges['conn_idx'].tolist(), edges['syn_idx'].tolist(),
+                edges['weight'].tolist(), edges['delay'].tolist()):
+            conn = conns[target_gid][conn_idx]
+            nc = pc.gid_connect(src_gid, conn['postsyns'][syn_idx])
+            nc.threshold = threshold
+            nc.weight[0] = weight
+            nc.delay = delay
+            getattr(cells[target_gid], 'ncfrom_%s' % conn['name_src']).append(
+                nc)
+
         # loop over target zipped gids and cells
         # cells has NO extinputs anyway. also no extgausses
         for gid, cell in zip(self._gid_list, self.cells):
             # ignore iteration over inputs, since they are NOT targets
             if pc.gid_exists(gid) and self.gid_to_type(gid) \
                     != 'extinput':
-                # for each gid, find all the other cells connected to it,
-                # based on gid
-                # this MUST be defined in EACH class of cell in self.cells
-                # parconnect receives connections from other cells
                 # parreceive receives connections from external inputs
-                cell.parconnect(gid, self.gid_dict, self.pos_dict, self.params)
                 cell.parreceive(gid, self.gid_dict, self.pos_dict, self.p_ext)
                 # now do the unique inputs specific to these cells
                 # parreceive_ext receives connections from UNIQUE
                 # external inputs
                 for type in self.p_unique.keys():
+                    if cell.celltype not in self._active_unique[type]:
+                        continue
                     p_type = self.p_unique[type]
                     cell.parreceive_ext(
                         type, gid, self.gid_dict, self.pos_dict, p_type)
@@ -416,8 +888,50 @@ class Network(object):
                     # in parallel, each node has its own Net()
                     self.current['%s_soma' % cell.name].add(I_soma)
 
+    def _load_steady_states(self):
+        """Get the equilibrium of the cell types and restore it at init."""
+        from .steady_state import _get_steady_state, _set_cell_state
+
+        cache_dir = None
+        if isinstance(self.steady_state, str):
+            cache_dir = self.steady_state
+        type2class = {'L2_pyramidal': L2Pyr, 'L5_pyramidal': L5Pyr,
+                      'L2_basket': L2Basket, 'L5_basket': L5Basket}
+        self._steady_states = dict()
+        for celltype, Cell in type2class.items():
+            self._steady_states[celltype] = _get_steady_state(
+                Cell, celltype, self.params, cache_dir)
+
+        # finitialize() sets the gating variables to their steady state at
+        # the initial voltages, so the states of the slower mechanisms such
+        # as the calcium concentrations must be restored afterwards. The
+        # closure must not refer to self which the handler would keep alive.
+        cells, steady_states = self.cells, self._steady_states
+
+        def restore_steady_state():
+            for cell in cells:
+                _set_cell_state(cell, steady_states[cell.celltype][0])
+        self._fih = h.FInitializeHandler(1, restore_steady_state)
+
+    def _get_rest_dipole(self):
+        """The dipole of the whole network at rest in fAm.
+
+        Returns
+        -------
+        rest_dipole : dict
+            The dipole with keys 'L2' and 'L5'.
+        """
+        N_pyr = self.params['N_pyr_x'] * self.params['N_pyr_y']
+        return {'L2': N_pyr * self._steady_states['L2_pyramidal'][1],
+                'L5': N_pyr * self._steady_states['L5_pyramidal'][1]}
+
     def state_init(self):
         """Initializes the state closer to baseline."""
+        if self.steady_state:
+            from .steady_state import _set_cell_state
+            for cell in self.cells:
+                _set_cell_state(cell, self._steady_states[cell.celltype][0])
+            return
         for cell in self.cells:
             seclist = h.SectionList()
             seclist.wholetree(sec=cell.soma)
@@ -461,20 +975,18 @@ class Network(object):
             The matplotlib figure handle.
         """
         import matplotlib.pyplot as plt
-        spikes = np.array(sum(self.spiketimes, []))
-        gids = np.array(sum(self.spikegids, []))
-        valid_gids = np.r_[[v for (k, v) in self.gid_dict.items()
-                            if k.startswith('evprox')]]
-        mask_evprox = np.in1d(gids, valid_gids)
-        valid_gids = np.r_[[v for (k, v) in self.gid_dict.items()
-                            if k.startswith('evdist')]]
-        mask_evdist = np.in1d(gids, valid_gids)
+        spikes_evprox = self.spikes.select(
+            cell_type=[key for key in self.gid_dict
+                       if key.startswith('evprox')])
+        spikes_evdist = self.spikes.select(
+            cell_type=[key for key in self.gid_dict
+                       if key.startswith('evdist')])
         bins = np.linspace(0, self.params['tstop'], 50)
 
         if ax is None:
             fig, ax = plt.subplots(1, 1)
-        ax.hist(spikes[mask_evprox], bins, color='r', label='Proximal')
-        ax.hist(spikes[mask_evdist], bins, color='g', label='Distal')
+        ax.hist(spikes_evprox.times, bins, color='r', label='Proximal')
+        ax.hist(spikes_evdist.times, bins, color='g', label='Distal')
         plt.legend()
         if show:
             plt.show()
@@ -497,13 +1009,9 @@ class Network(object):
             The matplotlib figure object
         """
         import matplotlib.pyplot as plt
-        spikes = np.array(sum(self.spiketimes, []))
-        gids = np.array(sum(self.spikegids, []))
-        spike_times = np.zeros((4, spikes.shape[0]))
         cell_types = ['L5_pyramidal', 'L5_basket', 'L2_pyramidal', 'L2_basket']
-        for idx, key in enumerate(cell_types):
-            mask = np.in1d(gids, self.gid_dict[key])
-            spike_times[idx, mask] = spikes[mask]
+        spike_times = [self.spikes.select(cell_type=key).times
+                       for key in cell_types]
 
         if ax is None:
             fig, ax = plt.subplots(1, 1)
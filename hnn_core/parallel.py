@@ -3,8 +3,17 @@
 # Authors: Blake Caldwell <blake_caldwell@brown.edu>
 #          Mainak Jas <mainakjas@gmail.com>
 
+import os
+import os.path as op
+import re
+import sys
+import pickle
+import shutil
+import subprocess
+import tempfile
 from warnings import warn
 
+import numpy as np
 from neuron import h
 
 rank = 0
@@ -12,8 +21,13 @@ nhosts = 1
 pc = h.ParallelContext(nhosts)
 pc.done()
 rank = int(pc.id())
+# more than one host when the simulation is launched with mpiexec
+nhosts = int(pc.nhost())
 cvode = h.CVode()
 
+# computational complexity of each cell type measured in this process
+_cell_complexities = dict()
+
 
 def create_parallel_context(n_jobs=1):
     """Create parallel context."""
@@ -23,7 +37,66 @@ def create_parallel_context(n_jobs=1):
         pc.gid_clear()
 
 
-def _parallel_func(func, n_jobs):
+def _get_cell_complexity(celltype, params):
+    """Estimate the computational cost of a cell type with LoadBalance.
+
+    The complexity is measured once per cell type on an isolated cell
+    and accounts for the number of segments and the mechanisms inserted
+    in each of them.
+    """
+    from .pyramidal import L2Pyr, L5Pyr
+    from .basket import L2Basket, L5Basket
+
+    if celltype not in _cell_complexities:
+        h.load_file('loadbal.hoc')
+        if celltype == 'L2_pyramidal':
+            cell = L2Pyr(-1, (0, 0, 0), params)
+        elif celltype == 'L5_pyramidal':
+            cell = L5Pyr(-1, (0, 0, 0), params)
+        elif celltype == 'L2_basket':
+            cell = L2Basket(-1, (0, 0, 0))
+        else:
+            cell = L5Basket(-1, (0, 0, 0))
+        lb = h.LoadBalance()
+        _cell_complexities[celltype] = lb.cell_complexity(sec=cell.soma)
+    return _cell_complexities[celltype]
+
+
+def _partition(costs, n_bins):
+    """Distribute items over bins to balance the sum of their costs.
+
+    The items with the largest cost are assigned first, each to the bin
+    with the lowest total cost so far.
+
+    Returns
+    -------
+    bins : array of int
+        The bin of each item.
+    """
+    bins = np.zeros(len(costs), dtype=int)
+    loads = np.zeros(n_bins)
+    for idx in np.argsort(costs, kind='stable')[::-1]:
+        bins[idx] = np.argmin(loads)
+        loads[bins[idx]] += costs[idx]
+    return bins
+
+
+def _get_joblib_version():
+    """Get the major and minor version of joblib."""
+    import joblib
+
+    match = re.match(r'(\d+)\.(\d+)', joblib.__version__)
+    return tuple(int(part) for part in match.groups())
+
+
+def _parallel_func(func, n_jobs, stream=False):
+    """Get a function to run func in parallel.
+
+    If stream is True, parallel returns a generator of the results in the
+    order in which they finish with joblib >= 1.4, in the order of the
+    calls with joblib 1.3, and a list of the results once they are all
+    done with older versions.
+    """
     if n_jobs != 1:
         try:
             from joblib import Parallel, delayed
@@ -33,9 +106,96 @@ def _parallel_func(func, n_jobs):
     if n_jobs == 1:
         n_jobs = 1
         my_func = func
-        parallel = list
+        parallel = iter if stream else list
+    elif stream:
+        version = _get_joblib_version()
+        if version >= (1, 4):
+            parallel = Parallel(n_jobs, return_as='generator_unordered')
+        elif version >= (1, 3):
+            parallel = Parallel(n_jobs, return_as='generator')
+        else:
+            parallel = Parallel(n_jobs)
+        my_func = delayed(func)
     else:
         parallel = Parallel(n_jobs)
         my_func = delayed(func)
 
     return parallel, my_func
+
+
+def _get_child_env():
+    """Get the environment of a child process that imports hnn_core."""
+    env = os.environ.copy()
+    root_dir = op.abspath(op.join(op.dirname(__file__), '..'))
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root_dir] + [path for path in [env.get('PYTHONPATH')] if path])
+    return env
+
+
+def _mpi_simulate(params, trial_idxs, net_kwargs, n_procs, checkpoint=None,
+                  trace_memory=False, record=None, progress_interval=10.):
+    """Simulate trials with the network distributed over MPI processes.
+
+    Parameters
+    ----------
+    params : instance of Params
+        The parameters of the network.
+    trial_idxs : list of int
+        The indices of the trials to simulate one after another.
+    net_kwargs : dict
+        The options of the network.
+    n_procs : int
+        The number of MPI processes to launch with mpiexec.
+    checkpoint : dict | None
+        The checkpoint file names of the trials and the interval between
+        checkpoints. Each process saves its own part of the network.
+    trace_memory : bool
+        If True, each process traces the memory allocated by Python.
+    record : dict | None
+        The directory where the recordings are appended and the interval
+        between two flushes. Each process appends its own recordings.
+    progress_interval : float | None
+        The simulated time in ms between two prints of the simulation
+        time by the first process. If None, nothing is printed.
+
+    Returns
+    -------
+    out : list of tuple
+        The dipole, spike times, spike gids, recordings of the probes and
+        somatic currents of each trial gathered from all the processes.
+    timings : instance of Timings
+        The durations and memory of the phases of all the processes.
+    """
+    from .dipole import _clone_and_simulate
+
+    mpiexec = shutil.which('mpiexec')
+    if mpiexec is None:
+        warn('mpiexec not found. Cannot run in parallel.')
+        return _clone_and_simulate(params, trial_idxs, net_kwargs,
+                                   checkpoint, trace_memory, record,
+                                   progress_interval)
+
+    # the MPI processes must initialize MPI before hnn_core creates the
+    # ParallelContext
+    code = ('from neuron import h; h.nrnmpi_init(); '
+            'from hnn_core.mpi_child import _run; _run()')
+    env = _get_child_env()
+
+    tmp_dir = tempfile.mkdtemp(prefix='hnn_core_mpi_')
+    try:
+        in_fname = op.join(tmp_dir, 'in.pkl')
+        out_fname = op.join(tmp_dir, 'out.pkl')
+        with open(in_fname, 'wb') as fid:
+            pickle.dump((params, trial_idxs, net_kwargs, checkpoint,
+                         trace_memory, record, progress_interval), fid)
+        cmd = [mpiexec, '-np', str(n_procs), sys.executable, '-c', code,
+               in_fname, out_fname]
+        proc = subprocess.run(cmd, env=env)
+        if proc.returncode != 0 or not op.exists(out_fname):
+            raise RuntimeError('The MPI simulation failed with exit code %d'
+                               % proc.returncode)
+        with open(out_fname, 'rb') as fid:
+            out = pickle.load(fid)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return out
@@ -0,0 +1,313 @@
+"""Recording probes of the cells of a network."""
+
+import numpy as np
+from neuron import h
+
+_CELL_TYPES = ('L2_pyramidal', 'L5_pyramidal', 'L2_basket', 'L5_basket')
+
+
+class ProbeData(object):
+    """The recordings of a probe in all the trials.
+
+    Parameters
+    ----------
+    name : str
+        The name of the probe.
+    var : str
+        The recorded variable.
+    gids : array (n_channels,)
+        The gid of the cell of each channel.
+    times : array (n_times,)
+        The sampling times in ms.
+    data : array (n_trials, n_channels, n_times)
+        The recordings.
+
+    Attributes
+    ----------
+    name : str
+        The name of the probe.
+    var : str
+        The recorded variable.
+    gids : array of int
+        The gid of the cell of each channel.
+    times : array of float
+        The sampling times in ms.
+    data : array of float
+        The recordings of each trial and channel.
+    """
+
+    def __init__(self, name, var, gids, times, data):  # noqa: D102
+        self.name = name
+        self.var = var
+        self.gids = gids
+        self.times = times
+        self.data = data
+
+    def __repr__(self):
+        class_name = self.__class__.__name__
+        return '<%s | %s of %s, %d trials, %d channels, %d times>' % (
+            (class_name, self.name, self.var) + self.data.shape)
+
+
+def _check_probe(net, name, var, cell_type, gids, section, loc, synapse,
+                 dt):
+    """Check the arguments of Network.add_probe."""
+    if name in net.probes:
+        raise ValueError('A probe named %s already exists' % name)
+    if cell_type is None and gids is None:
+        raise ValueError('cell_type or gids must be given')
+    if cell_type is not None:
+        cell_types = [cell_type] if isinstance(cell_type, str) else cell_type
+        for this_type in cell_types:
+            if this_type not in _CELL_TYPES:
+                raise ValueError('cell_type must be one of %s, got %s'
+                                 % (', '.join(_CELL_TYPES), this_type))
+        type_gids = [gid for this_type in cell_types
+                     for gid in net.gid_dict[this_type]]
+    if gids is None:
+        gids = type_gids
+    else:
+        gids = [int(gid) for gid in gids]
+        cell_gids = [gid for this_type in _CELL_TYPES
+                     for gid in net.gid_dict[this_type]]
+        for gid in gids:
+            if gid not in cell_gids:
+                raise ValueError('gids must be the gids of cells, got %s'
+                                 % gid)
+        if cell_type is not None:
+            gids = [gid for gid in gids if gid in type_gids]
+    if var == 'dipole':
+        gids = [gid for gid in gids
+                if net.gid_to_type(gid).endswith('pyramidal')]
+        if len(gids) == 0:
+            raise ValueError('Only the pyramidal cells have a dipole')
+    if len(gids) == 0:
+        raise ValueError('No cell matches cell_type and gids')
+    if not 0. <= loc <= 1.:
+        raise ValueError('loc must be between 0 and 1, got %s' % loc)
+    if dt is not None:
+        n_steps = dt / net.params['dt']
+        if n_steps < 1 or abs(n_steps - round(n_steps)) > 1e-6:
+            raise ValueError('dt must be a multiple of the time step of %s '
+                             'ms, got %s' % (net.params['dt'], dt))
+    return dict(var=var, gids=sorted(set(gids)), section=section,
+                loc=float(loc), synapse=synapse, dt=dt)
+
+
+def _get_section(cell, section):
+    """Get a section of a cell by name, e.g. 'soma' or 'apical_tuft'."""
+    if section == 'soma':
+        return cell.soma
+    dends = getattr(cell, 'dends', dict())
+    if section not in dends:
+        raise ValueError('%s has no section %s. It has %s'
+                         % (cell.celltype, section,
+                            ', '.join(['soma'] + list(dends))))
+    return dends[section]
+
+
+def _get_synapse(cell, synapse):
+    """Get a synapse of a cell by name, e.g. 'soma_gabaa'."""
+    syn = getattr(cell, 'synapses', dict()).get(synapse)
+    if syn is None:
+        syn = getattr(cell, synapse, None)
+    if syn is None or syn.hname().split('[')[0] != 'Exp2Syn':
+        raise ValueError('%s has no synapse %s' % (cell.celltype, synapse))
+    return syn
+
+
+def _record(rec, ref, dt, **kwargs):
+    """Record a variable every dt ms, or every time step if dt is None."""
+    if dt is None:
+        rec.record(*ref, **kwargs)
+    else:
+        rec.record(*(ref + (dt,)), **kwargs)
+
+
+def _get_decimation(net, probe):
+    """Get the number of recorded samples per sample of a probe.
+
+    With threads, a variable recorded every dt ms is not sampled at the
+    right time step in the threads other than the first one. The probes
+    are then recorded at every time step and decimated afterwards.
+    """
+    if probe['dt'] is None or net.n_threads == 1:
+        return 1
+    return int(round(probe['dt'] / net.params['dt']))
+
+
+def _record_probes(net):
+    """Record the probes in the cells of this process.
+
+    Returns
+    -------
+    probe_recs : dict of dict of list of h.Vector
+        The recordings of each probe and gid. A gid has several
+        recordings for the dipole of its sections.
+    """
+    cells = dict((cell.gid, cell) for cell in net.cells)
+    probe_recs = dict()
+    for name, probe in net.probes.items():
+        probe_recs[name] = dict()
+        for gid in probe['gids']:
+            if gid not in cells:  # on another process
+                continue
+            cell, dt, recs = cells[gid], probe['dt'], list()
+            if _get_decimation(net, probe) > 1:
+                dt = None
+            if probe['var'] == 'dipole':
+                # the dipole of each section is summed after the trial
+                for dpp in cell.dipole_pp:
+                    recs.append(h.Vector())
+                    _record(recs[-1], (dpp, dpp._ref_Qsum), dt)
+            elif probe['synapse'] is not None:
+                syn = _get_synapse(cell, probe['synapse'])
+                recs.append(h.Vector())
+                _record(recs[-1], (syn, getattr(syn, '_ref_' +
+                                                probe['var'])), dt)
+            else:
+                sect = _get_section(cell, probe['section'])
+                seg = sect(probe['loc'])
+                if not hasattr(seg, '_ref_' + probe['var']):
+                    raise ValueError('%s of %s has no variable %s'
+                                     % (probe['section'], cell.celltype,
+                                        probe['var']))
+                recs.append(h.Vector())
+                _record(recs[-1], (getattr(seg, '_ref_' + probe['var']),),
+                        dt, sec=sect)
+            probe_recs[name][gid] = recs
+    return probe_recs
+
+
+def _get_probe_recordings(probe_recs):
+    """Get the vectors recording the probes by name."""
+    recordings = dict()
+    for name, gid_recs in probe_recs.items():
+        for gid, recs in gid_recs.items():
+            for idx, rec in enumerate(recs):
+                recordings['probe_%s_%d_%d' % (name, gid, idx)] = rec
+    return recordings
+
+
+def _get_channels(net, probe_recs, offset=0):
+    """Get the recording of each probe and gid of this process.
+
+    Parameters
+    ----------
+    net : Network object
+        The network.
+    probe_recs : dict of dict of list of h.Vector
+        The recordings of each probe and gid.
+    offset : int
+        The number of time steps recorded before the vectors, to
+        decimate a recording continued in several chunks.
+
+    Returns
+    -------
+    channels : dict of dict of array
+        The recording of each probe and gid. The dipoles of the sections
+        are summed.
+    """
+    channels = dict()
+    for name, gid_recs in probe_recs.items():
+        step = _get_decimation(net, net.probes[name])
+        start = -offset % step
+        channels[name] = dict(
+            (gid, recs[0].as_numpy()[start::step] if len(recs) == 1 else
+             np.sum([rec.as_numpy()[start::step] for rec in recs], axis=0))
+            for gid, recs in gid_recs.items())
+    return channels
+
+
+def _flush_probes(net, probe_recs, store, offset):
+    """Append the recordings of the probes to a store and clear them."""
+    channels = _get_channels(net, probe_recs, offset)
+    for name, gid_recs in probe_recs.items():
+        for gid, recs in gid_recs.items():
+            store.append('probe_%s_%d' % (name, gid), channels[name][gid])
+            for rec in recs:
+                rec.resize(0)
+
+
+def _collect_probes(net, probe_recs, store=None):
+    """Gather the recordings of the probes of a trial on the first process.
+
+    Parameters
+    ----------
+    net : Network object
+        The network.
+    probe_recs : dict of dict of list of h.Vector
+        The recordings of each probe and gid.
+    store : instance of _RecordStore | None
+        If not None, the recordings are read from the store.
+
+    Returns
+    -------
+    probe_data : dict of array (n_channels, n_times)
+        The recordings of each probe, with the channels in the order of
+        the gids of the probe. Empty except on the first process.
+    """
+    from .parallel import nhosts, pc, rank
+
+    if store is None:
+        local_data = _get_channels(net, probe_recs)
+    else:
+        local_data = dict(
+            (name, dict((gid, store.read('probe_%s_%d' % (name, gid)))
+                        for gid in gid_recs))
+            for name, gid_recs in probe_recs.items())
+    if nhosts > 1:
+        all_data = pc.py_gather(local_data, 0)
+        if rank != 0:
+            return dict()
+        for data in all_data:
+            for name in local_data:
+                local_data[name].update(data[name])
+
+    probe_data = dict()
+    for name, probe in net.probes.items():
+        n_times = set(len(local_data[name][gid]) for gid in probe['gids'])
+        if len(n_times) > 1:
+            raise RuntimeError('The channels of the probe %s recorded '
+                               'different numbers of samples: %s'
+                               % (name, sorted(n_times)))
+        # the recordings are copied once into the array of the probe
+        probe_data[name] = np.empty((len(probe['gids']), n_times.pop()))
+        for idx, gid in enumerate(probe['gids']):
+            probe_data[name][idx] = local_data[name][gid]
+    return probe_data
+
+
+def _get_probe_data(probes, out, dt):
+    """Stack the recordings of the probes of all the trials.
+
+    Parameters
+    ----------
+    probes : dict of dict
+        The probes of the network.
+    out : list of dict of array
+        The recordings of the probes of each trial.
+    dt : float
+        The time step of the simulation in ms.
+
+    Returns
+    -------
+    probe_data : dict of ProbeData
+        The recordings of each probe.
+    """
+    probe_data = dict()
+    for name, probe in probes.items():
+        n_times = set(trial_data[name].shape[1] for trial_data in out)
+        if len(n_times) > 1:
+            raise RuntimeError('The trials recorded different numbers of '
+                               'samples of the probe %s: %s'
+                               % (name, sorted(n_times)))
+        n_times = n_times.pop()
+        data = np.empty((len(out), len(probe['gids']), n_times))
+        for trial_idx, trial_data in enumerate(out):
+            data[trial_idx] = trial_data[name]
+        probe_dt = dt if probe['dt'] is None else probe['dt']
+        times = np.arange(n_times) * probe_dt
+        probe_data[name] = ProbeData(name, probe['var'],
+                                     np.array(probe['gids']), times, data)
+    return probe_data
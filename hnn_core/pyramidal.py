@@ -404,26 +404,22 @@ class L2Pyr(Pyr):
             self.dends[key].insert('km')
             self.dends[key].gbar_km = self.p_all['L2Pyr_dend_gbar_km']
 
-    def parconnect(self, gid, gid_dict, pos_dict, p):
-        """Collect receptor-type-based connections here."""
-
-        postsyns = [self.apicaloblique_ampa, self.basal2_ampa,
-                    self.basal3_ampa]
-        self._connect(gid, gid_dict, pos_dict, p,
-                      'L2_pyramidal', 'L2Pyr', lamtha=3., receptor='ampa',
-                      postsyns=postsyns, autapses=False)
-        postsyns = [self.apicaloblique_nmda, self.basal2_nmda,
-                    self.basal3_nmda]
-        self._connect(gid, gid_dict, pos_dict, p,
-                      'L2_pyramidal', 'L2Pyr', lamtha=3., receptor='nmda',
-                      postsyns=postsyns, autapses=False)
-
-        self._connect(gid, gid_dict, pos_dict, p,
-                      'L2_basket', 'L2Basket', lamtha=50., receptor='gabaa',
-                      postsyns=[self.synapses['soma_gabaa']])
-        self._connect(gid, gid_dict, pos_dict, p,
-                      'L2_basket', 'L2Basket', lamtha=50., receptor='gabab',
-                      postsyns=[self.synapses['soma_gabab']])
+    def _get_connections(self):
+        """Receptor-type-based connections FROM other cells TO this cell."""
+        return [
+            dict(type_src='L2_pyramidal', name_src='L2Pyr', lamtha=3.,
+                 receptor='ampa', autapses=False,
+                 postsyns=[self.apicaloblique_ampa, self.basal2_ampa,
+                           self.basal3_ampa]),
+            dict(type_src='L2_pyramidal', name_src='L2Pyr', lamtha=3.,
+                 receptor='nmda', autapses=False,
+                 postsyns=[self.apicaloblique_nmda, self.basal2_nmda,
+                           self.basal3_nmda]),
+            dict(type_src='L2_basket', name_src='L2Basket', lamtha=50.,
+                 receptor='gabaa', postsyns=[self.synapses['soma_gabaa']]),
+            dict(type_src='L2_basket', name_src='L2Basket', lamtha=50.,
+                 receptor='gabab', postsyns=[self.synapses['soma_gabab']]),
+        ]
 
     # may be reorganizable
     def parreceive(self, gid, gid_dict, pos_dict, p_ext):
@@ -443,16 +439,16 @@ class L2Pyr(Pyr):
 
                 # Proximal feed AMPA synapses
                 if p_src['loc'] == 'proximal':
-                    self.ncfrom_extinput.append(self.parconnect_from_src(
-                        gid_src, nc_dict_ampa, self.basal2_ampa))
-                    self.ncfrom_extinput.append(self.parconnect_from_src(
-                        gid_src, nc_dict_ampa, self.basal3_ampa))
-                    self.ncfrom_extinput.append(self.parconnect_from_src(
-                        gid_src, nc_dict_ampa, self.apicaloblique_ampa))
+                    self._connect_feed(self.ncfrom_extinput, gid_src,
+                                       nc_dict_ampa, self.basal2_ampa)
+                    self._connect_feed(self.ncfrom_extinput, gid_src,
+                                       nc_dict_ampa, self.basal3_ampa)
+                    self._connect_feed(self.ncfrom_extinput, gid_src,
+                                       nc_dict_ampa, self.apicaloblique_ampa)
                 # Distal feed AMPA synapses
                 elif p_src['loc'] == 'distal':
-                    self.ncfrom_extinput.append(self.parconnect_from_src(
-                        gid_src, nc_dict_ampa, self.apicaltuft_ampa))
+                    self._connect_feed(self.ncfrom_extinput, gid_src,
+                                       nc_dict_ampa, self.apicaltuft_ampa)
 
             # Check is NMDA params defined in p_src
             if 'L2Pyr_nmda' in p_src.keys():
@@ -467,16 +463,16 @@ class L2Pyr(Pyr):
 
                 # Proximal feed NMDA synapses
                 if p_src['loc'] == 'proximal':
-                    self.ncfrom_extinput.append(self.parconnect_from_src(
-                        gid_src, nc_dict_nmda, self.basal2_nmda))
-                    self.ncfrom_extinput.append(self.parconnect_from_src(
-                        gid_src, nc_dict_nmda, self.basal3_nmda))
-                    self.ncfrom_extinput.append(self.parconnect_from_src(
-                        gid_src, nc_dict_nmda, self.apicaloblique_nmda))
+                    self._connect_feed(self.ncfrom_extinput, gid_src,
+                                       nc_dict_nmda, self.basal2_nmda)
+                    self._connect_feed(self.ncfrom_extinput, gid_src,
+                                       nc_dict_nmda, self.basal3_nmda)
+                    self._connect_feed(self.ncfrom_extinput, gid_src,
+                                       nc_dict_nmda, self.apicaloblique_nmda)
                 # Distal feed NMDA synapses
                 elif p_src['loc'] == 'distal':
-                    self.ncfrom_extinput.append(self.parconnect_from_src(
-                        gid_src, nc_dict_nmda, self.apicaltuft_nmda))
+                    self._connect_feed(self.ncfrom_extinput, gid_src,
+                                       nc_dict_nmda, self.apicaltuft_nmda)
 
     # one parreceive function to handle all types of external parreceives
     # types must be defined explicitly here
@@ -509,27 +505,27 @@ class L2Pyr(Pyr):
                 }
 
                 if p_ext['loc'] == 'proximal':
-                    self.ncfrom_ev.append(self.parconnect_from_src(
-                        gid_ev, nc_dict_ampa, self.basal2_ampa))
-                    self.ncfrom_ev.append(self.parconnect_from_src(
-                        gid_ev, nc_dict_ampa, self.basal3_ampa))
-                    self.ncfrom_ev.append(self.parconnect_from_src(
-                        gid_ev, nc_dict_ampa, self.apicaloblique_ampa))
+                    self._connect_feed(self.ncfrom_ev, gid_ev, nc_dict_ampa,
+                                       self.basal2_ampa)
+                    self._connect_feed(self.ncfrom_ev, gid_ev, nc_dict_ampa,
+                                       self.basal3_ampa)
+                    self._connect_feed(self.ncfrom_ev, gid_ev, nc_dict_ampa,
+                                       self.apicaloblique_ampa)
 
                     # NEW: note that default/original is 0 nmda weight
                     # for these proximal dends
-                    self.ncfrom_ev.append(self.parconnect_from_src(
-                        gid_ev, nc_dict_nmda, self.basal2_nmda))
-                    self.ncfrom_ev.append(self.parconnect_from_src(
-                        gid_ev, nc_dict_nmda, self.basal3_nmda))
-                    self.ncfrom_ev.append(self.parconnect_from_src(
-                        gid_ev, nc_dict_nmda, self.apicaloblique_nmda))
+                    self._connect_feed(self.ncfrom_ev, gid_ev, nc_dict_nmda,
+                                       self.basal2_nmda)
+                    self._connect_feed(self.ncfrom_ev, gid_ev, nc_dict_nmda,
+                                       self.basal3_nmda)
+                    self._connect_feed(self.ncfrom_ev, gid_ev, nc_dict_nmda,
+                                       self.apicaloblique_nmda)
 
                 elif p_ext['loc'] == 'distal':
-                    self.ncfrom_ev.append(self.parconnect_from_src(
-                        gid_ev, nc_dict_ampa, self.apicaltuft_ampa))
-                    self.ncfrom_ev.append(self.parconnect_from_src(
-                        gid_ev, nc_dict_nmda, self.apicaltuft_nmda))
+                    self._connect_feed(self.ncfrom_ev, gid_ev, nc_dict_ampa,
+                                       self.apicaltuft_ampa)
+                    self._connect_feed(self.ncfrom_ev, gid_ev, nc_dict_nmda,
+                                       self.apicaltuft_nmda)
 
         elif type == 'extgauss':
             # gid is this cell's gid
@@ -554,12 +550,12 @@ class L2Pyr(Pyr):
                     'type_src': type
                 }
 
-                self.ncfrom_extgauss.append(self.parconnect_from_src(
-                    gid_extgauss, nc_dict, self.basal2_ampa))
-                self.ncfrom_extgauss.append(self.parconnect_from_src(
-                    gid_extgauss, nc_dict, self.basal3_ampa))
-                self.ncfrom_extgauss.append(self.parconnect_from_src(
-                    gid_extgauss, nc_dict, self.apicaloblique_ampa))
+                self._connect_feed(self.ncfrom_extgauss, gid_extgauss, nc_dict,
+                                   self.basal2_ampa)
+                self._connect_feed(self.ncfrom_extgauss, gid_extgauss, nc_dict,
+                                   self.basal3_ampa)
+                self._connect_feed(self.ncfrom_extgauss, gid_extgauss, nc_dict,
+                                   self.apicaloblique_ampa)
 
         elif type == 'extpois':
             if self.celltype in p_ext.keys():
@@ -575,22 +571,22 @@ class L2Pyr(Pyr):
                     'type_src': type
                 }
 
-                self.ncfrom_extpois.append(self.parconnect_from_src(
-                    gid_extpois, nc_dict, self.basal2_ampa))
-                self.ncfrom_extpois.append(self.parconnect_from_src(
-                    gid_extpois, nc_dict, self.basal3_ampa))
-                self.ncfrom_extpois.append(self.parconnect_from_src(
-                    gid_extpois, nc_dict, self.apicaloblique_ampa))
+                self._connect_feed(self.ncfrom_extpois, gid_extpois, nc_dict,
+                                   self.basal2_ampa)
+                self._connect_feed(self.ncfrom_extpois, gid_extpois, nc_dict,
+                                   self.basal3_ampa)
+                self._connect_feed(self.ncfrom_extpois, gid_extpois, nc_dict,
+                                   self.apicaloblique_ampa)
 
                 if p_ext[self.celltype][1] > 0.0:
                     # index 1 for nmda weight
                     nc_dict['A_weight'] = p_ext[self.celltype][1]
-                    self.ncfrom_extpois.append(self.parconnect_from_src(
-                        gid_extpois, nc_dict, self.basal2_nmda))
-                    self.ncfrom_extpois.append(self.parconnect_from_src(
-                        gid_extpois, nc_dict, self.basal3_nmda))
-                    self.ncfrom_extpois.append(self.parconnect_from_src(
-                        gid_extpois, nc_dict, self.apicaloblique_nmda))
+                    self._connect_feed(self.ncfrom_extpois, gid_extpois,
+                                       nc_dict, self.basal2_nmda)
+                    self._connect_feed(self.ncfrom_extpois, gid_extpois,
+                                       nc_dict, self.basal3_nmda)
+                    self._connect_feed(self.ncfrom_extpois, gid_extpois,
+                                       nc_dict, self.apicaloblique_nmda)
 
         else:
             print("Warning, ext type def does not exist in L2Pyr")
@@ -842,35 +838,27 @@ class L5Pyr(Pyr):
 
             h.pop_section()
 
-    # parallel connection function FROM all cell types TO here
-    def parconnect(self, gid, gid_dict, pos_dict, p):
-
-        postsyns = [self.apicaloblique_ampa, self.basal2_ampa,
-                    self.basal3_ampa]
-        self._connect(gid, gid_dict, pos_dict, p,
-                      'L5_pyramidal', 'L5Pyr', lamtha=3., receptor='ampa',
-                      postsyns=postsyns, autapses=False)
-        postsyns = [self.apicaloblique_nmda, self.basal2_nmda,
-                    self.basal3_nmda]
-        self._connect(gid, gid_dict, pos_dict, p,
-                      'L5_pyramidal', 'L5Pyr', lamtha=3., receptor='nmda',
-                      postsyns=postsyns, autapses=False)
-
-        self._connect(gid, gid_dict, pos_dict, p,
-                      'L5_basket', 'L5Basket', lamtha=70., receptor='gabaa',
-                      postsyns=[self.synapses['soma_gabaa']])
-        self._connect(gid, gid_dict, pos_dict, p,
-                      'L5_basket', 'L5Basket', lamtha=70., receptor='gabab',
-                      postsyns=[self.synapses['soma_gabab']])
-
-        postsyns = [self.basal2_ampa, self.basal3_ampa, self.apicaltuft_ampa,
-                    self.apicaloblique_ampa]
-        self._connect(gid, gid_dict, pos_dict, p,
-                      'L2_pyramidal', 'L2Pyr', lamtha=3., postsyns=postsyns)
-
-        self._connect(gid, gid_dict, pos_dict, p,
-                      'L2_basket', 'L2Basket', lamtha=50.,
-                      postsyns=[self.apicaltuft_gabaa])
+    # connections FROM all cell types TO here
+    def _get_connections(self):
+        return [
+            dict(type_src='L5_pyramidal', name_src='L5Pyr', lamtha=3.,
+                 receptor='ampa', autapses=False,
+                 postsyns=[self.apicaloblique_ampa, self.basal2_ampa,
+                           self.basal3_ampa]),
+            dict(type_src='L5_pyramidal', name_src='L5Pyr', lamtha=3.,
+                 receptor='nmda', autapses=False,
+                 postsyns=[self.apicaloblique_nmda, self.basal2_nmda,
+                           self.basal3_nmda]),
+            dict(type_src='L5_basket', name_src='L5Basket', lamtha=70.,
+                 receptor='gabaa', postsyns=[self.synapses['soma_gabaa']]),
+            dict(type_src='L5_basket', name_src='L5Basket', lamtha=70.,
+                 receptor='gabab', postsyns=[self.synapses['soma_gabab']]),
+            dict(type_src='L2_pyramidal', name_src='L2Pyr', lamtha=3.,
+                 postsyns=[self.basal2_ampa, self.basal3_ampa,
+                           self.apicaltuft_ampa, self.apicaloblique_ampa]),
+            dict(type_src='L2_basket', name_src='L2Basket', lamtha=50.,
+                 postsyns=[self.apicaltuft_gabaa]),
+        ]
 
     # receive from external inputs
     def parreceive(self, gid, gid_dict, pos_dict, p_ext):
@@ -890,21 +878,17 @@ class L5Pyr(Pyr):
                 # Proximal feed AMPA synapses
                 if p_src['loc'] == 'proximal':
                     # basal2_ampa, basal3_ampa, apicaloblique_ampa
-                    self.ncfrom_extinput.append(
-                        self.parconnect_from_src(gid_src, nc_dict_ampa,
-                                                 self.basal2_ampa))
-                    self.ncfrom_extinput.append(
-                        self.parconnect_from_src(gid_src, nc_dict_ampa,
-                                                 self.basal3_ampa))
-                    self.ncfrom_extinput.append(
-                        self.parconnect_from_src(gid_src, nc_dict_ampa,
-                                                 self.apicaloblique_ampa))
+                    self._connect_feed(self.ncfrom_extinput, gid_src,
+                                       nc_dict_ampa, self.basal2_ampa)
+                    self._connect_feed(self.ncfrom_extinput, gid_src,
+                                       nc_dict_ampa, self.basal3_ampa)
+                    self._connect_feed(self.ncfrom_extinput, gid_src,
+                                       nc_dict_ampa, self.apicaloblique_ampa)
                 # Distal feed AMPA synsapes
                 elif p_src['loc'] == 'distal':
                     # apical tuft
-                    self.ncfrom_extinput.append(
-                        self.parconnect_from_src(gid_src, nc_dict_ampa,
-                                                 self.apicaltuft_ampa))
+                    self._connect_feed(self.ncfrom_extinput, gid_src,
+                                       nc_dict_ampa, self.apicaltuft_ampa)
 
             # Check if NMDA params defined in p_src
             if 'L5Pyr_nmda' in p_src.keys():
@@ -920,21 +904,17 @@ class L5Pyr(Pyr):
                 # Proximal feed NMDA synapses
                 if p_src['loc'] == 'proximal':
                     # basal2_nmda, basal3_nmda, apicaloblique_nmda
-                    self.ncfrom_extinput.append(
-                        self.parconnect_from_src(
-                            gid_src, nc_dict_nmda, self.basal2_nmda))
-                    self.ncfrom_extinput.append(
-                        self.parconnect_from_src(
-                            gid_src, nc_dict_nmda, self.basal3_nmda))
-                    self.ncfrom_extinput.append(
-                        self.parconnect_from_src(
-                            gid_src, nc_dict_nmda, self.apicaloblique_nmda))
+                    self._connect_feed(self.ncfrom_extinput, gid_src,
+                                       nc_dict_nmda, self.basal2_nmda)
+                    self._connect_feed(self.ncfrom_extinput, gid_src,
+                                       nc_dict_nmda, self.basal3_nmda)
+                    self._connect_feed(self.ncfrom_extinput, gid_src,
+                                       nc_dict_nmda, self.apicaloblique_nmda)
                 # Distal feed NMDA synsapes
                 elif p_src['loc'] == 'distal':
                     # apical tuft
-                    self.ncfrom_extinput.append(
-                        self.parconnect_from_src(
-                            gid_src, nc_dict_nmda, self.apicaltuft_nmda))
+                    self._connect_feed(self.ncfrom_extinput, gid_src,
+                                       nc_dict_nmda, self.apicaltuft_nmda)
 
     # one parreceive function to handle all types of external parreceives
     # types must be defined explicitly here
@@ -964,36 +944,28 @@ class L5Pyr(Pyr):
                 }
 
                 if p_ext['loc'] == 'proximal':
-                    self.ncfrom_ev.append(
-                        self.parconnect_from_src(
-                            gid_ev, nc_dict_ampa, self.basal2_ampa))
-                    self.ncfrom_ev.append(
-                        self.parconnect_from_src(
-                            gid_ev, nc_dict_ampa, self.basal3_ampa))
-                    self.ncfrom_ev.append(
-                        self.parconnect_from_src(
-                            gid_ev, nc_dict_ampa, self.apicaloblique_ampa))
+                    self._connect_feed(self.ncfrom_ev, gid_ev, nc_dict_ampa,
+                                       self.basal2_ampa)
+                    self._connect_feed(self.ncfrom_ev, gid_ev, nc_dict_ampa,
+                                       self.basal3_ampa)
+                    self._connect_feed(self.ncfrom_ev, gid_ev, nc_dict_ampa,
+                                       self.apicaloblique_ampa)
 
                     # NEW: note that default/original is 0 nmda weight
                     # for these proximal dends
-                    self.ncfrom_ev.append(
-                        self.parconnect_from_src(
-                            gid_ev, nc_dict_nmda, self.basal2_nmda))
-                    self.ncfrom_ev.append(
-                        self.parconnect_from_src(
-                            gid_ev, nc_dict_nmda, self.basal3_nmda))
-                    self.ncfrom_ev.append(
-                        self.parconnect_from_src(
-                            gid_ev, nc_dict_nmda, self.apicaloblique_nmda))
+                    self._connect_feed(self.ncfrom_ev, gid_ev, nc_dict_nmda,
+                                       self.basal2_nmda)
+                    self._connect_feed(self.ncfrom_ev, gid_ev, nc_dict_nmda,
+                                       self.basal3_nmda)
+                    self._connect_feed(self.ncfrom_ev, gid_ev, nc_dict_nmda,
+                                       self.apicaloblique_nmda)
 
                 elif p_ext['loc'] == 'distal':
                     # apical tuft
-                    self.ncfrom_ev.append(
-                        self.parconnect_from_src(
-                            gid_ev, nc_dict_ampa, self.apicaltuft_ampa))
-                    self.ncfrom_ev.append(
-                        self.parconnect_from_src(
-                            gid_ev, nc_dict_nmda, self.apicaltuft_nmda))
+                    self._connect_feed(self.ncfrom_ev, gid_ev, nc_dict_ampa,
+                                       self.apicaltuft_ampa)
+                    self._connect_feed(self.ncfrom_ev, gid_ev, nc_dict_nmda,
+                                       self.apicaltuft_nmda)
 
         elif type == 'extgauss':
             # gid is this cell's gid
@@ -1020,15 +992,12 @@ class L5Pyr(Pyr):
                     'type_src': type
                 }
 
-                self.ncfrom_extgauss.append(
-                    self.parconnect_from_src(
-                        gid_extgauss, nc_dict, self.basal2_ampa))
-                self.ncfrom_extgauss.append(
-                    self.parconnect_from_src(
-                        gid_extgauss, nc_dict, self.basal3_ampa))
-                self.ncfrom_extgauss.append(
-                    self.parconnect_from_src(
-                        gid_extgauss, nc_dict, self.apicaloblique_ampa))
+                self._connect_feed(self.ncfrom_extgauss, gid_extgauss, nc_dict,
+                                   self.basal2_ampa)
+                self._connect_feed(self.ncfrom_extgauss, gid_extgauss, nc_dict,
+                                   self.basal3_ampa)
+                self._connect_feed(self.ncfrom_extgauss, gid_extgauss, nc_dict,
+                                   self.apicaloblique_ampa)
 
         elif type == 'extpois':
             if self.celltype in p_ext.keys():
@@ -1045,25 +1014,19 @@ class L5Pyr(Pyr):
                     'type_src': type
                 }
 
-                self.ncfrom_extpois.append(
-                    self.parconnect_from_src(
-                        gid_extpois, nc_dict, self.basal2_ampa))
-                self.ncfrom_extpois.append(
-                    self.parconnect_from_src(
-                        gid_extpois, nc_dict, self.basal3_ampa))
-                self.ncfrom_extpois.append(
-                    self.parconnect_from_src(
-                        gid_extpois, nc_dict, self.apicaloblique_ampa))
+                self._connect_feed(self.ncfrom_extpois, gid_extpois, nc_dict,
+                                   self.basal2_ampa)
+                self._connect_feed(self.ncfrom_extpois, gid_extpois, nc_dict,
+                                   self.basal3_ampa)
+                self._connect_feed(self.ncfrom_extpois, gid_extpois, nc_dict,
+                                   self.apicaloblique_ampa)
 
                 if p_ext[self.celltype][1] > 0.0:
                     # index 1 for nmda weight
                     nc_dict['A_weight'] = p_ext[self.celltype][1]
-                    self.ncfrom_extpois.append(
-                        self.parconnect_from_src(
-                            gid_extpois, nc_dict, self.basal2_nmda))
-                    self.ncfrom_extpois.append(
-                        self.parconnect_from_src(
-                            gid_extpois, nc_dict, self.basal3_nmda))
-                    self.ncfrom_extpois.append(
-                        self.parconnect_from_src(
-                            gid_extpois, nc_dict, self.apicaloblique_nmda))
+                    self._connect_feed(self.ncfrom_extpois, gid_extpois,
+                                       nc_dict, self.basal2_nmda)
+                    self._connect_feed(self.ncfrom_extpois, gid_extpois,
+                                       nc_dict, self.basal3_nmda)
+                    self._connect_feed(self.ncfrom_extpois, gid_extpois,
+                                       nc_dict, self.apicaloblique_nmda)
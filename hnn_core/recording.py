@@ -0,0 +1,56 @@
+"""Recordings of long simulations appended to the disk."""
+
+import os
+import os.path as op
+
+import numpy as np
+
+
+class _RecordStore(object):
+    """The recordings of a trial by one process, appended chunk by chunk.
+
+    Each recording is a raw file of little-endian floats or integers
+    named ``<key>.<rank>-<nhosts>.<f8|i8>`` in the directory
+    ``trial_<trial_idx>`` of record_dir. The files of the trial written
+    by this process are emptied when the store is created.
+
+    Parameters
+    ----------
+    record_dir : str
+        The directory of the recordings.
+    trial_idx : int
+        The index of the trial.
+    """
+
+    def __init__(self, record_dir, trial_idx):  # noqa: D102
+        from .parallel import rank, nhosts
+
+        self.trial_dir = op.join(record_dir, 'trial_%d' % trial_idx)
+        if not op.isdir(self.trial_dir):
+            os.makedirs(self.trial_dir, exist_ok=True)
+        self._suffix = '.%d-%d' % (rank, nhosts)
+        for fname in os.listdir(self.trial_dir):
+            if op.splitext(fname)[0].endswith(self._suffix):
+                os.remove(op.join(self.trial_dir, fname))
+
+    def _get_fname(self, key, dtype):
+        ext = 'i8' if np.dtype(dtype).kind in 'iu' else 'f8'
+        return op.join(self.trial_dir, '%s%s.%s' % (key, self._suffix, ext))
+
+    def append(self, key, data):
+        """Append data to the recording key."""
+        data = np.asarray(data)
+        dtype = '<i8' if data.dtype.kind in 'iu' else '<f8'
+        with open(self._get_fname(key, dtype), 'ab') as fid:
+            data.astype(dtype, copy=False).tofile(fid)
+
+    def read(self, key, dtype=float):
+        """Read the recording key through a memory map.
+
+        Returns an empty array if nothing was appended to it.
+        """
+        dtype = '<i8' if np.dtype(dtype).kind in 'iu' else '<f8'
+        fname = self._get_fname(key, dtype)
+        if not op.exists(fname) or op.getsize(fname) == 0:
+            return np.zeros(0, dtype)
+        return np.memmap(fname, dtype=dtype, mode='r')
@@ -0,0 +1,274 @@
+"""Class to handle the spikes of several trials."""
+
+import numpy as np
+
+
+class Spikes(object):
+    """The spikes of several trials stored in columns.
+
+    The spikes are sorted by trial, then by time and gid. An index of the
+    spikes sorted by gid gives the spikes of a cell or of a cell type
+    without going through all the spikes.
+
+    Parameters
+    ----------
+    times : array (n_spikes,)
+        The spike times in ms.
+    gids : array (n_spikes,)
+        The gids of the cells that spiked.
+    trials : array (n_spikes,)
+        The trial of each spike.
+    gid_dict : dict of range
+        The gids of each cell type.
+    n_trials : int | None
+        The number of trials. If None, it is the last trial with spikes
+        plus one.
+
+    Attributes
+    ----------
+    times : array of float
+        The spike times in ms.
+    gids : array of int
+        The gids of the cells that spiked.
+    trials : array of int
+        The trial of each spike.
+    gid_dict : dict of range
+        The gids of each cell type.
+    n_trials : int
+        The number of trials.
+    n_gids : int
+        The number of gids.
+    """
+
+    def __init__(self, times, gids, trials, gid_dict,
+                 n_trials=None):  # noqa: D102
+        times = np.asarray(times, dtype=float)
+        gids = np.asarray(gids, dtype=int)
+        trials = np.asarray(trials, dtype=int)
+        if not times.shape == gids.shape == trials.shape or times.ndim != 1:
+            raise ValueError('times, gids and trials must be 1D arrays of '
+                             'same length, got shapes %s, %s and %s'
+                             % (times.shape, gids.shape, trials.shape))
+        if n_trials is None:
+            n_trials = int(trials.max()) + 1 if len(trials) > 0 else 0
+        self.gid_dict = gid_dict
+        self.n_trials = n_trials
+        self.n_gids = max([gid_range[-1] + 1 for gid_range in
+                           gid_dict.values() if len(gid_range) > 0] +
+                          [int(gids.max()) + 1 if len(gids) > 0 else 0])
+
+        order = np.lexsort((gids, times, trials))
+        self.times = times[order]
+        self.gids = gids[order]
+        self.trials = trials[order]
+        # the spikes of trial i are in trial_ptr[i]:trial_ptr[i + 1]
+        self._trial_ptr = np.searchsorted(self.trials,
+                                          np.arange(n_trials + 1))
+        # the spikes of gid i are gid_order[gid_ptr[i]:gid_ptr[i + 1]]
+        self._gid_order = np.argsort(self.gids, kind='stable')
+        self._gid_ptr = np.searchsorted(self.gids[self._gid_order],
+                                        np.arange(self.n_gids + 1))
+
+    @classmethod
+    def from_trials(cls, spiketimes, spikegids, gid_dict):
+        """Make the spikes from the spikes of each trial.
+
+        Parameters
+        ----------
+        spiketimes : list (n_trials,) of array
+            The spike times of each trial.
+        spikegids : list (n_trials,) of array
+            The gids of the cells that spiked in each trial.
+        gid_dict : dict of range
+            The gids of each cell type.
+
+        Returns
+        -------
+        spikes : instance of Spikes
+            The spikes of all the trials.
+        """
+        trials = [np.full(len(times), trial_idx, dtype=int)
+                  for trial_idx, times in enumerate(spiketimes)]
+        return cls(np.concatenate([np.zeros(0)] + list(spiketimes)),
+                   np.concatenate([np.zeros(0, int)] + list(spikegids)),
+                   np.concatenate([np.zeros(0, int)] + trials), gid_dict,
+                   n_trials=len(spiketimes))
+
+    def __len__(self):
+        return len(self.times)
+
+    def __repr__(self):
+        class_name = self.__class__.__name__
+        return '<%s | %d spikes, %d trials>' % (class_name, len(self),
+                                                self.n_trials)
+
+    def _get_gids(self, cell_type):
+        """Get the gids of one or several cell types."""
+        if isinstance(cell_type, str):
+            cell_type = [cell_type]
+        gids = list()
+        for this_type in cell_type:
+            if this_type not in self.gid_dict:
+                raise ValueError('cell_type must be one of %s, got %s'
+                                 % (', '.join(self.gid_dict), this_type))
+            gids.extend(self.gid_dict[this_type])
+        return gids
+
+    def _get_gid_idxs(self, gids):
+        """Get the indices of the spikes of some gids."""
+        idxs = [self._gid_order[self._gid_ptr[gid]:self._gid_ptr[gid + 1]]
+                for gid in gids if 0 <= gid < self.n_gids]
+        if len(idxs) == 0:
+            return np.zeros(0, int)
+        return np.sort(np.concatenate(idxs))
+
+    def get_trial(self, trial_idx):
+        """Get the spikes of a trial.
+
+        Parameters
+        ----------
+        trial_idx : int
+            The index of the trial.
+
+        Returns
+        -------
+        times : array of float
+            The spike times sorted in time. It is a view of the times.
+        gids : array of int
+            The gids of the cells that spiked. It is a view of the gids.
+        """
+        if not 0 <= trial_idx < self.n_trials:
+            raise ValueError('trial_idx must be between 0 and %d, got %s'
+                             % (self.n_trials - 1, trial_idx))
+        start, stop = self._trial_ptr[trial_idx:trial_idx + 2]
+        return self.times[start:stop], self.gids[start:stop]
+
+    def select(self, cell_type=None, gids=None, trials=None, tmin=None,
+               tmax=None):
+        """Select the spikes of some cells, trials and time window.
+
+        Parameters
+        ----------
+        cell_type : str | list of str | None
+            The cell types, e.g. 'L5_pyramidal' or 'evprox1'. If None,
+            the spikes of all the cell types are selected.
+        gids : list of int | None
+            The gids of the cells. If None, the spikes of all the cells
+            are selected.
+        trials : list of int | None
+            The indices of the trials. If None, the spikes of all the
+            trials are selected.
+        tmin : float | None
+            The start of the time window in ms (included).
+        tmax : float | None
+            The end of the time window in ms (excluded).
+
+        Returns
+        -------
+        spikes : instance of Spikes
+            The selected spikes. The trials keep their indices.
+        """
+        if cell_type is None and gids is None:
+            idxs = None
+        else:
+            sel_gids = set(range(self.n_gids))
+            if cell_type is not None:
+                sel_gids &= set(self._get_gids(cell_type))
+            if gids is not None:
+                sel_gids &= set(gids)
+            idxs = self._get_gid_idxs(sorted(sel_gids))
+
+        if trials is not None:
+            trial_idxs = [np.arange(*self._trial_ptr[trial_idx:trial_idx + 2])
+                          for trial_idx in sorted(set(trials))
+                          if 0 <= trial_idx < self.n_trials]
+            trial_idxs = np.concatenate([np.zeros(0, int)] + trial_idxs)
+            idxs = (trial_idxs if idxs is None else
+                    np.intersect1d(idxs, trial_idxs, assume_unique=True))
+        if idxs is None:
+            idxs = np.arange(len(self))
+
+        times = self.times[idxs]
+        mask = np.ones(len(idxs), bool)
+        if tmin is not None:
+            mask &= times >= tmin
+        if tmax is not None:
+            mask &= times < tmax
+        idxs = idxs[mask]
+        return Spikes(self.times[idxs], self.gids[idxs], self.trials[idxs],
+                      self.gid_dict, n_trials=self.n_trials)
+
+    def get_counts(self, trial_idx=None):
+        """Count the spikes of each cell.
+
+        Parameters
+        ----------
+        trial_idx : int | None
+            The index of the trial. If None, the spikes of all the trials
+            are counted.
+
+        Returns
+        -------
+        counts : array (n_gids,)
+            The number of spikes of each gid.
+        """
+        if trial_idx is None:
+            counts = np.diff(self._gid_ptr)
+        else:
+            _, gids = self.get_trial(trial_idx)
+            counts = np.bincount(gids, minlength=self.n_gids)
+        return counts
+
+    def get_type_counts(self, trial_idx=None):
+        """Count the spikes of each cell type.
+
+        Parameters
+        ----------
+        trial_idx : int | None
+            The index of the trial. If None, the spikes of all the trials
+            are counted.
+
+        Returns
+        -------
+        counts : dict of int
+            The number of spikes of each cell type.
+        """
+        counts = np.r_[0, np.cumsum(self.get_counts(trial_idx))]
+        return dict((cell_type, int(counts[gid_range.stop] -
+                                    counts[gid_range.start]))
+                    for cell_type, gid_range in self.gid_dict.items())
+
+    def save(self, fname):
+        """Save the spikes to a .npz file.
+
+        Parameters
+        ----------
+        fname : str
+            The name of the file.
+        """
+        cell_types = list(self.gid_dict)
+        np.savez(fname, times=self.times, gids=self.gids, trials=self.trials,
+                 n_trials=self.n_trials, cell_types=np.array(cell_types),
+                 gid_starts=[self.gid_dict[key].start for key in cell_types],
+                 gid_stops=[self.gid_dict[key].stop for key in cell_types])
+
+
+def read_spikes(fname):
+    """Read the spikes saved with Spikes.save.
+
+    Parameters
+    ----------
+    fname : str
+        The name of the .npz file.
+
+    Returns
+    -------
+    spikes : instance of Spikes
+        The spikes.
+    """
+    with np.load(fname) as data:
+        gid_dict = dict((str(key), range(start, stop)) for key, start, stop
+                        in zip(data['cell_types'], data['gid_starts'],
+                               data['gid_stops']))
+        return Spikes(data['times'], data['gids'], data['trials'], gid_dict,
+                      n_trials=int(data['n_trials']))
@@ -0,0 +1,228 @@
+"""Equilibrium state of the cells."""
+
+import gc
+import os
+import os.path as op
+import sys
+import json
+import pickle
+import shutil
+import hashlib
+import tempfile
+import subprocess
+
+import numpy as np
+from neuron import h
+
+from .params_default import (get_L2Pyr_params_default,
+                             get_L5Pyr_params_default)
+
+# duration of the simulation of an isolated cell to reach equilibrium
+_SETTLE_TIME = 5000.
+
+# equilibrium states already computed in this process
+_steady_states = dict()
+
+
+def _get_state_names(sect):
+    """Get the names of the state variables of the segments of a section."""
+    names = list()
+    for mech in sect(0.5):
+        if mech.name().endswith('_ion'):  # the concentrations are below
+            continue
+        ms = h.MechanismStandard(mech.name(), 3)  # 3 is for STATE
+        name = h.ref('')
+        for idx in range(int(ms.count())):
+            ms.name(name, idx)
+            names.append(name[0])
+    for ion in ('na', 'k', 'ca'):
+        if h.ismembrane('%s_ion' % ion, sec=sect):
+            names.extend(['%si' % ion, '%so' % ion])
+    return names
+
+
+def _get_cell_state(cell):
+    """Get the voltages and state variables of all the segments of a cell.
+
+    The values are ordered by section, then by segment.
+    """
+    state = list()
+    for sect in cell.soma.wholetree():
+        state.extend(seg.v for seg in sect.allseg())
+        names = _get_state_names(sect)
+        for seg in sect:
+            state.extend(getattr(seg, name) for name in names)
+    return np.array(state)
+
+
+def _set_cell_state(cell, state):
+    """Set the state returned by _get_cell_state to a cell of same type."""
+    idx = 0
+    for sect in cell.soma.wholetree():
+        for seg in sect.allseg():
+            seg.v = state[idx]
+            idx += 1
+        names = _get_state_names(sect)
+        for seg in sect:
+            for name in names:
+                setattr(seg, name, state[idx])
+                idx += 1
+
+
+def _get_rest_dipole(cell):
+    """Get the dipole of a cell at equilibrium in fAm."""
+    if not hasattr(cell, 'dipole_pp'):
+        return 0.
+    dipole = 0.
+    for sect, dpp in zip(cell.list_all, cell.dipole_pp):
+        dipole += sum(seg.dipole.Q for seg in sect) + dpp.Q
+    return dipole
+
+
+def _get_steady_state_key(celltype, params):
+    """Hash the parameters that the equilibrium of a cell type depends on."""
+    from . import __version__
+    from .cache import _get_mechanism_hash
+
+    if celltype == 'L2_pyramidal':
+        biophys = get_L2Pyr_params_default()
+    elif celltype == 'L5_pyramidal':
+        biophys = get_L5Pyr_params_default()
+    else:  # the properties of the basket cells are hard-coded
+        biophys = dict()
+    biophys = dict((key, params.get(key, value))
+                   for key, value in biophys.items())
+    desc = dict(celltype=celltype, biophys=biophys,
+                celsius=params['celsius'], version=__version__,
+                mechanisms=_get_mechanism_hash())
+    desc = json.dumps(desc, sort_keys=True, default=str)
+    return hashlib.sha1(desc.encode('utf-8')).hexdigest()
+
+
+def _compute_steady_state(Cell, params):
+    """Simulate an isolated cell until it reaches its equilibrium.
+
+    Parameters
+    ----------
+    Cell : class
+        The class of the cell, e.g. L2Pyr.
+    params : dict
+        The parameters of the network.
+
+    Returns
+    -------
+    state : array
+        The state of the cell at equilibrium.
+    rest_dipole : float
+        The dipole of the cell at equilibrium in fAm.
+
+    Notes
+    -----
+    h.finitialize and cvode.solve act on all the sections and events of
+    the process. If the cells of other networks exist, the equilibrium
+    is computed in a new process.
+    """
+    from .parallel import cvode
+
+    # the cells of networks that are no longer used may be in cycles
+    gc.collect()
+    if len(list(h.allsec())) > 0:
+        return _compute_steady_state_child(Cell, params)
+    if Cell.__name__.endswith('Pyr'):
+        cell = Cell(-1, (0, 0, 0), params)
+    else:
+        cell = Cell(-1, (0, 0, 0))
+    h.celsius = params['celsius']
+    # the variable time step integrates the slow approach to
+    # equilibrium in few steps
+    cvode_active = cvode.active()
+    cvode.active(1)
+    try:
+        h.finitialize(-65.)
+        cvode.solve(_SETTLE_TIME)
+        # compute the dipole mechanisms at the final state
+        h.fcurrent()
+    finally:
+        cvode.active(cvode_active)
+    state = _get_cell_state(cell)
+    rest_dipole = _get_rest_dipole(cell)
+    return state, rest_dipole
+
+
+def _compute_steady_state_child(Cell, params):
+    """Compute the equilibrium of a cell in a new process.
+
+    The arguments and outputs are those of _compute_steady_state.
+    """
+    from .parallel import _get_child_env
+
+    code = 'from hnn_core.steady_state import _run_child; _run_child()'
+    tmp_dir = tempfile.mkdtemp(prefix='hnn_core_steady_state_')
+    try:
+        in_fname = op.join(tmp_dir, 'in.pkl')
+        out_fname = op.join(tmp_dir, 'out.pkl')
+        with open(in_fname, 'wb') as fid:
+            pickle.dump((Cell, params), fid)
+        cmd = [sys.executable, '-c', code, in_fname, out_fname]
+        proc = subprocess.run(cmd, env=_get_child_env())
+        if proc.returncode != 0 or not op.exists(out_fname):
+            raise RuntimeError('The computation of the steady state failed '
+                               'with exit code %d' % proc.returncode)
+        with open(out_fname, 'rb') as fid:
+            return pickle.load(fid)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _run_child():
+    """Compute the equilibrium pickled in sys.argv[1] into sys.argv[2]."""
+    in_fname, out_fname = sys.argv[-2:]
+    with open(in_fname, 'rb') as fid:
+        Cell, params = pickle.load(fid)
+    out = _compute_steady_state(Cell, params)
+    with open(out_fname, 'wb') as fid:
+        pickle.dump(out, fid)
+
+
+def _get_steady_state(Cell, celltype, params, cache_dir=None):
+    """Get the equilibrium of a cell type from the cache or compute it.
+
+    Parameters
+    ----------
+    Cell : class
+        The class of the cell, e.g. L2Pyr.
+    celltype : str
+        The type of the cell, e.g. 'L2_pyramidal'.
+    params : dict
+        The parameters of the network.
+    cache_dir : str | None
+        The directory where the equilibrium states are cached. If None,
+        they are only kept for the duration of the process.
+
+    Returns
+    -------
+    state : array
+        The state of the cell at equilibrium.
+    rest_dipole : float
+        The dipole of the cell at equilibrium in fAm.
+    """
+    key = _get_steady_state_key(celltype, params)
+    fname = None
+    if cache_dir is not None:
+        fname = op.join(cache_dir, key + '.npz')
+
+    if key not in _steady_states and fname is not None and op.exists(fname):
+        with np.load(fname) as data:
+            _steady_states[key] = (data['state'], float(data['rest_dipole']))
+    elif key not in _steady_states:
+        print('Computing the steady state of %s cells' % celltype)
+        _steady_states[key] = _compute_steady_state(Cell, params)
+
+    state, rest_dipole = _steady_states[key]
+    if fname is not None and not op.exists(fname):
+        if not op.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        tmp_fname = op.join(cache_dir, '%s.%d.tmp.npz' % (key, os.getpid()))
+        np.savez(tmp_fname, state=state, rest_dipole=rest_dipole)
+        os.replace(tmp_fname, fname)
+    return state, rest_dipole
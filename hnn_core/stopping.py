@@ -0,0 +1,231 @@
+"""Conditions to stop the trials that are not worth simulating further."""
+
+from copy import deepcopy
+
+import numpy as np
+
+
+def _get_gids(gid_dict, cell_type):
+    """Get the gids of one or several cell types."""
+    if isinstance(cell_type, str):
+        cell_type = [cell_type]
+    return np.concatenate([np.arange(gid_dict[this_type].start,
+                                     gid_dict[this_type].stop)
+                           for this_type in cell_type])
+
+
+class FiringRateStop(object):
+    """Stop a trial when the firing rate of a population is out of bounds.
+
+    Parameters
+    ----------
+    cell_type : str | list of str
+        The cell types of the population.
+    rate_min : float | None
+        The firing rate in Hz per cell below which the trial is stopped.
+        If None, there is no lower bound.
+    rate_max : float | None
+        The firing rate in Hz per cell above which the trial is stopped,
+        e.g., when all the cells fire continuously. If None, there is no
+        upper bound.
+    window : float
+        The duration in ms of the window before the current time in which
+        the firing rate is computed.
+    tmin : float
+        The time in ms from which the condition is checked.
+    """
+
+    def __init__(self, cell_type='L5_pyramidal', rate_min=None,
+                 rate_max=None, window=50., tmin=0.):  # noqa: D102
+        if rate_min is None and rate_max is None:
+            raise ValueError('rate_min or rate_max must be given')
+        if window <= 0:
+            raise ValueError('window must be positive, got %s' % window)
+        self.cell_type = cell_type
+        self.rate_min = rate_min
+        self.rate_max = rate_max
+        self.window = window
+        self.tmin = tmin
+
+    def __call__(self, times, dpl, spiketimes, spikegids, gid_dict):
+        """Check the condition. See simulate_sweep."""
+        t = times[-1]
+        if t < max(self.tmin, self.window):
+            return None
+        gids = _get_gids(gid_dict, self.cell_type)
+        mask = (spiketimes > t - self.window) & np.isin(spikegids, gids)
+        rate = 1e3 * np.sum(mask) / (len(gids) * self.window)
+        if self.rate_max is not None and rate > self.rate_max:
+            return ('firing rate of %0.1f Hz above %s Hz at %0.2f ms'
+                    % (rate, self.rate_max, t))
+        if self.rate_min is not None and rate < self.rate_min:
+            return ('firing rate of %0.1f Hz below %s Hz at %0.2f ms'
+                    % (rate, self.rate_min, t))
+        return None
+
+
+class DipoleStop(object):
+    """Stop a trial when the amplitude of the dipole is too large.
+
+    Parameters
+    ----------
+    amplitude_max : float
+        The amplitude in nAm of the aggregate dipole, after the baseline
+        renormalization and the scaling, above which the trial is
+        stopped.
+    tmin : float
+        The time in ms from which the condition is checked.
+    """
+
+    def __init__(self, amplitude_max, tmin=0.):  # noqa: D102
+        if amplitude_max <= 0:
+            raise ValueError('amplitude_max must be positive, got %s'
+                             % amplitude_max)
+        self.amplitude_max = amplitude_max
+        self.tmin = tmin
+        # the samples checked before are not needed again
+        self.window = 0.
+
+    def __call__(self, times, dpl, spiketimes, spikegids, gid_dict):
+        """Check the condition. See simulate_sweep."""
+        amplitude = np.abs(dpl[times >= self.tmin])
+        if len(amplitude) > 0 and amplitude.max() > self.amplitude_max:
+            return ('dipole of %0.1f nAm above %s nAm at %0.2f ms'
+                    % (amplitude.max(), self.amplitude_max, times[-1]))
+        return None
+
+
+class SilenceStop(object):
+    """Stop a trial when a population does not spike after some time.
+
+    Parameters
+    ----------
+    tmin : float
+        The time in ms after which the population must spike.
+    window : float
+        The duration in ms after tmin without any spike after which the
+        trial is stopped.
+    cell_type : str | list of str | None
+        The cell types of the population. If None, the spikes of all the
+        cells and feeds are counted.
+    """
+
+    def __init__(self, tmin, window=50., cell_type=None):  # noqa: D102
+        if window <= 0:
+            raise ValueError('window must be positive, got %s' % window)
+        self.tmin = tmin
+        self.window = window
+        self.cell_type = cell_type
+        self._checked = False
+
+    def __call__(self, times, dpl, spiketimes, spikegids, gid_dict):
+        """Check the condition. See simulate_sweep."""
+        t = times[-1]
+        # the spikes after tmin are only all available at the first check
+        # after tmin + window, which decides
+        if self._checked or t < self.tmin + self.window:
+            return None
+        self._checked = True
+        mask = spiketimes > self.tmin
+        if self.cell_type is not None:
+            mask &= np.isin(spikegids, _get_gids(gid_dict, self.cell_type))
+        if not np.any(mask):
+            return 'no spike between %s and %0.2f ms' % (self.tmin, t)
+        return None
+
+
+class _StopMonitor(object):
+    """Check the stop conditions on what a trial recorded so far.
+
+    Only the data of the last ``window`` ms are kept between two checks,
+    where window is the largest window attribute of the conditions. If a
+    condition has no window attribute, all the data are kept.
+
+    Parameters
+    ----------
+    net : Network object
+        The network being simulated.
+    t_vec : h.Vector
+        The recording of the time.
+    dp_rec : dict of list of h.Vector
+        The recordings of the dipoles of each thread.
+    conditions : list of callable
+        The stop conditions. They are copied so that their state is
+        specific to the trial.
+    """
+
+    def __init__(self, net, t_vec, dp_rec, conditions):  # noqa: D102
+        self.net = net
+        self.t_vec = t_vec
+        self.dp_rec = dp_rec
+        self.conditions = deepcopy(conditions)
+        self.window = None
+        if all(hasattr(condition, 'window') for condition in conditions):
+            self.window = max([condition.window for condition in conditions],
+                              default=0.)
+        self.times = np.zeros(0)
+        self.dpl = np.zeros(0)
+        self.spiketimes = np.zeros(0)
+        self.spikegids = np.zeros(0, int)
+        self._n_times = 0
+        self._n_spikes = 0
+
+    def check(self):
+        """Check the conditions.
+
+        Returns
+        -------
+        stop_reason : str | None
+            Why the trial must be stopped, or None if it must go on.
+        """
+        from neuron import h
+        from .dipole import Dipole, _postprocess_dipole
+        from .parallel import nhosts, pc, rank
+
+        n_times = self._n_times
+        times = self.t_vec.as_numpy()[n_times:].copy()
+        data = np.empty((len(times), 3))
+        for idx, layer in ((1, 'L2'), (2, 'L5')):
+            layer_data = h.Vector(np.sum(
+                [np.zeros(len(times))] +
+                [rec.as_numpy()[n_times:] for rec in self.dp_rec[layer]],
+                axis=0))
+            if nhosts > 1:
+                pc.allreduce(layer_data, 1)
+            data[:, idx] = layer_data.as_numpy()
+        np.add(data[:, 1], data[:, 2], out=data[:, 0])
+        dpl = Dipole(times, data)
+        _postprocess_dipole(self.net, dpl, smooth=False)
+
+        spiketimes = self.net.spiketimes.as_numpy()[self._n_spikes:].copy()
+        spikegids = self.net.spikegids.as_numpy()[self._n_spikes:].astype(int)
+        self._n_spikes += len(spiketimes)
+        if nhosts > 1:
+            # all the processes check the same spikes to stop together
+            spiketimes = np.concatenate(pc.py_allgather(spiketimes))
+            spikegids = np.concatenate(pc.py_allgather(spikegids))
+
+        self._n_times += len(times)
+        self.times = np.r_[self.times, times]
+        self.dpl = np.r_[self.dpl, dpl.dpl['agg']]
+        self.spiketimes = np.r_[self.spiketimes, spiketimes]
+        self.spikegids = np.r_[self.spikegids, spikegids]
+        if len(self.times) == 0:
+            return None
+        for condition in self.conditions:
+            stop_reason = condition(self.times, self.dpl, self.spiketimes,
+                                    self.spikegids, self.net.gid_dict)
+            if stop_reason is not None:
+                if rank == 0:
+                    print('Stopping the trial: %s' % stop_reason)
+                return stop_reason
+
+        if self.window is not None:
+            # drop what the next check does not need
+            tstart = self.times[-1] - self.window
+            keep = self.times > tstart
+            self.times, self.dpl = self.times[keep], self.dpl[keep]
+            keep = self.spiketimes > tstart
+            self.spiketimes = self.spiketimes[keep]
+            self.spikegids = self.spikegids[keep]
+        return None
@@ -0,0 +1,500 @@
+"""Simulation of variants of a network."""
+
+import fnmatch
+import itertools as it
+
+import numpy as np
+from neuron import h
+
+from .feed import _get_active_feeds, _drop_event_time_params
+from .params import create_pext
+from .parallel import _parallel_func
+
+
+class _KeyRecorder(dict):
+    """A dict that records the keys that are read."""
+
+    def __init__(self, *args, **kwargs):  # noqa: D102
+        super(_KeyRecorder, self).__init__(*args, **kwargs)
+        self.keys_read = set()
+
+    def __getitem__(self, key):
+        self.keys_read.add(key)
+        return super(_KeyRecorder, self).__getitem__(key)
+
+
+def _get_feed_params(params):
+    """Get the names of the parameters that the feeds are created from."""
+    tstop = params['tstop']
+    params = _KeyRecorder(params)
+    create_pext(params, tstop)
+    return params.keys_read
+
+
+def _drop_feed_times(params):
+    """Create the parameters of the feeds other than their event times."""
+    p_ext, p_unique = create_pext(params, params['tstop'])
+    return ([_drop_event_time_params('extinput', p_src) for p_src in p_ext],
+            dict((ty, _drop_event_time_params(ty, p_type))
+                 for ty, p_type in p_unique.items()))
+
+
+def _expand_overlay(params, overlay):
+    """Replace the wildcards in the keys of an overlay by the matching keys.
+
+    The keys that match no parameter are kept as they are.
+    """
+    expanded = dict()
+    for key, value in overlay.items():
+        matches = [key] if key in params else fnmatch.filter(params, key)
+        if len(matches) == 0:
+            matches = [key]
+        expanded.update((match, value) for match in matches)
+    return expanded
+
+
+def _is_forkable(params, overlay):
+    """Whether an overlay only changes the event times of existing feeds."""
+    overlay = _expand_overlay(params, overlay)
+    if any(key not in params for key in overlay):
+        return False
+    # the changed parameters must only be used to create the feeds
+    feed_params = _get_feed_params(params)
+    if any(params[key] != value and key not in feed_params
+           for key, value in overlay.items()):
+        return False
+    variant_params = params.copy()
+    variant_params.update(overlay)
+    # and only change the event times of the feeds as read by feed.py
+    if _drop_feed_times(params) != _drop_feed_times(variant_params):
+        return False
+    # the overlay must not create or remove feeds, e.g., by setting the
+    # number of spikes of an evoked feed to zero
+    return (_get_active_feeds(*create_pext(params, params['tstop'])) ==
+            _get_active_feeds(*create_pext(variant_params,
+                                           variant_params['tstop'])))
+
+
+def _get_feeds(net):
+    """Get the feeds of the network created in this process."""
+    return list(it.chain(net.extinput_list, *net.ext_list.values()))
+
+
+def _get_event_times(net, overlay, trial_idx):
+    """Generate the event times of the feeds with an overlay of params.
+
+    The event times of the network are left unchanged.
+
+    Returns
+    -------
+    event_times : list of array
+        The event times of each feed returned by _get_feeds.
+    """
+    params = net.params.copy()
+    for key, value in overlay.items():
+        params[key] = value
+    # the trial overrides the seeds as in Network._reset_trial
+    if trial_idx != 0:
+        params['prng_*'] = trial_idx
+    p_ext, p_unique = create_pext(params, params['tstop'])
+
+    event_times = list()
+    for feed in _get_feeds(net):
+        p_ext_feed = feed.p_ext
+        times = feed.eventvec.as_numpy().copy()
+        if feed.ty == 'extinput':
+            feed.p_ext = p_ext[feed.gid - net.gid_dict['extinput'][0]]
+        else:
+            feed.p_ext = p_unique[feed.ty]
+        feed.set_prng()
+        feed.set_event_times()
+        event_times.append(feed.eventvec.as_numpy().copy())
+        feed.p_ext = p_ext_feed
+        feed.eventvec.from_python(times)
+    return event_times
+
+
+def _get_fork_time(base_times, variant_times, dt, tstop):
+    """Get the time until which a variant is identical to the network.
+
+    This is the last time step before the first event that differs.
+    """
+    t_event = tstop
+    for times1, times2 in zip(base_times, variant_times):
+        n_times = min(len(times1), len(times2))
+        diff_idx = np.nonzero(times1[:n_times] != times2[:n_times])[0]
+        idx = diff_idx[0] if len(diff_idx) > 0 else n_times
+        for times in (times1, times2):
+            if idx < len(times):
+                t_event = min(t_event, times[idx])
+    # the event must not have been delivered yet
+    n_steps = max(int(np.floor(t_event / dt)) - 1, 0)
+    return min(n_steps * dt, tstop)
+
+
+def _switch_feeds(net, base_times, variant_times, resume_ncs):
+    """Switch the feeds to the event times of a variant during a simulation.
+
+    The events that were already delivered must be the same. resume_ncs
+    contains a NetCon targeting the VecStim of each feed that differs.
+    """
+    for feed_idx, feed in enumerate(_get_feeds(net)):
+        times1, times2 = base_times[feed_idx], variant_times[feed_idx]
+        if np.array_equal(times1, times2):
+            continue
+        vs = feed.vs
+        # the index of the event that the VecStim waits for
+        next_idx = int(vs.index) - 1 if vs.index > 0 else len(times1)
+        feed.eventvec.from_python(times2)
+        # ignore the event that is already scheduled
+        vs.restart += 1
+        if next_idx < len(times2):
+            vs.index = next_idx + 1
+            vs.etime = times2[next_idx]
+            resume_ncs[feed_idx].event(times2[next_idx])
+        else:
+            vs.index = -1
+
+
+def _simulate_forks(net, overlays, trial_idx, variant_idxs=None):
+    """Simulate the variants of a trial from the state they share.
+
+    The network is simulated until the time at which the first variant
+    differs, its state is saved and the variant is simulated until the
+    end. The state is then restored and the network simulated until the
+    next variant differs.
+
+    Parameters
+    ----------
+    net : Network object
+        The built network, set up for the trial.
+    overlays : list of dict
+        The parameters of each variant that differ from the network.
+        They must only change the event times of the feeds.
+    trial_idx : int
+        The index of the trial.
+    variant_idxs : list of int | None
+        The index of each variant, which names the files of the raw
+        dipoles saved with save_dpl. If None, the indices of overlays.
+
+    Returns
+    -------
+    out : list of tuple
+        The dipole, spike times, spike gids, recordings of the probes and
+        somatic currents of each variant.
+    """
+    from .dipole import _init_trial, _get_recordings, _collect_trial
+    from .parallel import pc
+
+    if variant_idxs is None:
+        variant_idxs = list(range(len(overlays)))
+    dt, tstop = net.params['dt'], net.params['tstop']
+    base_times = [feed.eventvec.as_numpy().copy()
+                  for feed in _get_feeds(net)]
+    variant_times = [_get_event_times(net, overlay, trial_idx)
+                     for overlay in overlays]
+    fork_times = [_get_fork_time(base_times, times, dt, tstop)
+                  for times in variant_times]
+    # the NetCons must exist before the state is saved
+    feeds = _get_feeds(net)
+    resume_ncs = dict((feed_idx, h.NetCon(None, feeds[feed_idx].vs))
+                      for feed_idx in range(len(feeds))
+                      if any(not np.array_equal(base_times[feed_idx],
+                                                times[feed_idx])
+                             for times in variant_times))
+
+    t_vec, dp_rec = _init_trial(net)
+    h.fcurrent()
+    h.frecord_init()
+    recordings = _get_recordings(net, t_vec, dp_rec)
+
+    out = [None] * len(overlays)
+    for fork_time in sorted(set(fork_times)):
+        if fork_time > h.t:
+            pc.psolve(fork_time)
+        print('Forking at %0.2f ms' % h.t)
+        ss = h.SaveState()
+        ss.save()
+        n_samples = dict((key, int(vec.size()))
+                         for key, vec in recordings.items())
+        for idx, overlay in enumerate(overlays):
+            if fork_times[idx] != fork_time:
+                continue
+            _switch_feeds(net, base_times, variant_times[idx], resume_ncs)
+            pc.psolve(tstop)
+            net._variant_idx = variant_idxs[idx]
+            out[idx] = _collect_trial(net, t_vec, dp_rec)
+            net._variant_idx = None
+
+            # go back to the fork
+            ss.restore(0)
+            for feed, times in zip(feeds, base_times):
+                feed.eventvec.from_python(times)
+            for key, vec in recordings.items():
+                vec.resize(n_samples[key])
+    return out
+
+
+def _fork_and_simulate(params, overlays, trial_idxs, net_kwargs=None,
+                       variant_idxs=None):
+    """Build the network once and simulate the forks of several trials."""
+    from .network import Network
+    from .parallel import pc
+
+    if net_kwargs is None:
+        net_kwargs = dict()
+    net = Network(params.copy(), n_jobs=1, **net_kwargs)
+    net.build()
+
+    out = list()
+    for trial_idx in trial_idxs:
+        net._reset_trial(trial_idx)
+        out.append(_simulate_forks(net, overlays, trial_idx, variant_idxs))
+
+    pc.gid_clear()
+    pc.nthread(1)
+    pc.done()
+    return out
+
+
+def simulate_forks(net, overlays, n_trials=1, n_jobs=1):
+    """Simulate variants of a network that differ in their feeds.
+
+    The variants whose feeds only differ after some time share the
+    simulation until that time. This speeds up sweeps over parameters
+    such as the time of a late evoked input.
+
+    Parameters
+    ----------
+    net : Network object
+        The network that the variants are derived from. It is left
+        unchanged.
+    overlays : list of dict
+        The parameters of each variant that differ from net.params.
+        The keys can contain wildcards as in Params.
+    n_trials : int
+        The number of trials to simulate for each variant.
+    n_jobs : int
+        The number of jobs to run in parallel.
+
+    Returns
+    -------
+    dpls : list of list of Dipole
+        The dipoles of each trial of each variant.
+    spikes : list of Spikes
+        The spikes of all the trials of each variant.
+
+    Notes
+    -----
+    A variant shares the simulation of the network until the last time
+    step before the first event of its feeds that differs. The variants
+    that change other parameters than the event times of the feeds
+    (e.g., the weights of the feeds or of the connections) share
+    nothing and are simulated from the start with their own network.
+
+    With save_dpl, the raw dipole of each trial of each variant is saved
+    to ``rawdpl_<trial_idx>_variant_<variant_idx>.dpl``. The probes are
+    not recorded, so the network must have none.
+    """
+    from .dipole import _clone_and_simulate
+    from .spikes import Spikes
+
+    if len(net.probes) > 0:
+        raise ValueError('The probes are not recorded by simulate_forks. '
+                         'Remove them from the network or use '
+                         'simulate_dipole, got %s' % list(net.probes))
+    net_kwargs = dict(weight_cutoff=net.weight_cutoff,
+                      n_threads=net.n_threads,
+                      steady_state=net.steady_state,
+                      load_balance=net.load_balance)
+    fork_idxs = [idx for idx, overlay in enumerate(overlays)
+                 if _is_forkable(net.params, overlay)]
+    print('Forking %d of %d variants' % (len(fork_idxs), len(overlays)))
+
+    results = [None] * len(overlays)
+    parallel, myfunc = _parallel_func(_fork_and_simulate, n_jobs=n_jobs)
+    n_chunks = min(n_jobs, n_trials) if n_jobs > 0 else n_trials
+    trial_chunks = np.array_split(np.arange(n_trials), n_chunks)
+    if len(fork_idxs) > 0:
+        fork_overlays = [overlays[idx] for idx in fork_idxs]
+        out = parallel(myfunc(net.params, fork_overlays, trial_idxs.tolist(),
+                              net_kwargs, fork_idxs)
+                       for trial_idxs in trial_chunks)
+        # from trials x variants to variants x trials
+        out = list(zip(*it.chain(*out)))
+        for idx, result in zip(fork_idxs, out):
+            results[idx] = result
+
+    parallel, myfunc = _parallel_func(_clone_and_simulate, n_jobs=n_jobs)
+    for idx, overlay in enumerate(overlays):
+        if results[idx] is not None:
+            continue
+        params = net.params.copy()
+        for key, value in overlay.items():
+            params[key] = value
+        variant_kwargs = dict(net_kwargs, variant_idx=idx)
+        out = parallel(myfunc(params, trial_idxs.tolist(), variant_kwargs)
+                       for trial_idxs in trial_chunks)
+        results[idx] = list(it.chain(*[job_out for job_out, _ in out]))
+
+    dpls, spikes = list(), list()
+    for result in results:
+        dpl, spiketimes, spikegids, _, _ = zip(*result)
+        dpls.append(list(dpl))
+        spikes.append(Spikes.from_trials(spiketimes, spikegids,
+                                         net.gid_dict))
+    return dpls, spikes
+
+
+def grid_overlays(space):
+    """Generate the overlays of a grid of parameters.
+
+    Parameters
+    ----------
+    space : dict of list
+        The values of each parameter.
+
+    Returns
+    -------
+    overlays : generator of dict
+        The overlays of all the combinations of values.
+    """
+    keys = sorted(space)
+    for values in it.product(*[space[key] for key in keys]):
+        yield dict(zip(keys, values))
+
+
+def random_overlays(space, n_samples, seed=0):
+    """Generate overlays of parameters drawn uniformly at random.
+
+    Parameters
+    ----------
+    space : dict of tuple
+        The (low, high) bounds of each parameter.
+    n_samples : int
+        The number of overlays.
+    seed : int
+        The seed of the random number generator.
+
+    Returns
+    -------
+    overlays : generator of dict
+        The overlays.
+    """
+    keys = sorted(space)
+    prng = np.random.RandomState(seed)
+    for _ in range(n_samples):
+        yield dict((key, prng.uniform(*space[key])) for key in keys)
+
+
+def lhs_overlays(space, n_samples, seed=0):
+    """Generate overlays of parameters by Latin hypercube sampling.
+
+    The range of each parameter is divided into n_samples intervals of
+    equal width and each interval is sampled exactly once.
+
+    Parameters
+    ----------
+    space : dict of tuple
+        The (low, high) bounds of each parameter.
+    n_samples : int
+        The number of overlays.
+    seed : int
+        The seed of the random number generator.
+
+    Returns
+    -------
+    overlays : generator of dict
+        The overlays.
+    """
+    keys = sorted(space)
+    prng = np.random.RandomState(seed)
+    samples = dict()
+    for key in keys:
+        low, high = space[key]
+        quantiles = (prng.permutation(n_samples) +
+                     prng.uniform(size=n_samples)) / n_samples
+        samples[key] = low + quantiles * (high - low)
+    for idx in range(n_samples):
+        yield dict((key, samples[key][idx]) for key in keys)
+
+
+def _simulate_overlay(idx, overlay, params, n_trials, net_kwargs,
+                      stop=None):
+    """Simulate all the trials of one overlay with the same network."""
+    from .dipole import _clone_and_simulate
+
+    params = params.copy()
+    for key, value in overlay.items():
+        params[key] = value
+    out, _ = _clone_and_simulate(params, list(range(n_trials)), net_kwargs,
+                                 stop=stop)
+    dpls, spiketimes, spikegids, _, _ = zip(*out)
+    return idx, overlay, list(dpls), list(spiketimes), list(spikegids)
+
+
+def simulate_sweep(params, overlays, n_trials=1, n_jobs=1, net_kwargs=None,
+                   stop_conditions=None, stop_interval=10.):
+    """Simulate a sweep over overlays of parameters.
+
+    Parameters
+    ----------
+    params : instance of Params
+        The parameters that the overlays are applied to.
+    overlays : iterable of dict
+        The parameters of each simulation that differ from params, e.g.,
+        from grid_overlays, random_overlays or lhs_overlays. The keys can
+        contain wildcards as in Params. It is consumed as the
+        simulations are dispatched.
+    n_trials : int
+        The number of trials to simulate for each overlay.
+    n_jobs : int
+        The number of jobs to run in parallel.
+    net_kwargs : dict | None
+        The options of the networks, e.g., dict(n_threads=2).
+    stop_conditions : list of callable | None
+        The conditions that stop a trial before tstop, e.g., instances
+        of hnn_core.stopping.FiringRateStop, DipoleStop or SilenceStop.
+        If None, all the trials run until tstop.
+    stop_interval : float
+        The simulated time in ms between two checks of the stop
+        conditions.
+
+    Returns
+    -------
+    results : generator of tuple
+        For each overlay in the order in which they finish, its index in
+        overlays, the overlay, and the lists of the dipoles, spike times
+        and spike gids of its trials. With n_jobs > 1, the results come
+        in the order in which they finish only with joblib >= 1.4, in
+        the order of overlays with joblib 1.3, and once all the overlays
+        are simulated with older versions.
+
+    Notes
+    -----
+    All the trials of an overlay are simulated in the same job, which
+    builds the network once for all of them.
+
+    A stop condition is called as ``condition(times, dpl, spiketimes,
+    spikegids, gid_dict)`` with the times and the aggregate dipole in nAm
+    (renormalized and scaled but not smoothed) simulated so far, the
+    times and gids of the spikes so far and the gids of each cell type.
+    It returns why the trial must be stopped, or None. If all the
+    conditions have a window attribute, the data are only given from the
+    largest window in ms before the previous check, otherwise from the
+    start of the trial. The conditions are copied for each trial. A
+    trial stopped early ends at the time of the check, and the reason is
+    stored in the stop_reason attribute of its dipole.
+    """
+    if net_kwargs is None:
+        net_kwargs = dict()
+    stop = None
+    if stop_conditions is not None:
+        if stop_interval <= 0:
+            raise ValueError('stop_interval must be positive, got %s'
+                             % stop_interval)
+        stop = dict(conditions=list(stop_conditions), interval=stop_interval)
+    parallel, myfunc = _parallel_func(_simulate_overlay, n_jobs=n_jobs,
+                                      stream=True)
+    return parallel(myfunc(idx, overlay, params, n_trials, net_kwargs, stop)
+                    for idx, overlay in enumerate(overlays))
@@ -1,11 +1,18 @@
 import matplotlib
+import os
+import shutil
 import os.path as op
 
 import numpy as np
+from numpy.testing import assert_array_equal, assert_allclose
+import pytest
 
 import hnn_core
-from hnn_core import read_params
-from hnn_core.dipole import Dipole
+from hnn_core import (read_params, simulate_dipole, simulate_dipole_iter,
+                      Network)
+from hnn_core.dipole import (Dipole, Dipoles, read_dipoles,
+                             _clone_and_simulate, _hammfilt)
+from hnn_core.feed import _is_random
 
 matplotlib.use('agg')
 
@@ -25,3 +32,337 @@ def test_dipole():
     dipole.smooth(params['dipole_smooth_win'] / params['dt'])
     dipole.plot(layer='agg')
     dipole.write('/tmp/dpl1.txt')
+
+
+def test_dipoles():
+    """Test the post-processing of the dipoles of several trials."""
+    hnn_core_root = op.join(op.dirname(hnn_core.__file__), '..')
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+
+    rng = np.random.RandomState(0)
+    times = np.arange(2000) * 0.5
+    dpls = [Dipole(times, rng.randn(2000, 3)) for _ in range(4)]
+    dipoles = Dipoles.from_dipoles(dpls)
+    assert len(dipoles) == 4
+    assert dipoles.data.shape == (4, 3, 2000)
+    assert '4 trials' in repr(dipoles)
+    # the same operations on each trial and on all the trials at once
+    for dpl in dpls:
+        dpl.baseline_renormalize(params)
+        dpl.convert_fAm_to_nAm()
+        dpl.scale(params['dipole_scalefctr'])
+        dpl.smooth(20)
+    dipoles.baseline_renormalize(params)
+    dipoles.convert_fAm_to_nAm()
+    dipoles.scale(params['dipole_scalefctr'])
+    dipoles.smooth(20)
+    assert dipoles.units == 'nAm'
+    for dpl, dpl_trial in zip(dpls, dipoles):
+        for layer in ('agg', 'L2', 'L5'):
+            assert_allclose(dpl.dpl[layer], dpl_trial.dpl[layer])
+
+    assert_allclose(dipoles.mean().dpl['L5'],
+                    np.mean([dpl.dpl['L5'] for dpl in dpls], axis=0))
+    assert_allclose(dipoles.std().dpl['agg'],
+                    np.std([dpl.dpl['agg'] for dpl in dpls], axis=0))
+    low, high = dipoles.percentile([5, 95])
+    assert np.all(low.dpl['L2'] <= high.dpl['L2'])
+    assert dipoles.percentile(50).units == 'nAm'
+
+    # the dipole of a trial is a view of the data
+    dipoles = Dipoles.from_dipoles(
+        [Dipole(times, rng.randn(2000, 3)) for _ in range(2)])
+    dpl = dipoles[1]
+    dpl.baseline_renormalize(params)
+    dpl.smooth(20)
+    dpl.scale(2.)
+    for idx, layer in enumerate(('agg', 'L2', 'L5')):
+        assert_array_equal(dipoles.data[1, idx], dpl.dpl[layer])
+    # and of the smoothing of all the trials
+    dpl = dipoles[0]
+    data = dpl.dpl['L2'].copy()
+    dipoles.smooth(20)
+    assert np.any(dpl.dpl['L2'] != data)
+    assert_array_equal(dipoles.data[0, 1], dpl.dpl['L2'])
+
+    with pytest.raises(ValueError, match='same units'):
+        Dipoles.from_dipoles(dpls[:1] + [Dipole(times, rng.randn(2000, 3))])
+    with pytest.raises(ValueError, match='data must be of shape'):
+        Dipoles(times, rng.randn(2, 2000, 3))
+
+
+def test_dipoles_io(tmpdir):
+    """Test the binary files of dipoles."""
+    rng = np.random.RandomState(0)
+    times = np.arange(1000) * 0.025
+    dipoles = Dipoles(times, rng.randn(5, 3, 1000), units='nAm')
+    fname = op.join(str(tmpdir), 'dpl.dpl')
+    dipoles.save(fname)
+
+    dipoles_read = read_dipoles(fname)
+    assert_array_equal(dipoles_read.t, times)
+    assert_array_equal(dipoles_read.data, dipoles.data)
+    assert dipoles_read.units == 'nAm'
+    dipoles_read = read_dipoles(fname, trials=[3, 1], tmin=5., tmax=10.)
+    mask = (times >= 5.) & (times <= 10.)
+    assert_array_equal(dipoles_read.t, times[mask])
+    assert_array_equal(dipoles_read.data, dipoles.data[[3, 1]][..., mask])
+    with pytest.raises(ValueError, match='trials must be'):
+        read_dipoles(fname, trials=[5])
+
+    fname_txt = op.join(str(tmpdir), 'dpl.txt')
+    dipoles[0].write(fname_txt)
+    assert_allclose(np.loadtxt(fname_txt)[:, 1], dipoles.data[0, 0],
+                    atol=1e-4)
+    with pytest.raises(ValueError, match='not a file of dipoles'):
+        read_dipoles(fname_txt)
+
+
+def test_hammfilt():
+    """Test the smoothing of several signals through the FFT."""
+    rng = np.random.RandomState(0)
+    for n_times in (30, 1000, 3001):
+        x = rng.randn(2, 3, n_times)
+        for winsz in (5, 40., 1200.):
+            win = np.hamming(winsz)
+            win /= sum(win)
+            x_smooth = _hammfilt(x, winsz)
+            assert x_smooth.shape[:2] == (2, 3)
+            assert_allclose(x_smooth, np.apply_along_axis(
+                np.convolve, -1, x, win, 'same'), atol=1e-12)
+            assert_allclose(_hammfilt(x[0, 0], winsz), x_smooth[0, 0],
+                            atol=1e-12)
+
+
+def test_reuse_network():
+    """Test that trials on a reused network match freshly built ones."""
+    hnn_core_root = op.join(op.dirname(hnn_core.__file__), '..')
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3, 'tstop': 40.})
+
+    net = Network(params)
+    dpls = simulate_dipole(net, n_trials=2)
+    # build a new network for the second trial only
+    out, _ = _clone_and_simulate(params, [1])
+    dpl_fresh, spiketimes, spikegids, _, current = out[0]
+    assert_array_equal(dpls[1].dpl['agg'], dpl_fresh.dpl['agg'])
+    # the currents of the last trial are kept
+    for key, vec in net.current.items():
+        assert_array_equal(vec.to_python(), current[key])
+    assert_array_equal(net.spiketimes[1], spiketimes)
+    assert_array_equal(net.spikegids[1], spikegids)
+    assert net.spiketimes[1].dtype == np.float64
+    assert np.issubdtype(net.spikegids[1].dtype, np.integer)
+    times, gids = net.spikes.get_trial(1)
+    order = np.lexsort((spikegids, spiketimes))
+    assert_array_equal(times, spiketimes[order])
+    assert_array_equal(gids, spikegids[order])
+    net.plot_input(show=False)
+    net.plot_spikes(show=False)
+
+
+def test_cache_dipole(tmpdir):
+    """Test caching of the simulated trials."""
+    hnn_core_root = op.join(op.dirname(hnn_core.__file__), '..')
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3, 'tstop': 25.})
+    cache_dir = str(tmpdir)
+
+    net = Network(params)
+    dpls = simulate_dipole(net, n_trials=2, cache_dir=cache_dir)
+    spiketimes = net.spiketimes
+    assert len(os.listdir(cache_dir)) == 2
+    dpls_cached = simulate_dipole(net, n_trials=2, cache_dir=cache_dir)
+    for dpl, dpl_cached in zip(dpls, dpls_cached):
+        assert_array_equal(dpl.t, dpl_cached.t)
+        assert_array_equal(dpl.dpl['agg'], dpl_cached.dpl['agg'])
+        assert dpl.units == dpl_cached.units
+    for trial_idx in range(2):
+        assert_array_equal(spiketimes[trial_idx],
+                           net.spiketimes[trial_idx])
+
+    # evict everything
+    simulate_dipole(net, n_trials=1, cache_dir=cache_dir, cache_size=0)
+    assert len(os.listdir(cache_dir)) == 0
+
+
+def test_checkpoint(tmpdir, monkeypatch):
+    """Test resuming a trial from its checkpoint."""
+    import hnn_core.checkpoint
+
+    hnn_core_root = op.join(op.dirname(hnn_core.__file__), '..')
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3, 'tstop': 40.})
+    checkpoint_dir = str(tmpdir)
+
+    net = Network(params)
+    dpl = simulate_dipole(net)[0]
+    spiketimes, spikegids = net.spiketimes[0], net.spikegids[0]
+    dpl_ckpt = simulate_dipole(net, checkpoint_dir=checkpoint_dir,
+                               checkpoint_interval=15.)[0]
+    assert_array_equal(dpl.dpl['agg'], dpl_ckpt.dpl['agg'])
+    # the checkpoint is removed once the trial is done
+    assert len(os.listdir(checkpoint_dir)) == 0
+
+    # interrupt the simulation after its last checkpoint at 30 ms
+    monkeypatch.setattr(hnn_core.checkpoint, '_remove_checkpoint',
+                        lambda fname: None)
+    simulate_dipole(net, checkpoint_dir=checkpoint_dir,
+                    checkpoint_interval=15.)
+    assert len(os.listdir(checkpoint_dir)) == 1
+    monkeypatch.undo()
+    dpl_resumed = simulate_dipole(net, checkpoint_dir=checkpoint_dir,
+                                  checkpoint_interval=15.)[0]
+    assert len(os.listdir(checkpoint_dir)) == 0
+    assert_array_equal(dpl.t, dpl_resumed.t)
+    assert_array_equal(dpl.dpl['agg'], dpl_resumed.dpl['agg'])
+    assert_array_equal(spiketimes, net.spiketimes[0])
+    assert_array_equal(spikegids, net.spikegids[0])
+    pytest.raises(ValueError, simulate_dipole, net,
+                  checkpoint_dir=checkpoint_dir, checkpoint_interval=0.)
+
+
+def test_record_dir(tmpdir):
+    """Test appending the recordings to the disk during the simulation."""
+    hnn_core_root = op.join(op.dirname(hnn_core.__file__), '..')
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3, 'tstop': 40.})
+    record_dir = str(tmpdir)
+
+    net = Network(params)
+    net.add_probe('v_soma', 'v', cell_type='L5_pyramidal', dt=0.5)
+    dpl = simulate_dipole(net)[0]
+    spiketimes, spikegids = net.spiketimes[0], net.spikegids[0]
+    v_soma = net.probe_data['v_soma'].data
+    dpl_rec = simulate_dipole(net, record_dir=record_dir,
+                              record_interval=7.3)[0]
+    assert_array_equal(dpl.t, dpl_rec.t)
+    assert_array_equal(dpl.dpl['agg'], dpl_rec.dpl['agg'])
+    assert_array_equal(spiketimes, net.spiketimes[0])
+    assert_array_equal(spikegids, net.spikegids[0])
+    assert_array_equal(v_soma, net.probe_data['v_soma'].data)
+    assert 't.0-1.f8' in os.listdir(op.join(record_dir, 'trial_0'))
+    pytest.raises(ValueError, simulate_dipole, net, record_dir=record_dir,
+                  record_interval=0.)
+    pytest.raises(ValueError, simulate_dipole, net, record_dir=record_dir,
+                  checkpoint_dir=record_dir)
+
+
+def test_simulate_dipole_iter(capsys):
+    """Test getting the dipole and the spikes during the simulation."""
+    hnn_core_root = op.join(op.dirname(hnn_core.__file__), '..')
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3, 'tstop': 25.,
+                   'dipole_smooth_win': 0})
+
+    net = Network(params)
+    dpls = simulate_dipole(net, n_trials=2, progress_interval=None)
+    assert 'Simulation time' not in capsys.readouterr().out
+    spikes = net.spikes
+    chunks = list(simulate_dipole_iter(net, n_trials=2, interval=7.3))
+    assert [trial_idx for trial_idx, _, _, _ in chunks] == [0] * 4 + [1] * 4
+    for trial_idx, dpl in enumerate(dpls):
+        trial_chunks = chunks[4 * trial_idx:4 * (trial_idx + 1)]
+        assert_array_equal(np.concatenate([chunk[1].t for chunk in
+                                           trial_chunks]), dpl.t)
+        assert_array_equal(np.concatenate([chunk[1].dpl['agg'] for chunk
+                                           in trial_chunks]), dpl.dpl['agg'])
+        assert_array_equal(np.concatenate([chunk[2] for chunk in
+                                           trial_chunks]),
+                           spikes.get_trial(trial_idx)[0])
+    assert_array_equal(net.spikes.times, spikes.times)
+    pytest.raises(ValueError, simulate_dipole_iter, net, interval=0.)
+
+
+def test_deterministic_feeds():
+    """Test that deterministic feeds are simulated only once."""
+    hnn_core_root = op.join(op.dirname(hnn_core.__file__), '..')
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3, 'tstop': 25.})
+    params['sigma_t_ev*'] = 0.
+
+    net = Network(params)
+    for ty, p_ext in net.p_unique.items():
+        assert not _is_random(ty, p_ext)
+    dpls = simulate_dipole(net, n_trials=2)
+    assert_array_equal(dpls[0].dpl['agg'], dpls[1].dpl['agg'])
+    assert dpls[0] is not dpls[1]
+    assert_array_equal(net.spikegids[0], net.spikegids[1])
+
+    params['sigma_t_evprox_1'] = 1.
+    net = Network(params)
+    assert _is_random('evprox1', net.p_unique['evprox1'])
+
+
+@pytest.mark.skipif(shutil.which('mpiexec') is None,
+                    reason='mpiexec is not installed')
+def test_mpi_backend(tmpdir):
+    """Test that the network distributed with MPI gives the same trial."""
+    hnn_core_root = op.join(op.dirname(hnn_core.__file__), '..')
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3, 'tstop': 25.})
+
+    net = Network(params)
+    dpl = simulate_dipole(net)[0]
+    spiketimes, spikegids = net.spiketimes[0], net.spikegids[0]
+    current = dict((key, vec.to_python())
+                   for key, vec in net.current.items())
+    assert np.any(current['L2Pyr_soma'])
+    dpl_mpi = simulate_dipole(net, backend='mpi', n_procs=2)[0]
+    assert_allclose(dpl.dpl['agg'], dpl_mpi.dpl['agg'], atol=1e-12)
+    # the currents of the cells of all the processes are summed
+    for key, vec in net.current.items():
+        assert_allclose(vec.to_python(), current[key], atol=1e-12)
+    # the spikes of all the processes are sorted by time
+    order = np.lexsort((spikegids, spiketimes))
+    assert_allclose(np.array(spiketimes)[order], net.spiketimes[0])
+    assert_array_equal(np.array(spikegids)[order], net.spikegids[0])
+
+    # the partition is saved to the file and reused
+    partition_fname = op.join(str(tmpdir), 'partition.npz')
+    net = Network(params, load_balance=partition_fname)
+    for _ in range(2):
+        dpl_mpi = simulate_dipole(net, backend='mpi', n_procs=2)[0]
+        assert_allclose(dpl.dpl['agg'], dpl_mpi.dpl['agg'], atol=1e-12)
+        assert op.exists(partition_fname)
+    with np.load(partition_fname) as data:
+        assert len(data['cell_ranks']) == net.N_cells
+        assert_array_equal(np.unique(data['cell_ranks']), [0, 1])
+
+    pytest.raises(ValueError, simulate_dipole, net, backend='dask')
+
+
+def test_threads():
+    """Test that the trials simulated with several threads match."""
+    hnn_core_root = op.join(op.dirname(hnn_core.__file__), '..')
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3, 'tstop': 25.})
+
+    net = Network(params)
+    dpl = simulate_dipole(net)[0]
+    spiketimes, spikegids = net.spiketimes[0], net.spikegids[0]
+    net = Network(params, n_threads=2)
+    dpl_threads = simulate_dipole(net)[0]
+    assert_allclose(dpl.dpl['agg'], dpl_threads.dpl['agg'], atol=1e-12)
+    order = np.lexsort((spikegids, spiketimes))
+    order_threads = np.lexsort((net.spikegids[0], net.spiketimes[0]))
+    assert_allclose(np.array(spiketimes)[order],
+                    np.array(net.spiketimes[0])[order_threads])
+
+    pytest.raises(ValueError, Network, params, n_threads=0)
+    # the threads cannot exchange spikes faster than dt
+    params.update({'t0_input_prox': 5., 'tstop_input_prox': 25.,
+                   'input_prox_A_weight_L2Pyr_ampa': 1e-3,
+                   'input_prox_A_delay_L2': 0.01})
+    with Network(params, n_threads=2) as net:
+        with pytest.raises(ValueError, match='at least dt'):
+            net.build()
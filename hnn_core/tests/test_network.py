@@ -1,10 +1,21 @@
 # Authors: Mainak Jas <mainakjas@gmail.com>
 
 from copy import deepcopy
+import os
 import os.path as op
 
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+import pytest
+
 import hnn_core
-from hnn_core import read_params, Network
+from hnn_core import read_params, Network, simulate_dipole
+from hnn_core.feed import (_create_event_times, _get_seed, _get_active_feeds,
+                           _is_random)
+from hnn_core.params import create_pext
+from hnn_core.pyramidal import L5Pyr
+from hnn_core.steady_state import (_compute_steady_state, _steady_states,
+                                   _get_steady_state_key)
 
 
 def test_network():
@@ -18,3 +29,178 @@ def test_network():
     assert len(params) == len(net.params)
     print(net)
     print(net.cells[:2])
+
+
+def test_prune_connections():
+    """Test pruning of connections with negligible weight."""
+    hnn_core_root = op.join(op.dirname(hnn_core.__file__), '..')
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3})
+
+    with Network(deepcopy(params)) as net:
+        net.build()
+        assert not any(net.n_pruned.values())
+
+    # exp(-d**2 / 3**2) < 0.5 only for the opposite corners of the grid,
+    # each connected to 3 ampa and 3 nmda synapses
+    with Network(deepcopy(params),
+                 weight_cutoff={'L2Pyr_L2Pyr': 0.5}) as net:
+        net.build()
+        assert net.n_pruned['L2Pyr_L2Pyr'] == 4 * 6
+        assert net.n_pruned['L5Pyr_L5Pyr'] == 0
+
+    pytest.raises(ValueError, Network, params, weight_cutoff=1.)
+    pytest.raises(ValueError, Network, params,
+                  weight_cutoff={'L2Pyr_foo': 0.1})
+
+
+def test_plan_connections():
+    """Test the connections planned between cells."""
+    hnn_core_root = op.join(op.dirname(hnn_core.__file__), '..')
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3})
+
+    with Network(deepcopy(params)) as net:
+        net.build()
+        edges, _ = net._plan_connections()
+        # connections are created for each target cell in turn
+        assert np.all(np.diff(np.searchsorted(
+            [cell.gid for cell in net.cells], edges['target_gid'])) >= 0)
+        # no autapses between pyramidal cells
+        pyr_gids = list(net.gid_dict['L2_pyramidal']) + \
+            list(net.gid_dict['L5_pyramidal'])
+        autapses = edges['src_gid'] == edges['target_gid']
+        assert not np.any(autapses & np.isin(edges['target_gid'], pyr_gids))
+        # weight and delay depend on the distance between the cells
+        src_gid = net.gid_dict['L2_basket'][0]
+        target_gid = net.gid_dict['L2_pyramidal'][-1]
+        idx = np.where((edges['src_gid'] == src_gid) &
+                       (edges['target_gid'] == target_gid))[0][0]
+        cell = net.cells[target_gid]
+        d2 = np.sum((np.array(cell.pos[:2]) -
+                     np.array(net.pos_dict['L2_basket'][0][:2])) ** 2)
+        assert_allclose(edges['weight'][idx],
+                        params['gbar_L2Basket_L2Pyr_gabaa'] *
+                        np.exp(-d2 / 50. ** 2))
+        assert_allclose(edges['delay'][idx], np.exp(d2 / 50. ** 2))
+        n_netcons = sum(len(cell.ncfrom_L2Pyr) + len(cell.ncfrom_L2Basket) +
+                        len(cell.ncfrom_L5Pyr) + len(cell.ncfrom_L5Basket)
+                        for cell in net.cells)
+        assert len(edges['src_gid']) == n_netcons
+
+
+def test_inactive_feeds():
+    """Test that the feeds with zero weight are not created."""
+    hnn_core_root = op.join(op.dirname(hnn_core.__file__), '..')
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3})
+
+    with Network(deepcopy(params)) as net:
+        net.build()
+        # the gaussian and poisson feeds have zero weights by default
+        assert len(net.ext_list['extgauss']) == 0
+        assert len(net.ext_list['extpois']) == 0
+        assert len(net.ext_list['evprox1']) == len(net.cells)
+        # the gids of the skipped feeds are kept
+        assert len(net.gid_dict['extgauss']) == len(net.cells)
+        for cell in net.cells:
+            for ncs in (cell.ncfrom_extinput, cell.ncfrom_extgauss,
+                        cell.ncfrom_extpois, cell.ncfrom_ev):
+                assert all(nc.weight[0] != 0. for nc in ncs)
+
+    # the feeds are active and random under the same conditions
+    params.update({'t0_input_prox': 5., 'tstop_input_prox': 25.,
+                   'input_prox_A_weight_L2Pyr_ampa': -1e-3,
+                   'L2Pyr_Pois_A_weight_ampa': -1e-3,
+                   'L2Pyr_Pois_lamtha': 500., 'T_pois': 100.})
+    p_ext, p_unique = create_pext(params, params['tstop'])
+    active_ext, active_unique = _get_active_feeds(p_ext, p_unique)
+    assert active_ext[0]
+    assert active_ext[0] == _is_random('extinput', p_ext[0])
+    assert not active_unique['extpois']
+    assert not _is_random('extpois', p_unique['extpois'])
+
+
+def _create_event_times_ref(ty, p_ext, celltype, seed):
+    """Generate the events of one feed with one draw per event, as HNN."""
+    prng = np.random.RandomState(seed)
+    weights = p_ext[celltype]
+    if ty.startswith(('evprox', 'evdist')):
+        mu, sigma = p_ext['t0'], weights[3]
+        if sigma:
+            times = prng.normal(mu, sigma, int(p_ext['numspikes']))
+        else:
+            times = np.array([mu] * int(p_ext['numspikes']))
+    elif weights[0] <= 0.0 and weights[1] <= 0.0:
+        times = np.array([])
+    elif ty == 'extgauss':
+        times = prng.normal(weights[3], weights[4], 50)
+    elif ty == 'extpois':
+        t0, T = p_ext['t_interval']
+        # the first event is dropped
+        t_gen = t0 - 1000. * np.log(1. - prng.rand()) / weights[3]
+        times = list()
+        while t_gen < T:
+            t_gen -= 1000. * np.log(1. - prng.rand()) / weights[3]
+            if t_gen < T:
+                times.append(t_gen)
+        times = np.array(times)
+    return np.sort(times[times > 0])
+
+
+def test_feed_event_times():
+    """Test generating the event times of the feeds of a type at once."""
+    hnn_core_root = op.join(op.dirname(hnn_core.__file__), '..')
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'L2Pyr_Pois_A_weight_ampa': 1e-3,
+                   'L2Pyr_Pois_lamtha': 500., 'T_pois': 1000.})
+    _, p_unique = create_pext(params, params['tstop'])
+
+    cell_types = ['L2_pyramidal', 'L5_pyramidal'] * 3
+    gids = list(range(100, 100 + len(cell_types)))
+    for ty in ('evprox1', 'extgauss', 'extpois'):
+        p_type = p_unique[ty]
+        seeds = [_get_seed(ty, p_type, gid) for gid in gids]
+        event_times = _create_event_times(ty, p_type, cell_types, seeds)
+        # the same events as one draw per event
+        for cell_type, seed, times in zip(cell_types, seeds, event_times):
+            assert_array_equal(
+                times, _create_event_times_ref(ty, p_type, cell_type, seed))
+            assert np.all(np.diff(times) >= 0)
+    t0, T = p_unique['extpois']['t_interval']
+    n_events = [len(times) for times in event_times]
+    # the poisson feeds with zero weight emit no event
+    assert n_events[1::2] == [0] * 3
+    assert all(abs(n - 500 * (T - t0) / 1e3) < 150 for n in n_events[::2])
+    assert np.all((np.concatenate(event_times) > t0) &
+                  (np.concatenate(event_times) < T))
+
+
+def test_steady_state(tmpdir):
+    """Test starting the network from the equilibrium of the cells."""
+    hnn_core_root = op.join(op.dirname(hnn_core.__file__), '..')
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3, 'tstop': 25.})
+    params['t_ev*'] = 1000.  # no input
+
+    net = Network(params, steady_state=str(tmpdir))
+    dpl = simulate_dipole(net)[0]
+    # one equilibrium per cell type
+    assert len(os.listdir(str(tmpdir))) == 4
+    # the network stays at rest
+    assert len(net.spiketimes[0]) == 0
+    assert_allclose(dpl.dpl['agg'], 0., atol=1e-2)
+
+    # the equilibrium is not computed with the cells of another network
+    state, rest_dipole = _steady_states[_get_steady_state_key('L5_pyramidal',
+                                                              params)]
+    with Network(deepcopy(params)) as net:
+        net.build()
+        state_child, rest_dipole_child = _compute_steady_state(L5Pyr, params)
+    assert_allclose(state_child, state)
+    assert_allclose(rest_dipole_child, rest_dipole)
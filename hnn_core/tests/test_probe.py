@@ -0,0 +1,79 @@
+import os.path as op
+
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+import pytest
+
+import hnn_core
+from hnn_core import read_params, simulate_dipole, Network
+from hnn_core.dipole import Dipole
+from hnn_core.probe import _get_probe_data
+
+
+def test_probes():
+    """Test the recording probes."""
+    hnn_core_root = op.join(op.dirname(hnn_core.__file__), '..')
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3, 'tstop': 25.,
+                   'dipole_smooth_win': 0.})
+
+    net = Network(params)
+    net.add_probe('v_soma', 'v', cell_type='L5_pyramidal', dt=0.5)
+    net.add_probe('ik_tuft', 'ik', gids=net.gid_dict['L5_pyramidal'][:2],
+                  section='apical_tuft')
+    net.add_probe('g_ampa', 'g', cell_type='L2_basket', synapse='soma_ampa',
+                  dt=0.1)
+    net.add_probe('dipole', 'dipole',
+                  cell_type=['L2_pyramidal', 'L5_pyramidal'])
+    with pytest.raises(ValueError, match='already exists'):
+        net.add_probe('v_soma', 'v', cell_type='L2_basket')
+    with pytest.raises(ValueError, match='cell_type must be'):
+        net.add_probe('v', 'v', cell_type='evprox1')
+    with pytest.raises(ValueError, match='gids must be'):
+        net.add_probe('v', 'v', gids=[net.gid_dict['evprox1'][0]])
+    with pytest.raises(ValueError, match='Only the pyramidal'):
+        net.add_probe('v', 'dipole', cell_type='L2_basket')
+    with pytest.raises(ValueError, match='dt must be'):
+        net.add_probe('v', 'v', cell_type='L2_basket', dt=0.001)
+    with pytest.raises(ValueError, match='dt must be'):
+        net.add_probe('v', 'v', cell_type='L2_basket', dt=0.03)
+
+    dpls = simulate_dipole(net, n_trials=2)
+    v_soma = net.probe_data['v_soma']
+    # the last sample at tstop may be missed because of rounding
+    assert v_soma.data.shape[:2] == (2, 9)
+    assert v_soma.data.shape[2] in (50, 51)
+    assert_array_equal(v_soma.gids, net.gid_dict['L5_pyramidal'])
+    assert_allclose(np.diff(v_soma.times), 0.5)
+    assert net.probe_data['ik_tuft'].data.shape == (2, 2, len(dpls[0].t))
+    assert net.probe_data['g_ampa'].data.shape[:2] == (2, 3)
+    assert np.all(net.probe_data['g_ampa'].data >= 0.)
+
+    # the dipoles of the cells sum to the dipoles of the layers
+    dipole = net.probe_data['dipole']
+    for trial_idx, dpl in enumerate(dpls):
+        layers = [dipole.data[trial_idx][np.isin(dipole.gids,
+                                                 net.gid_dict[cell_type])]
+                  .sum(axis=0) for cell_type in ('L2_pyramidal',
+                                                 'L5_pyramidal')]
+        dpl_probe = Dipole(dpl.t, np.c_[layers[0] + layers[1], layers[0],
+                                        layers[1]])
+        dpl_probe.baseline_renormalize(params)
+        dpl_probe.convert_fAm_to_nAm()
+        dpl_probe.scale(params['dipole_scalefctr'])
+        assert_allclose(dpl_probe.dpl['agg'], dpl.dpl['agg'], atol=1e-10)
+
+    # the threads record the same samples
+    net_threads = Network(params, n_threads=2)
+    net_threads.add_probe('v_soma', 'v', cell_type='L5_pyramidal', dt=0.5)
+    simulate_dipole(net_threads, n_trials=1)
+    data_threads = net_threads.probe_data['v_soma'].data[0]
+    n_times = min(data_threads.shape[1], v_soma.data.shape[2])
+    assert_allclose(data_threads[:, :n_times], v_soma.data[0, :, :n_times])
+
+    # the trials must record the same number of samples
+    probes = dict(v=dict(var='v', gids=[0], dt=None))
+    out = [dict(v=np.zeros((1, 3))), dict(v=np.zeros((1, 2)))]
+    with pytest.raises(RuntimeError, match='different numbers of samples'):
+        _get_probe_data(probes, out, params['dt'])
@@ -0,0 +1,60 @@
+import os.path as op
+
+import numpy as np
+from numpy.testing import assert_array_equal
+import pytest
+
+from hnn_core import Spikes, read_spikes
+
+
+def test_spikes(tmpdir):
+    """Test the columnar store of the spikes."""
+    gid_dict = {'L2_basket': range(0, 3), 'L2_pyramidal': range(3, 8),
+                'evprox1': range(8, 10)}
+    spiketimes = [np.array([5., 1., 3., 9.]), np.array([]),
+                  np.array([2., 2., 7.])]
+    spikegids = [np.array([4, 0, 8, 4]), np.array([], int),
+                 np.array([9, 1, 3])]
+    spikes = Spikes.from_trials(spiketimes, spikegids, gid_dict)
+    assert len(spikes) == 7
+    assert spikes.n_trials == 3
+    assert spikes.n_gids == 10
+    assert 'Spikes' in repr(spikes)
+
+    times, gids = spikes.get_trial(0)
+    assert_array_equal(times, [1., 3., 5., 9.])
+    assert_array_equal(gids, [0, 8, 4, 4])
+    assert len(spikes.get_trial(1)[0]) == 0
+    times, gids = spikes.get_trial(2)
+    assert_array_equal(gids, [1, 9, 3])
+    with pytest.raises(ValueError, match='trial_idx must be'):
+        spikes.get_trial(3)
+
+    # the selections match masks over all the spikes
+    all_times = np.concatenate(spiketimes)
+    all_gids = np.concatenate(spikegids)
+    selection = spikes.select(cell_type='L2_pyramidal', tmin=2., tmax=9.)
+    mask = (np.isin(all_gids, gid_dict['L2_pyramidal']) &
+            (all_times >= 2.) & (all_times < 9.))
+    assert_array_equal(selection.times, np.sort(all_times[mask]))
+    assert_array_equal(spikes.select(cell_type=['L2_basket', 'evprox1'],
+                                     trials=[2]).gids, [1, 9])
+    assert_array_equal(spikes.select(gids=[4]).trials, [0, 0])
+    assert len(spikes.select(trials=[1])) == 0
+    with pytest.raises(ValueError, match='cell_type must be'):
+        spikes.select(cell_type='L5_pyramidal')
+
+    counts = spikes.get_counts()
+    assert_array_equal(counts, np.bincount(all_gids, minlength=10))
+    assert spikes.get_counts(trial_idx=2)[9] == 1
+    assert spikes.get_type_counts() == {'L2_basket': 2, 'L2_pyramidal': 3,
+                                        'evprox1': 2}
+    assert spikes.get_type_counts(trial_idx=1)['L2_pyramidal'] == 0
+
+    fname = op.join(str(tmpdir), 'spikes.npz')
+    spikes.save(fname)
+    spikes_read = read_spikes(fname)
+    for attr in ('times', 'gids', 'trials'):
+        assert_array_equal(getattr(spikes, attr), getattr(spikes_read, attr))
+    assert spikes_read.gid_dict == gid_dict
+    assert spikes_read.n_trials == 3
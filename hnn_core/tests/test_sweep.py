@@ -0,0 +1,199 @@
+import os.path as op
+
+import numpy as np
+from numpy.testing import assert_array_equal
+import pytest
+
+import hnn_core
+from hnn_core import (read_params, simulate_dipole, simulate_forks,
+                      simulate_sweep, Network)
+from hnn_core.feed import ExtFeed, _EVENT_TIME_PARAMS
+from hnn_core.params import create_pext
+from hnn_core.sweep import (_is_forkable, _KeyRecorder, grid_overlays,
+                            random_overlays, lhs_overlays)
+from hnn_core.dipole import _simulate_single_trial
+from hnn_core.parallel import _parallel_func
+from hnn_core.spikes import Spikes
+from hnn_core.stopping import FiringRateStop, DipoleStop, SilenceStop
+
+
+def test_simulate_forks(tmpdir, monkeypatch):
+    """Test that forked variants match independent simulations."""
+    hnn_core_root = op.join(op.dirname(hnn_core.__file__), '..')
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3, 'tstop': 40.})
+    monkeypatch.chdir(str(tmpdir))
+
+    overlays = [{'t_evprox_1': 30.}, {'sigma_t_ev*': 0.},
+                {'gbar_evprox_1_L2Pyr_ampa': 0.}]
+    assert _is_forkable(params, overlays[0])
+    assert _is_forkable(params, overlays[1])
+    assert not _is_forkable(params, overlays[2])
+    assert not _is_forkable(params, {'N_pyr_x': 4})
+    # removing an evoked feed changes the connections
+    assert not _is_forkable(params, {'numspikes_evprox_1': 0})
+    params_input = params.copy()
+    params_input.update({'t0_input_prox': 5., 'tstop_input_prox': 25.})
+    assert not _is_forkable(params_input, {'input_prox_A_delay_L2': 2.})
+    assert _is_forkable(params_input, {'t0_input_prox': 20.})
+
+    net = Network(params.copy())
+    net.add_probe('v', 'v', 'L5_pyramidal')
+    with pytest.raises(ValueError, match='probes are not recorded'):
+        simulate_forks(net, overlays)
+    net.probes.clear()
+    net.params['save_dpl'] = 1
+    dpls, spikes = simulate_forks(net, overlays, n_trials=2)
+    # the network is left unchanged
+    assert net.spikes is None
+    assert len(dpls) == 3
+    assert len(spikes) == 3
+    for overlay, dpls_variant, spikes_variant in zip(overlays, dpls,
+                                                     spikes):
+        params_variant = params.copy()
+        for key, value in overlay.items():
+            params_variant[key] = value
+        net_variant = Network(params_variant)
+        dpls_ref = simulate_dipole(net_variant, n_trials=2)
+        for trial_idx in range(2):
+            assert_array_equal(dpls_ref[trial_idx].dpl['agg'],
+                               dpls_variant[trial_idx].dpl['agg'])
+            for data_ref, data in zip(
+                    net_variant.spikes.get_trial(trial_idx),
+                    spikes_variant.get_trial(trial_idx)):
+                assert_array_equal(data_ref, data)
+    # each variant saves its own raw dipoles
+    for trial_idx in range(2):
+        for variant_idx in range(3):
+            assert op.exists(op.join(str(tmpdir), 'rawdpl_%d_variant_%d.dpl'
+                                     % (trial_idx, variant_idx)))
+
+
+def test_event_time_params():
+    """Test the parameters of the event times against those of ExtFeed."""
+    hnn_core_root = op.join(op.dirname(hnn_core.__file__), '..')
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'t0_input_prox': 5., 'tstop_input_prox': 25.,
+                   'L2Pyr_Gauss_A_weight': 1e-3,
+                   'L2Pyr_Pois_A_weight_ampa': 1e-3,
+                   'L2Pyr_Pois_lamtha': 500., 'T_pois': 100.})
+    p_ext, p_unique = create_pext(params, params['tstop'])
+    for ty, p_type in [('extinput', p_ext[0])] + list(p_unique.items()):
+        p_type = _KeyRecorder(p_type)
+        ExtFeed(ty, 'L2_pyramidal', p_type, 0)
+        keys = p_type.keys_read - set(['L2_pyramidal'])
+        kind = 'evoked' if ty.startswith('ev') else ty
+        assert keys <= set(_EVENT_TIME_PARAMS[kind][0])
+
+
+def test_forks_plot():
+    """Test plotting the spikes of a network after simulating forks."""
+    hnn_core_root = op.join(op.dirname(hnn_core.__file__), '..')
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3, 'tstop': 25.})
+
+    net = Network(params)
+    simulate_dipole(net)
+    spikes = net.spikes
+    _, spikes_forks = simulate_forks(net, [{'t_evprox_1': 20.}])
+    assert isinstance(spikes_forks[0], Spikes)
+    # the spikes of the network are those of simulate_dipole
+    assert net.spikes is spikes
+    net.plot_input(show=False)
+    net.plot_spikes(show=False)
+
+
+def test_simulate_sweep():
+    """Test sweeps over overlays of parameters."""
+    hnn_core_root = op.join(op.dirname(hnn_core.__file__), '..')
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3, 'tstop': 25.})
+
+    overlays = list(grid_overlays({'t_evprox_1': [20., 22.],
+                                   'sigma_t_evprox_1': [1., 2., 3.]}))
+    assert len(overlays) == 6
+    assert overlays[1] == {'sigma_t_evprox_1': 1., 't_evprox_1': 22.}
+    space = {'t_evprox_1': (10., 20.), 'sigma_t_evprox_1': (0., 1.)}
+    overlays = list(random_overlays(space, 5))
+    assert len(overlays) == 5
+    assert all(10. <= overlay['t_evprox_1'] <= 20. for overlay in overlays)
+    overlays = list(lhs_overlays(space, 5))
+    # each fifth of the range is sampled once
+    bins = np.floor([(overlay['t_evprox_1'] - 10.) / 2.
+                     for overlay in overlays])
+    assert_array_equal(np.sort(bins), np.arange(5))
+
+    results = simulate_sweep(params, grid_overlays({'t_evprox_1': [15.]}),
+                             n_trials=2)
+    idx, overlay, dpls, spiketimes, spikegids = next(results)
+    assert idx == 0
+    assert overlay == {'t_evprox_1': 15.}
+    assert len(dpls) == 2
+    params.update(overlay)
+    net = Network(params)
+    dpls_ref = simulate_dipole(net, n_trials=2)
+    for trial_idx in range(2):
+        assert_array_equal(dpls_ref[trial_idx].dpl['agg'],
+                           dpls[trial_idx].dpl['agg'])
+        assert_array_equal(net.spikegids[trial_idx], spikegids[trial_idx])
+
+
+def test_parallel_stream(monkeypatch):
+    """Test streaming the results of parallel jobs with old joblibs."""
+    joblib = pytest.importorskip('joblib')
+    for version in ('1.2.0', '1.3.2', joblib.__version__):
+        monkeypatch.setattr(joblib, '__version__', version)
+        parallel, myfunc = _parallel_func(abs, n_jobs=2, stream=True)
+        results = parallel(myfunc(-idx) for idx in range(4))
+        assert sorted(results) == [0, 1, 2, 3]
+
+
+def test_stop_conditions():
+    """Test stopping the trials of a sweep early."""
+    hnn_core_root = op.join(op.dirname(hnn_core.__file__), '..')
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3, 'tstop': 40.})
+
+    net = Network(params)
+    dpl_ref = simulate_dipole(net)[0]
+    for conditions, reason, tstop in (
+            ([DipoleStop(1e-3)], 'dipole', 5.),
+            ([SilenceStop(0., 10., 'L5_pyramidal')], 'no spike', 15.),
+            ([FiringRateStop('L2_basket', rate_max=1., window=10.)],
+             'firing rate', 25.)):
+        _, _, dpls, _, _ = next(simulate_sweep(params, [dict()],
+                                               stop_conditions=conditions,
+                                               stop_interval=5.))
+        assert reason in dpls[0].stop_reason
+        assert abs(dpls[0].t[-1] - tstop) < params['dt']
+
+    # a condition that is never met does not change the trial
+    conditions = [FiringRateStop('L5_pyramidal', rate_max=1e4, window=10.)]
+    _, _, dpls, _, _ = next(simulate_sweep(params, [dict()],
+                                           stop_conditions=conditions,
+                                           stop_interval=5.))
+    assert dpls[0].stop_reason is None
+    assert_array_equal(dpls[0].dpl['agg'], dpl_ref.dpl['agg'])
+
+    # only the data of the last window are given to the conditions
+    def check_window(times, dpl, spiketimes, spikegids, gid_dict):
+        assert times[-1] - times[0] < 10. + 5.
+        assert np.all(spiketimes > times[-1] - 10. - 5.)
+    check_window.window = 10.
+    _, _, dpls, _, _ = next(simulate_sweep(params, [dict()],
+                                           stop_conditions=[check_window],
+                                           stop_interval=5.))
+    assert dpls[0].stop_reason is None
+
+    stop = dict(conditions=[DipoleStop(1e-3)], interval=5.)
+    with pytest.raises(ValueError, match='cannot be combined'):
+        _simulate_single_trial(net, checkpoint_fname='trial', stop=stop)
+    with pytest.raises(ValueError, match='cannot be combined'):
+        _simulate_single_trial(net, record_dir='records', stop=stop)
+    pytest.raises(ValueError, FiringRateStop, 'L5_pyramidal')
+    pytest.raises(ValueError, DipoleStop, 0.)
@@ -0,0 +1,64 @@
+import os.path as op
+import json
+
+import hnn_core
+from hnn_core import read_params, simulate_dipole, Network
+
+
+def test_timings(tmpdir):
+    """Test the timing of the phases of a simulation."""
+    hnn_core_root = op.join(op.dirname(hnn_core.__file__), '..')
+    params_fname = op.join(hnn_core_root, 'param', 'default.json')
+    params = read_params(params_fname)
+    params.update({'N_pyr_x': 3, 'N_pyr_y': 3, 'tstop': 25.})
+
+    net = Network(params)
+    assert 'create_pext' in net.timings.get_durations()
+    events = list(net.timings.events)
+    simulate_dipole(net, n_trials=2, cache_dir=str(tmpdir))
+    # the phases of the construction of the network are kept
+    assert net.timings.events[:len(events)] == events
+    durations = net.timings.get_durations()
+    for name in ('create_pext', 'gid_assign', 'create_cells',
+                 'parnet_connect', 'state_init', 'finitialize', 'psolve',
+                 'allreduce_dipole', 'aggregate_currents',
+                 'dipole_postprocessing'):
+        assert name in durations
+        assert durations[name] >= 0.
+    # the build is not part of a trial
+    assert 'create_cells' not in net.timings.get_durations(trial=1)
+    assert 'psolve' in net.timings.get_durations(trial=1)
+    assert 'psolve' in repr(net.timings)
+
+    # the memory of each phase and the NEURON objects of the network
+    peak_rss, alloc_peak = net.timings.get_memory()
+    assert peak_rss['psolve'] > 0
+    assert alloc_peak == dict()
+    n_objects = net.timings.n_objects[0]
+    assert n_objects['sections'] > 0
+    assert n_objects['segments'] >= n_objects['sections']
+    assert n_objects['NetCon'] > 0
+    assert n_objects['VecStim'] > 0
+
+    fname = op.join(str(tmpdir), 'trace.json')
+    net.timings.write_trace(fname)
+    with open(fname) as fid:
+        trace = json.load(fid)
+    n_psolve = sum(event['name'] == 'psolve'
+                   for event in trace['traceEvents'])
+    assert n_psolve == 2
+    assert all(event['ph'] == 'X' for event in trace['traceEvents'])
+
+    # the trials read from the cache add no phase
+    n_events = len(net.timings.events)
+    simulate_dipole(net, n_trials=2, cache_dir=str(tmpdir))
+    assert len(net.timings.events) == n_events
+
+    n_events = len(net.timings.events)
+    _, timings = simulate_dipole(net, n_trials=1, trace_memory=True,
+                                 return_timings=True)
+    # the timings of the call are returned and added to net.timings
+    assert net.timings.events[n_events:] == timings.events
+    _, alloc_peak = timings.get_memory(trial=0)
+    assert alloc_peak['psolve'] > 0
+    assert 'create_cells' not in alloc_peak
@@ -0,0 +1,203 @@
+"""Timing and memory of the phases of the simulations."""
+
+import os
+import sys
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _get_peak_rss():
+    """Get the peak resident memory of this process in bytes."""
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # in kilobytes except on macOS
+    if sys.platform != 'darwin':
+        peak_rss *= 1024
+    return peak_rss
+
+
+class Timings(object):
+    """The durations and memory of the phases of the build and simulation.
+
+    Parameters
+    ----------
+    events : list of dict | None
+        The timed phases. If None, there is none.
+    n_objects : list of dict | None
+        The numbers of NEURON objects of each process. If None, there is
+        none.
+
+    Attributes
+    ----------
+    events : list of dict
+        The timed phases with keys 'name', 'start' (the time since the
+        epoch in s), 'duration' (in s), 'rank' (the MPI rank), 'pid' (the
+        process ID), 'trial' (the trial index, or None for the phases
+        of the construction and build of the network), 'peak_rss' (the
+        peak resident memory of the process at the end of the phase in
+        bytes), and 'alloc_current' and 'alloc_peak' (the memory
+        allocated by Python at the end of the phase and its peak during
+        the phase in bytes, None unless tracemalloc is tracing).
+    n_objects : list of dict
+        The numbers of sections, segments, Exp2Syn, NetCon, VecStim and
+        Vector of each process after the network is built, with the keys
+        'rank' and 'pid' of the process.
+    """
+
+    def __init__(self, events=None, n_objects=None):  # noqa: D102
+        if events is None:
+            events = list()
+        if n_objects is None:
+            n_objects = list()
+        self.events = events
+        self.n_objects = n_objects
+
+    def __repr__(self):
+        class_name = self.__class__.__name__
+        durations = self.get_durations()
+        s = ', '.join('%s: %0.3f s' % (name, duration)
+                      for name, duration in durations.items())
+        return '<%s | %s>' % (class_name, s)
+
+    @contextmanager
+    def phase(self, name, trial=None):
+        """Time a phase.
+
+        Parameters
+        ----------
+        name : str
+            The name of the phase.
+        trial : int | None
+            The index of the trial or None if the phase is not part of
+            a trial.
+        """
+        from .parallel import rank
+
+        is_tracing = tracemalloc.is_tracing()
+        if is_tracing:
+            tracemalloc.reset_peak()
+        start = time.time()
+        try:
+            yield
+        finally:
+            duration = time.time() - start
+            alloc_current, alloc_peak = None, None
+            if is_tracing and tracemalloc.is_tracing():
+                alloc_current, alloc_peak = tracemalloc.get_traced_memory()
+            self.events.append(dict(name=name, start=start,
+                                    duration=duration, rank=rank,
+                                    pid=os.getpid(), trial=trial,
+                                    peak_rss=_get_peak_rss(),
+                                    alloc_current=alloc_current,
+                                    alloc_peak=alloc_peak))
+
+    def count_objects(self):
+        """Count the NEURON objects of this process."""
+        from neuron import h
+        from .parallel import rank
+
+        n_objects = dict(rank=rank, pid=os.getpid())
+        n_objects['sections'] = sum(1 for _ in h.allsec())
+        n_objects['segments'] = sum(sect.nseg for sect in h.allsec())
+        for name in ('Exp2Syn', 'NetCon', 'VecStim', 'Vector'):
+            n_objects[name] = len(h.List(name))
+        self.n_objects.append(n_objects)
+
+    def extend(self, timings):
+        """Add the phases timed by another instance of Timings."""
+        self.events.extend(timings.events)
+        self.n_objects.extend(timings.n_objects)
+
+    def get_durations(self, rank=None, trial=None):
+        """Get the total duration of each phase.
+
+        Parameters
+        ----------
+        rank : int | None
+            If not None, only the phases of this rank are summed.
+        trial : int | None
+            If not None, only the phases of this trial are summed.
+
+        Returns
+        -------
+        durations : dict of float
+            The duration of each phase in s, in the order in which the
+            phases were first timed.
+        """
+        durations = dict()
+        for event in self.events:
+            if rank is not None and event['rank'] != rank:
+                continue
+            if trial is not None and event['trial'] != trial:
+                continue
+            durations[event['name']] = (durations.get(event['name'], 0.) +
+                                        event['duration'])
+        return durations
+
+    def get_memory(self, rank=None, trial=None):
+        """Get the largest memory used by each phase.
+
+        Parameters
+        ----------
+        rank : int | None
+            If not None, only the phases of this rank are considered.
+        trial : int | None
+            If not None, only the phases of this trial are considered.
+
+        Returns
+        -------
+        peak_rss : dict of int
+            The peak resident memory of the processes at the end of each
+            phase in bytes. It includes the memory used by the previous
+            phases of the process.
+        alloc_peak : dict of int
+            The peak of the memory allocated by Python during each phase
+            in bytes. Empty unless tracemalloc was tracing.
+        """
+        peak_rss, alloc_peak = dict(), dict()
+        for event in self.events:
+            if rank is not None and event['rank'] != rank:
+                continue
+            if trial is not None and event['trial'] != trial:
+                continue
+            name = event['name']
+            if event.get('peak_rss') is not None:
+                peak_rss[name] = max(peak_rss.get(name, 0),
+                                     event['peak_rss'])
+            if event.get('alloc_peak') is not None:
+                alloc_peak[name] = max(alloc_peak.get(name, 0),
+                                       event['alloc_peak'])
+        return peak_rss, alloc_peak
+
+    def write_trace(self, fname):
+        """Write the phases in the trace event format of Chrome.
+
+        The file can be opened in chrome://tracing or Perfetto. Each
+        process is shown separately with one row per MPI rank.
+
+        Parameters
+        ----------
+        fname : str
+            The name of the JSON file.
+        """
+        trace_events = list()
+        for event in self.events:
+            args = dict(rank=event['rank'])
+            for key in ('trial', 'peak_rss', 'alloc_current', 'alloc_peak'):
+                if event.get(key) is not None:
+                    args[key] = event[key]
+            trace_events.append(dict(
+                name=event['name'], ph='X', pid=event['pid'],
+                tid=event['rank'], ts=event['start'] * 1e6,
+                dur=event['duration'] * 1e6, args=args))
+        with open(fname, 'w') as fid:
+            json.dump(dict(traceEvents=trace_events,
+                           displayTimeUnit='ms'), fid)
@@ -22,6 +22,7 @@ NEURON {
     RANGE m, h, gca, gbar
     RANGE minf, hinf, mtau, htau
     GLOBAL q10, temp, tadj, vmin, vmax, vshift, tshift
+    THREADSAFE : assigned GLOBALs will be per thread
 }
 
 PARAMETER {
@@ -64,6 +65,8 @@ ASSIGNED {
 STATE { m h }
 
 INITIAL {
+    : tadj is per thread and the table lookups of trates do not set it
+    tadj = q10^((celsius - temp - tshift) / 10)
     trates(v+vshift)
     m = minf
     h = hinf
@@ -6,6 +6,8 @@
 
 NEURON {
     SUFFIX dipole
+    : Qtotal must point to a variable of the thread of the section
+    THREADSAFE
     RANGE ri, ia, Q, ztan
     POINTER pv
 
@@ -23,6 +23,7 @@ NEURON {
     RANGE ninf, ntau
     GLOBAL Ra, Rb
     GLOBAL q10, temp, tadj, vmin, vmax, tshift
+    THREADSAFE : assigned GLOBALs will be per thread
 }
 
 UNITS {
@@ -82,6 +83,8 @@ STATE {
 }
 
 INITIAL {
+    : tadj is per thread and the table lookups of trates do not set it
+    tadj = q10^((celsius - temp - tshift) / 10)
     trates(v)
     n = ninf
 }
@@ -2,28 +2,35 @@
 
 NEURON {
     ARTIFICIAL_CELL VecStim
+    RANGE index, etime, restart
+    THREADSAFE
 }
 
 ASSIGNED {
     index
     etime (ms)
     space
+    restart
 }
 
 INITIAL {
     index = 0
+    restart = 0
     element()
     if (index > 0) {
         net_send(etime - t, 1)
     }
 }
 
+: An external event (flag 0) restarts the stream at etime after the
+: vector was changed during the simulation. Incrementing restart before
+: ignores the event that was already scheduled from the old vector.
 NET_RECEIVE (w) {
-    if (flag == 1) {
+    if (flag == 0 || flag == 1 + restart) {
         net_event(t)
         element()
         if (index > 0) {
-            net_send(etime - t, 1)
+            net_send(etime - t, 1 + restart)
         }
     }
 }